@@ -446,6 +446,8 @@ if "last_cache_update" not in st.session_state:
     st.session_state.last_cache_update = None
 if "scan_rejected" not in st.session_state:
     st.session_state.scan_rejected = []
+if "scan_timings" not in st.session_state:
+    st.session_state.scan_timings = None
 
 # Parse symbols helper
 def _parse_symbols(txt: str):
@@ -484,7 +486,23 @@ with st.sidebar:
         if not scan_symbols_sidebar: st.error("List trống")
         else:
             with st.status("Updating...", expanded=True) as status:
-                res = run_bulk_update(scan_symbols_sidebar, days_back=3)
+                # Ưu tiên: mã đang xem + kết quả scan trước (cùng config POSITIONS/WATCHLIST) cập nhật trước
+                from pipeline_manager import stream_bulk_update
+                from update_queue import TIER_NAMES
+                prev = st.session_state.get("scan_results")
+                watch = [st.session_state.current_symbol]
+                if prev is not None and not prev.empty and "Symbol" in prev.columns:
+                    watch += prev["Symbol"].tolist()
+                res, n_done = "", 0
+                for ev in stream_bulk_update(scan_symbols_sidebar, days_back=3, watchlist=watch):
+                    if ev["event"] == "symbol":
+                        n_done += 1
+                        if n_done % 50 == 0:
+                            status.update(label=f"Updating... {n_done}/{len(scan_symbols_sidebar)} mã")
+                    elif ev["event"] == "tier_done":
+                        st.write(f"⚡ {TIER_NAMES.get(ev['tier'], ev['tier'])}: {ev['symbols']} mã sẵn sàng ({ev['elapsed_s']:.1f}s)")
+                    elif ev["event"] == "done":
+                        res = ev["result"]
                 if "Lỗi" not in res:
                     status.update(label="Done!", state="complete", expanded=False)
                     st.session_state.cache_ready = True
@@ -504,6 +522,7 @@ with st.sidebar:
         shortlist_n = st.slider("Top", 50, 100, 100, 10, help="Số lượng mã lọc phase 1")
     with c2:
         auto_send_tele = st.checkbox("Tele", value=False)
+        live_bars_mode = st.checkbox("Live", value=False, help="Trong phiên: vá nến hôm nay từ 1 request bảng giá trước khi scan")
 
     start_disabled = not st.session_state.get("cache_ready", False)
     # Nút Scan
@@ -548,12 +567,17 @@ with f4:
 if start_scan:
     st.session_state.scan_results = None
     st.session_state.scan_rejected = []
+    st.session_state.scan_timings = None
 
     scan_symbols = _parse_symbols(st.session_state.scan_symbols_text)
 
     with st.status("🔎 Scanning 2-phase (D1 → 1H/15m)...", expanded=True) as status:
         try:
-            results, rejected = scan_universe_two_phase(
+            if live_bars_mode:
+                from live_bars import patch_live_bars
+                live = patch_live_bars(scan_symbols)
+                st.write(f"📡 Live bars: {live['symbols']} mã (bảng giá {live['board_s']:.2f}s)")
+            results, rejected, timings = scan_universe_two_phase(
                 scan_symbols,
                 days=60,
                 ema_span=50,
@@ -563,8 +587,10 @@ if start_scan:
                 shortlist_n=shortlist_n,
                 max_workers_phase1=16,
                 max_workers_phase2=10,
+                return_timings=True,
             )
             st.session_state.scan_rejected = rejected
+            st.session_state.scan_timings = timings
 
             if results:
                 df_res = pd.DataFrame(results)
@@ -731,6 +757,31 @@ if st.session_state.get("scan_rejected"):
         st.dataframe(pd.DataFrame(st.session_state.scan_rejected, columns=["Symbol","Reason"]),
                      hide_index=True, width='stretch')
 
+# Timing log (stage nào ngốn thời gian: đọc cache / LTF load / SMC / scoring)
+_timings = st.session_state.get("scan_timings")
+if _timings:
+    with st.expander(
+        f"⏱️ Timing [{_timings['backend']}] {_timings['total_s']:.2f}s "
+        f"(P1 {_timings['phase1_s']:.2f}s, load {_timings['load_s']:.2f}s | P2 {_timings['phase2_s']:.2f}s)",
+        expanded=False,
+    ):
+        df_st = pd.DataFrame([
+            {"Stage": name, "Calls": s["count"], "Total (s)": round(s["total_s"], 3),
+             "Avg (ms)": round(s["total_s"] / max(s["count"], 1) * 1000, 2), "Max (ms)": round(s["max_s"] * 1000, 2)}
+            for name, s in _timings["stages"].items()
+        ])
+        if not df_st.empty:
+            st.dataframe(df_st.sort_values("Total (s)", ascending=False), hide_index=True, width='stretch')
+        if _timings.get("counters"):
+            st.caption(" | ".join(f"{k}: {v}" for k, v in _timings["counters"].items()))
+        if _timings.get("per_symbol"):
+            df_sym = pd.DataFrame([
+                {"Symbol": sym, "Total (s)": round(v["total_s"], 3),
+                 **{k: round(x, 3) for k, x in v["stages"].items() if k.startswith(("scan.", "ltf."))}}
+                for sym, v in _timings["per_symbol"].items()
+            ]).fillna(0.0)
+            st.dataframe(df_sym.sort_values("Total (s)", ascending=False), hide_index=True, width='stretch')
+
 
 st.markdown("---")
 
@@ -0,0 +1,288 @@
+# backfill.py - BACKFILL LỊCH SỬ CẢ UNIVERSE (CHIA KHÚC THEO countBack, CHECKPOINT, CHẠY TIẾP)
+"""Resumable full-history backfill for the OHLCV store.
+
+The history of every symbol is split into date windows small enough that one
+gap-chart request stays under MAX_COUNT_BACK bars per symbol (VCI computes
+``countBack`` as business days x BARS_PER_DAY, every minute timeframe being
+fetched as 1m bars). A work unit is (timeframe, window, up to ``batch_size``
+symbols):
+
+- one VCI batch request per unit through FetchEngine (per-source rate limit +
+  adaptive concurrency), symbols missing from the batch fall back to one
+  request each via ROUTER (tcbs/vnd/vci, health-ranked),
+- rows are written with ``mode="upsert"``: windows finish out of order, so an
+  older window must not be dropped as "already covered",
+- each finished unit appends one line to a JSONL journal
+  (``data_cache/backfill/{name}.jsonl``): timeframe, window and the symbols
+  that are done (with or without data). Symbols whose every source raised
+  are not journaled and are retried on the next pass / next run.
+
+Windows sit on a fixed business-day grid counted from GRID_EPOCH (not from
+``start``, which moves with ``end - days``), so a re-run - even on a later
+day - finds the same window keys, skips every journaled (timeframe, window,
+symbol) and only the newest window, still open at ``end``, changes::
+
+    python backfill.py --days-1d 1825 --days-15m 180      # Ctrl+C, chạy lại -> làm tiếp
+"""
+import os
+import json
+import time
+import asyncio
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from config import now_vn
+from fetch_engine import FetchEngine, run_sync
+from source_router import ROUTER
+from resample import DERIVED_TF, derive_timeframes
+from ohlcv_store import write_bars_bulk, clean_symbol, normalize_tf, compact_store
+from pipeline_manager import HAS_PIPELINE, CACHE_DIR, VCI_BATCH_SIZE, AppCacheFetcher
+
+MAX_COUNT_BACK = 5000  # nến / mã / request (giữ response vừa phải, dưới giới hạn của nguồn)
+# Số nến / ngày làm việc theo cách vci tính countBack (15m/30m tải dạng nến 1m rồi resample)
+BARS_PER_DAY = {"1D": 1, "1H": 6.5, "15m": 390, "30m": 390, "1m": 390}
+DEFAULT_DAYS = {"1D": 365 * 5, "15m": 180}
+JOURNAL_DIR = os.path.join(CACHE_DIR, "backfill")
+MAX_PASSES = 2  # lượt chạy lại trong cùng 1 lần gọi cho mã lỗi
+GRID_EPOCH = np.datetime64("2000-01-03")  # thứ Hai; mốc cố định của lưới khúc (key journal không đổi theo ngày chạy)
+
+
+def plan_windows(start, end, timeframe: str, max_count_back: int = MAX_COUNT_BACK) -> list:
+    """
+    [start, end] -> list (from, to) 'YYYY-MM-DD', mỗi khúc <= max_count_back nến / mã.
+    Khúc nằm trên lưới ngày làm việc cố định (GRID_EPOCH, bước span ngày): khúc đầu có thể bắt đầu trước
+    start, khúc cuối cắt tại end - cùng 1 khúc luôn ra cùng (from, to) dù start/end đổi.
+    """
+    tf = normalize_tf(timeframe)
+    first = np.busday_offset(np.datetime64(pd.Timestamp(start).date()), 0, roll="forward")
+    last = np.busday_offset(np.datetime64(pd.Timestamp(end).date()), 0, roll="backward")
+    if first > last:
+        return []
+    # vci: countBack = số ngày làm việc trong [from, to + 1 ngày] x BARS_PER_DAY + 1
+    span = max(1, int((max_count_back - 1) / BARS_PER_DAY.get(tf, 1)) - 1)
+    k0 = int(np.busday_count(GRID_EPOCH, first)) // span
+    k1 = int(np.busday_count(GRID_EPOCH, last)) // span
+    return [
+        (str(np.busday_offset(GRID_EPOCH, k * span)), str(min(np.busday_offset(GRID_EPOCH, (k + 1) * span - 1), last)))
+        for k in range(k0, k1 + 1)
+    ]
+
+
+class BackfillJournal:
+    """Checkpoint append-only: 1 dòng JSON / unit xong. Dòng cuối ghi dở (crash) bị bỏ qua khi đọc."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.done = {}  # (tf, from, to) -> set(symbol)
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        continue
+                    key = (rec["tf"], rec["from"], rec["to"])
+                    self.done.setdefault(key, set()).update(rec.get("symbols", []))
+
+    def pending(self, tf: str, frm: str, to: str, symbols) -> list:
+        done = self.done.get((tf, frm, to), ())
+        return [s for s in symbols if s not in done]
+
+    def record(self, tf: str, frm: str, to: str, symbols, rows: int, empty=(), seconds: float = 0.0):
+        if not symbols:
+            return
+        rec = {"tf": tf, "from": frm, "to": to, "symbols": sorted(symbols), "empty": sorted(empty),
+               "rows": int(rows), "s": round(seconds, 3), "ts": round(time.time(), 3)}
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(rec, separators=(",", ":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.done.setdefault((tf, frm, to), set()).update(symbols)
+
+    def reset(self):
+        self.done.clear()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class Backfill:
+    def __init__(self, symbols, timeframes=("1D", "15m"), days: dict = None, start: str = None, end: str = None,
+                 name: str = "universe", max_count_back: int = MAX_COUNT_BACK, batch_size: int = VCI_BATCH_SIZE,
+                 engine: FetchEngine = None, fetcher=None, journal_dir: str = None, root: str = None):
+        self.symbols = sorted({clean_symbol(s) for s in symbols if clean_symbol(s)})
+        self.timeframes = [normalize_tf(tf) for tf in timeframes]
+        self.days = {**DEFAULT_DAYS, **(days or {})}
+        today = now_vn().date()
+        self.end = end or today.strftime("%Y-%m-%d")
+        self.start = start
+        self.max_count_back = int(max_count_back)
+        self.batch_size = max(1, int(batch_size))
+        self.engine = engine or FetchEngine(max_threads=16)
+        self.fetcher = fetcher or AppCacheFetcher()
+        self.root = root
+        self.journal = BackfillJournal(os.path.join(journal_dir or JOURNAL_DIR, f"{name}.jsonl"))
+        self.stats = {"units": 0, "rows": 0, "symbol_windows": 0, "empty": 0, "failed": 0, "batch_errors": 0}
+
+    def _start_for(self, tf: str) -> str:
+        if self.start:
+            return self.start
+        return (pd.Timestamp(self.end) - pd.Timedelta(days=self.days.get(tf, 365))).strftime("%Y-%m-%d")
+
+    def plan(self) -> list:
+        """Unit còn phải làm: (tf, from, to, [symbols]); khúc mới nhất trước (dữ liệu gần dùng được sớm)."""
+        units = []
+        for tf in self.timeframes:
+            for frm, to in reversed(plan_windows(self._start_for(tf), self.end, tf, self.max_count_back)):
+                todo = self.journal.pending(tf, frm, to, self.symbols)
+                for i in range(0, len(todo), self.batch_size):
+                    units.append((tf, frm, to, todo[i:i + self.batch_size]))
+        return units
+
+    async def _one(self, sym: str, kwargs: dict):
+        """1 mã qua ROUTER. Return (df | None, failed): failed = mọi nguồn đã thử đều raise."""
+        tried, errors = [], []
+
+        async def _via(src, on_start):
+            tried.append(src)
+            try:
+                return await self.engine.call(src, self.fetcher._vn_call_source, sym, src, on_start=on_start, **kwargs)
+            except Exception as e:
+                errors.append(e)
+                raise
+
+        _, df = await ROUTER.acall(f"history:{kwargs['interval']}", self.fetcher.SOURCES, _via)
+        return df, df is None and len(errors) == len(tried)
+
+    async def _unit(self, tf: str, frm: str, to: str, syms: list) -> int:
+        kwargs = {"start": frm, "end": to, "interval": tf}
+        t0 = time.perf_counter()
+        try:
+            frames = await self.engine.call("vci", self.fetcher._vn_call_batch, syms, chunk_size=len(syms), **kwargs)
+        except Exception as e:
+            self.stats["batch_errors"] += 1
+            print(f"   ⚠️ [{tf}] {frm}..{to} batch {syms[0]}..{syms[-1]} lỗi: {e} -> tải từng mã")
+            frames = {}
+        frames = {clean_symbol(k): v for k, v in (frames or {}).items()}
+
+        empty, failed = [], []
+        for sym in [s for s in syms if s not in frames]:
+            df, err = await self._one(sym, kwargs)
+            if df is not None and not df.empty:
+                frames[sym] = df
+            elif err:
+                failed.append(sym)
+            else:
+                empty.append(sym)  # nguồn trả rỗng: chưa niêm yết / ngừng GD trong khúc này
+
+        rows = 0
+        if frames:
+            try:
+                rows = await self.engine.offload(write_bars_bulk, frames, tf, root=self.root, mode="upsert")
+            except Exception as e:
+                print(f"   ❌ [{tf}] {frm}..{to} ghi store lỗi: {e}")
+                self.stats["failed"] += len(syms)
+                return 0
+        done = [s for s in syms if s not in failed]
+        self.journal.record(tf, frm, to, done, rows, empty=empty, seconds=time.perf_counter() - t0)
+        self.stats["units"] += 1
+        self.stats["rows"] += rows
+        self.stats["symbol_windows"] += len(done)
+        self.stats["empty"] += len(empty)
+        self.stats["failed"] += len(failed)
+        return rows
+
+    async def _run_pass(self, units: list, t_start: float):
+        total = len(units)
+        every = max(1, total // 20)
+        finished = 0
+
+        async def _tracked(unit):
+            nonlocal finished
+            await self._unit(*unit)
+            finished += 1
+            if finished % every == 0 or finished == total:
+                el = time.perf_counter() - t_start
+                rate = self.stats["rows"] / el if el > 0 else 0.0
+                eta = el / finished * (total - finished)
+                print(f"   ⏳ {finished}/{total} unit | {self.stats['rows']:,} nến | {rate:,.0f} nến/s | ETA {eta:,.0f}s")
+
+        await asyncio.gather(*(_tracked(u) for u in units))
+
+    def run(self, fresh: bool = False) -> dict:
+        if fresh:
+            self.journal.reset()
+        t0 = time.perf_counter()
+        planned = 0
+        for n in range(MAX_PASSES):
+            units = self.plan()
+            if not units:
+                break
+            if n == 0:
+                planned = len(units)
+                n_windows = len({u[:3] for u in units})
+                print(f"🧾 Backfill {len(self.symbols)} mã x {self.timeframes}: {planned} unit / {n_windows} khúc "
+                      f"(countBack <= {self.max_count_back}, journal {self.journal.path})")
+            else:
+                print(f"🔁 Lượt {n + 1}: {len(units)} unit còn lỗi")
+            self.stats["failed"] = 0
+            run_sync(self._run_pass(units, t0))
+
+        touched = [tf for tf in DERIVED_TF if DERIVED_TF[tf] in self.timeframes]
+        derived = derive_timeframes(self.symbols, touched, root=self.root) if touched and self.stats["rows"] else {}
+        for tf in self.timeframes + touched:
+            compact_store(tf, root=self.root)
+
+        elapsed = time.perf_counter() - t0
+        report = {
+            **self.stats,
+            "planned_units": planned,
+            "remaining_units": len(self.plan()),
+            "elapsed_s": round(elapsed, 1),
+            "rows_per_s": round(self.stats["rows"] / elapsed, 1) if elapsed > 0 else 0.0,
+            "units_per_min": round(self.stats["units"] / elapsed * 60, 1) if elapsed > 0 else 0.0,
+            "derived": derived,
+            "engine": self.engine.stats(),
+        }
+        return report
+
+
+def run_backfill(symbols, timeframes=("1D", "15m"), days: dict = None, start: str = None, name: str = "universe",
+                 fresh: bool = False, **kwargs) -> dict:
+    """Backfill có checkpoint; gọi lại với cùng `name` sẽ làm tiếp phần còn thiếu."""
+    if not HAS_PIPELINE:
+        print("⚠️ Lỗi: Chưa cài đặt thư viện 'vnstock_data'.")
+        return {}
+    job = Backfill(symbols, timeframes=timeframes, days=days, start=start, name=name, **kwargs)
+    report = job.run(fresh=fresh)
+    print(f"✅ Backfill: {report['rows']:,} nến / {report['elapsed_s']}s ({report['rows_per_s']:,.0f} nến/s, "
+          f"{report['units_per_min']} unit/phút), rỗng {report['empty']}, lỗi {report['failed']}, "
+          f"còn {report['remaining_units']} unit")
+    print(f"🧭 Source router: {ROUTER.snapshot()}")
+    return report
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Backfill lịch sử OHLCV cho universe (chạy lại = làm tiếp)")
+    ap.add_argument("--symbols", nargs="*", help="mặc định: VNALLSHARE + VNINDEX")
+    ap.add_argument("--timeframes", nargs="+", default=["1D", "15m"])
+    ap.add_argument("--days-1d", type=int, default=DEFAULT_DAYS["1D"])
+    ap.add_argument("--days-15m", type=int, default=DEFAULT_DAYS["15m"])
+    ap.add_argument("--start", default=None, help="YYYY-MM-DD, áp cho mọi khung (bỏ qua --days-*)")
+    ap.add_argument("--name", default="universe", help="tên journal (data_cache/backfill/{name}.jsonl)")
+    ap.add_argument("--max-count-back", type=int, default=MAX_COUNT_BACK)
+    ap.add_argument("--fresh", action="store_true", help="xoá journal, làm lại từ đầu")
+    args = ap.parse_args(argv)
+
+    symbols = args.symbols
+    if not symbols:
+        from universe import get_vnallshare_universe
+        symbols = sorted(set(get_vnallshare_universe(days=20)) | {"VNINDEX"})
+    run_backfill(symbols, timeframes=args.timeframes, days={"1D": args.days_1d, "15m": args.days_15m},
+                 start=args.start, name=args.name, fresh=args.fresh, max_count_back=args.max_count_back)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# bench_decode.py - BENCHMARK GIẢI MÃ JSON OHLC (PAYLOAD GAP-CHART GIẢ LẬP)
+"""Offline decode benchmark: JSON body -> OHLCV DataFrame, no network.
+
+Builds a synthetic VCI gap-chart body (parallel arrays t/o/h/l/c/v) and times
+each step per 1,000 bars:
+
+- JSON parse: stdlib ``json`` vs ``orjson`` (when installed),
+- ``ohlc_to_df``: DataFrame path (FAST_DECODE=False) vs NumPy column path,
+
+and checks that both paths return identical frames::
+
+    python bench_decode.py --bars 5000 --repeat 50
+"""
+import json
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from vnstock_data.core.utils import transform
+from vnstock_data.explorer.vnd.const import _OHLC_MAP, _OHLC_DTYPE
+
+RESAMPLE_MAP = {"15m": "15min", "30m": "30min", "1H": "1h", "1D": "1D"}
+STEP_S = {"1D": 86400, "1H": 3600, "1m": 60}
+
+
+def make_body(n_bars: int, interval: str = "1D", seed: int = 7) -> bytes:
+    """Body JSON giống gap-chart VCI: t là chuỗi epoch giây, giá VND, volume nguyên."""
+    rng = np.random.default_rng(seed)
+    close = np.round(25000 * np.exp(np.cumsum(rng.normal(0, 0.02, n_bars))), -1)
+    t0 = 1_600_000_000 - 1_600_000_000 % 86400 + 2 * 3600  # 09:00 giờ VN
+    payload = [{
+        "symbol": "FPT",
+        "t": [str(t0 + STEP_S[interval] * i) for i in range(n_bars)],
+        "o": (close * (1 + rng.normal(0, 0.005, n_bars))).round(-1).tolist(),
+        "h": (close * 1.01).round(-1).tolist(),
+        "l": (close * 0.99).round(-1).tolist(),
+        "c": close.tolist(),
+        "v": rng.integers(0, 5_000_000, n_bars).tolist(),
+        "accumulatedVolume": [0] * n_bars,
+    }]
+    return json.dumps(payload).encode("utf-8")
+
+
+def _per_1000(fn, n_bars: int, repeat: int) -> float:
+    fn()
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t0) / repeat * 1e3 * 1000 / n_bars
+
+
+def _decode(payload: dict, interval: str, fast: bool) -> pd.DataFrame:
+    transform.FAST_DECODE = fast
+    try:
+        return transform.ohlc_to_df(payload, _OHLC_MAP, _OHLC_DTYPE, "stock", "FPT", "VCI",
+                                    interval=interval, resample_map=RESAMPLE_MAP)
+    finally:
+        transform.FAST_DECODE = True
+
+
+def run_benchmark(n_bars: int = 1000, repeat: int = 30, intervals=("1D", "1H")) -> list:
+    try:
+        import orjson
+    except ImportError:
+        orjson = None
+
+    rows = []
+    for interval in intervals:
+        body = make_body(n_bars, interval)
+        payload = json.loads(body)[0]
+        slow, fast = _decode(payload, interval, False), _decode(payload, interval, True)
+        pd.testing.assert_frame_equal(slow, fast, check_exact=True)  # 2 đường phải ra frame y hệt
+
+        rows.append((interval, "json.loads", _per_1000(lambda: json.loads(body), n_bars, repeat)))
+        if orjson is not None:
+            rows.append((interval, "orjson.loads", _per_1000(lambda: orjson.loads(body), n_bars, repeat)))
+        rows.append((interval, "ohlc_to_df (DataFrame)", _per_1000(lambda: _decode(payload, interval, False), n_bars, repeat)))
+        rows.append((interval, "ohlc_to_df (NumPy)", _per_1000(lambda: _decode(payload, interval, True), n_bars, repeat)))
+    return rows
+
+
+def print_report(rows: list, n_bars: int):
+    print(f"\n============ DECODE BENCHMARK ({n_bars} nến / payload) ============")
+    print(f"{'interval':<10}{'step':<28}{'ms / 1000 nến':>16}")
+    for interval, step, ms in rows:
+        print(f"{interval:<10}{step:<28}{ms:>16.3f}")
+    print("=" * 54)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark giải mã JSON OHLC -> DataFrame (offline)")
+    ap.add_argument("--bars", type=int, default=1000, help="số nến / payload")
+    ap.add_argument("--repeat", type=int, default=30)
+    ap.add_argument("--interval", action="append", choices=list(STEP_S), help="mặc định 1D + 1H")
+    args = ap.parse_args(argv)
+    print_report(run_benchmark(args.bars, args.repeat, tuple(args.interval or ("1D", "1H"))), args.bars)
+
+
+if __name__ == "__main__":
+    main()
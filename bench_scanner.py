@@ -0,0 +1,285 @@
+# bench_scanner.py - BENCHMARK SCANNER OFFLINE (UNIVERSE OHLCV GIẢ LẬP)
+"""Offline scan benchmark: no network, deterministic data.
+
+Generates a synthetic D1/1H/15m universe for N symbols into a temporary
+``data_cache`` (via DATA_CACHE_DIR), then times every scan stage and prints
+p50/p95 per call plus throughput::
+
+    python bench_scanner.py --symbols 400 --repeat 3 --executor threads
+
+Same seed -> same bars -> comparable numbers between commits.
+"""
+import os
+import sys
+import time
+import shutil
+import inspect
+import argparse
+import tempfile
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+# Phiên HOSE: sáng 9:00-11:30, chiều 13:00-14:45 (ATC tính vào nến cuối)
+H1_SLOTS = ["09:00", "10:00", "11:00", "13:00", "14:00"]
+M15_SLOTS = [f"{h:02d}:{m:02d}" for h in (9, 10) for m in (0, 15, 30, 45)] + ["11:00", "11:15"] + \
+            [f"{h:02d}:{m:02d}" for h in (13, 14) for m in (0, 15, 30, 45)]
+
+
+# =========================
+# SYNTHETIC DATA
+# =========================
+def _random_walk(rng, n: int, start: float, vol: float) -> pd.DataFrame:
+    """OHLCV random walk (log-return), giá luôn dương, có ngày gap để sinh FVG/OB."""
+    rets = rng.normal(0.0, vol, n)
+    rets[rng.random(n) < 0.04] *= 4.0  # vài phiên biến động mạnh
+    close = start * np.exp(np.cumsum(rets))
+    open_ = np.concatenate([[start], close[:-1]]) * np.exp(rng.normal(0.0, vol / 3, n))
+    spread = np.abs(rng.normal(0.0, vol, n)) * close
+    high = np.maximum(open_, close) + spread
+    low = np.maximum(np.minimum(open_, close) - np.abs(rng.normal(0.0, vol, n)) * close, 0.01)
+    return pd.DataFrame({"Open": open_, "High": high, "Low": low, "Close": close})
+
+
+def _intraday_index(days, slots) -> pd.DatetimeIndex:
+    stamps = [f"{d:%Y-%m-%d} {s}" for d in days for s in slots]
+    return pd.DatetimeIndex(pd.to_datetime(stamps), name="Date")
+
+
+def make_symbol_frames(k: int, seed: int, bars_d1: int, days_1h: int, days_15m: int, end_day) -> dict:
+    """3 frame (1D/1H/15m) cho mã thứ k; cùng (k, seed) -> cùng dữ liệu."""
+    rng = np.random.default_rng([seed, k])
+    start = float(rng.uniform(12, 120))
+    liquid = k % 10 != 0  # ~10% mã thanh khoản thấp để có nhánh reject
+    base_vol = float(rng.uniform(3e5, 3e6)) if liquid else float(rng.uniform(5e3, 5e4))
+
+    sessions = pd.bdate_range(end=end_day, periods=bars_d1)
+    d1 = _random_walk(rng, len(sessions), start, 0.02)
+    d1["Volume"] = np.round(base_vol * rng.lognormal(0.0, 0.5, len(d1)))
+    d1.index = pd.DatetimeIndex(sessions, name="Date")
+
+    out = {"1D": d1}
+    last_close = float(d1["Close"].iat[-1])
+    for tf, days, slots, vol in (("1H", days_1h, H1_SLOTS, 0.008), ("15m", days_15m, M15_SLOTS, 0.004)):
+        idx = _intraday_index(sessions[-days:], slots)
+        f = _random_walk(rng, len(idx), last_close, vol)
+        f["Volume"] = np.round(base_vol / len(slots) * rng.lognormal(0.0, 0.6, len(f)))
+        f.index = idx
+        out[tf] = f
+    return out
+
+
+def build_universe(cache_dir: str, n_symbols: int, seed: int = 7, bars_d1: int = 400,
+                   days_1h: int = 60, days_15m: int = 20) -> list:
+    """Ghi universe giả lập vào store của `cache_dir`. Return danh sách mã."""
+    from config import now_vn
+    from ohlcv_store import write_bars_bulk, compact_store
+
+    root = os.path.join(cache_dir, "store")
+    end_day = pd.Timestamp(now_vn().date())
+    symbols = [f"BM{k:04d}" for k in range(n_symbols)]
+    by_tf = {"1D": {}, "1H": {}, "15m": {}}
+    for k, sym in enumerate(symbols):
+        for tf, df in make_symbol_frames(k, seed, bars_d1, days_1h, days_15m, end_day).items():
+            by_tf[tf][sym] = df
+    for tf, frames in by_tf.items():
+        write_bars_bulk(frames, tf, root=root, mode="upsert")
+        compact_store(tf, root=root)
+    return symbols
+
+
+# =========================
+# TIMING
+# =========================
+class StageTimer:
+    """Gom thời gian từng lần gọi theo stage -> p50/p95/total."""
+
+    def __init__(self):
+        self.samples = {}
+
+    def time(self, stage: str, fn, *args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.samples.setdefault(stage, []).append(time.perf_counter() - t0)
+
+    def rows(self, n_symbols: int) -> list:
+        rows = []
+        for stage, xs in self.samples.items():
+            arr = np.asarray(xs) * 1000.0
+            total = float(arr.sum()) / 1000.0
+            # scan_universe_two_phase: 1 call = cả universe
+            n_done = len(xs) * (n_symbols if stage == "scan_universe_two_phase" else 1)
+            rows.append({
+                "stage": stage,
+                "calls": len(xs),
+                "p50_ms": float(np.percentile(arr, 50)),
+                "p95_ms": float(np.percentile(arr, 95)),
+                "total_s": total,
+                "sym_per_s": n_done / total if total > 0 else float("inf"),
+            })
+        return rows
+
+
+def _entry_models():
+    import smc_core
+    return sorted(
+        (name, fn) for name, fn in inspect.getmembers(smc_core, inspect.isfunction)
+        if name.startswith("entry_") and fn.__module__ == "smc_core"
+    )
+
+
+def _call_entry(fn, df, df_pair, df_ltf, ctx):
+    params = list(inspect.signature(fn).parameters)
+    if "df_pair" in params:
+        return fn(df, df_pair, ctx=ctx)
+    if "df_ltf" in params:
+        return fn(df, df_ltf, ctx=ctx)
+    return fn(df, ctx=ctx)
+
+
+def profile_memory(scanner, symbols, days: int = 250, ema_span: int = 50) -> list:
+    """
+    Peak allocation (tracemalloc) của từng scan_symbol, chạy 2 lần: copy-free và copy cũ.
+    Return list[dict] (1 dòng / mode) với p50/p95/max KB trên mỗi mã.
+    """
+    rows = []
+    saved = scanner.SCAN_COPY_FREE, scanner.load_data_with_cache
+    # Nạp trước mọi frame -> chỉ đo phần scan (đọc store/st.cache_data không tính vào peak)
+    loaded = {}
+
+    def _preloaded(symbol, days_to_load=60, timeframe="1D", **kwargs):
+        key = (symbol, days_to_load, timeframe)
+        if key not in loaded:
+            loaded[key] = saved[1](symbol, days_to_load=days_to_load, timeframe=timeframe, **kwargs)
+        return loaded[key]
+
+    scanner.load_data_with_cache = _preloaded
+    try:
+        for copy_free in (False, True):
+            scanner.SCAN_COPY_FREE = copy_free
+            for sym in symbols:  # warm: nạp frame + import lười
+                scanner.scan_symbol(sym, days, ema_span)
+            peaks = []
+            tracemalloc.start()
+            for sym in symbols:
+                base = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+                scanner.scan_symbol(sym, days, ema_span)
+                peaks.append((tracemalloc.get_traced_memory()[1] - base) / 1024.0)
+            tracemalloc.stop()
+            arr = np.asarray(peaks)
+            rows.append({
+                "mode": "copy-free" if copy_free else "copy",
+                "p50_kb": float(np.percentile(arr, 50)),
+                "p95_kb": float(np.percentile(arr, 95)),
+                "max_kb": float(arr.max()),
+            })
+    finally:
+        scanner.SCAN_COPY_FREE, scanner.load_data_with_cache = saved
+    return rows
+
+
+def print_memory_report(rows: list):
+    print(f"\n{'scan_symbol peak alloc':<28}{'p50 KB':>10}{'p95 KB':>10}{'max KB':>10}")
+    for r in rows:
+        print(f"{r['mode']:<28}{r['p50_kb']:>10.1f}{r['p95_kb']:>10.1f}{r['max_kb']:>10.1f}")
+    if len(rows) == 2 and rows[0]["p50_kb"] > 0:
+        print(f"copy-free / copy (p50): {rows[1]['p50_kb'] / rows[0]['p50_kb']:.2f}x")
+
+
+def _clear_streamlit_cache():
+    try:
+        import streamlit as st
+        st.cache_data.clear()
+    except Exception:
+        pass
+
+
+def run_benchmark(n_symbols: int = 100, seed: int = 7, repeat: int = 1, executor: str = "threads",
+                  shortlist_n: int = 60, keep: bool = False, cache_dir: str = None, memory: bool = False) -> list:
+    """
+    Dựng cache giả lập rồi đo từng stage. Return list[dict] (1 dòng / stage).
+    Phải gọi trước khi import data/scanner ở process hiện tại (DATA_CACHE_DIR đọc lúc import).
+    """
+    if any(m in sys.modules for m in ("ohlcv_store", "data", "scanner")):
+        raise RuntimeError("run_benchmark phải chạy trước khi import ohlcv_store/data/scanner (cần DATA_CACHE_DIR)")
+
+    tmp = cache_dir or tempfile.mkdtemp(prefix="smc_bench_")
+    os.environ["DATA_CACHE_DIR"] = tmp
+    try:
+        t0 = time.perf_counter()
+        symbols = build_universe(tmp, n_symbols, seed=seed)
+        print(f"📦 Synthetic cache: {len(symbols)} mã x 1D/1H/15m -> {tmp} ({time.perf_counter() - t0:.1f}s)")
+
+        import data
+        # Offline: không bao giờ gọi API; cache thiếu nến thì dùng đúng những gì đang có
+        data.fetch_stock_data = lambda *a, **k: pd.DataFrame()
+        import smc_core
+        import scanner
+
+        timer = StageTimer()
+        models = _entry_models()
+        for _ in range(max(1, int(repeat))):
+            _clear_streamlit_cache()
+            frames, ltf_frames = {}, {}
+            for sym in symbols:
+                frames[sym] = timer.time("read_cache_fast", data.read_cache_fast, sym, timeframe="1D", tail_n=260)
+                ltf_frames[sym] = timer.time("read_cache_fast[1H]", data.read_cache_fast, sym, timeframe="1H", tail_n=100)
+
+            for k, sym in enumerate(symbols):
+                df = frames[sym]
+                if df is None or df.empty:
+                    continue
+                dfs = timer.time("ensure_smc_columns", smc_core.ensure_smc_columns, df)
+                pair = frames[symbols[(k + 1) % len(symbols)]]
+                for name, fn in models:
+                    # context mới cho mỗi model -> đo chi phí riêng của model đó
+                    timer.time(name, _call_entry, fn, dfs, pair, ltf_frames[sym], smc_core.SMCContext(dfs))
+                timer.time("detect_entry_models", smc_core.detect_entry_models, dfs, ctx=smc_core.SMCContext(dfs))
+                timer.time("_phase1_d1_candidate", scanner._phase1_d1_candidate, sym, 60, 50, df)
+
+            for sym in symbols:
+                timer.time("scan_symbol", scanner.scan_symbol, sym, 60, 50)
+
+            _clear_streamlit_cache()
+            timer.time("scan_universe_two_phase", scanner.scan_universe_two_phase, symbols,
+                       days=60, shortlist_n=shortlist_n, executor=executor)
+
+        rows = timer.rows(len(symbols))
+        print_report(rows, len(symbols), executor)
+        if memory:
+            print_memory_report(profile_memory(scanner, symbols))
+        return rows
+    finally:
+        if not keep and cache_dir is None:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+def print_report(rows: list, n_symbols: int, executor: str):
+    print(f"\n================ SCAN BENCHMARK ({n_symbols} mã, executor={executor}) ================")
+    print(f"{'stage':<28}{'calls':>7}{'p50 ms':>10}{'p95 ms':>10}{'total s':>10}{'mã/s':>10}")
+    for r in rows:
+        print(f"{r['stage']:<28}{r['calls']:>7}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['total_s']:>10.2f}{r['sym_per_s']:>10.0f}")
+    print("=" * 75)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Offline scanner benchmark trên universe OHLCV giả lập")
+    ap.add_argument("--symbols", type=int, default=100, help="số mã giả lập")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--repeat", type=int, default=1, help="số vòng đo (p50/p95 gộp mọi vòng)")
+    ap.add_argument("--executor", default="threads", choices=["threads", "processes", "inline"])
+    ap.add_argument("--shortlist", type=int, default=60)
+    ap.add_argument("--cache-dir", default=None, help="dùng thư mục này thay vì temp (giữ lại sau khi chạy)")
+    ap.add_argument("--keep", action="store_true", help="không xoá temp data_cache")
+    ap.add_argument("--memory", action="store_true", help="đo peak allocation/mã của scan_symbol (copy-free vs copy)")
+    args = ap.parse_args(argv)
+    run_benchmark(args.symbols, seed=args.seed, repeat=args.repeat, executor=args.executor,
+                  shortlist_n=args.shortlist, keep=args.keep, cache_dir=args.cache_dir, memory=args.memory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+# bench_stream_sink.py - BENCHMARK SINK CHO MESSAGE WEBSOCKET (DUCKDB / FORWARD), REPLAY, KHÔNG CẦN MẠNG
+"""Replay benchmark for vnstock_pipeline stream sinks: messages/sec per mode.
+
+``--sink duckdb`` feeds the same messages through ``DuckDBProcessor.process`` in
+- row mode (``batch_size=None``: schema check + one INSERT per message),
+- batched mode (``batch_size=N``: per-table buffers, Arrow appends),
+
+then checks that both databases hold identical rows. ``--sink forward`` sends
+them through ``ForwardingProcessor`` to a local stand-in receiver (TCP JSON
+lines and an aiohttp webhook), one message per request vs batches of N, and
+checks that the receiver got every message. Messages come from a
+JSONL file (one parsed message per line, e.g. recorded from WSSClient with a
+small processor that json.dumps each message) or, by default, are synthesised
+in the shape WSSDataParser emits for ``stock`` / ``board`` events::
+
+    python bench_stream_sink.py --messages 50000 --batch-size 5000
+    python bench_stream_sink.py --sink forward --batch-size 500
+    python bench_stream_sink.py --replay data_cache/ws_2026-10-14.jsonl
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+
+SYMBOLS = ["FPT", "VCB", "HPG", "MWG", "SSI", "VNM", "TCB", "ACB", "MSN", "VIC"]
+
+
+def make_messages(n: int, seed: int = 7) -> list:
+    """Message giả lập giống WSSDataParser (90% stock, 10% board; vài message có thêm cột mới)."""
+    rng = random.Random(seed)
+    price = {s: rng.uniform(20_000, 120_000) for s in SYMBOLS}
+    total = dict.fromkeys(SYMBOLS, 0)
+    out = []
+    t0 = 1_760_000_000
+    for i in range(n):
+        sym = rng.choice(SYMBOLS)
+        ts = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(t0 + i // 20))
+        if rng.random() < 0.9:
+            price[sym] = round(price[sym] * (1 + rng.gauss(0, 0.001)), -1)
+            vol = rng.randint(1, 500) * 10
+            total[sym] += vol
+            msg = {"event_type": "stock", "data_type": "stock", "symbol": sym, "stock_id": SYMBOLS.index(sym),
+                   "last_price": price[sym], "last_volume": vol, "total_volume": total[sym],
+                   "change": round(rng.gauss(0, 500), -1), "change_percent": round(rng.gauss(0, 1), 2),
+                   "side": rng.choice(["B", "S", None]), "timestamp": ts}
+            if i % 1000 == 999:
+                msg["open_price"] = price[sym]  # cột xuất hiện muộn -> ALTER TABLE
+        else:
+            msg = {"event_type": "board", "data_type": "board", "symbol": sym, "side": rng.choice(["B", "S"]),
+                   **{f"price_{k}": price[sym] + k * 50 for k in range(1, 4)},
+                   **{f"volume_{k}": rng.randint(1, 999) * 10 for k in range(1, 4)}, "timestamp": ts}
+        out.append(msg)
+    return out
+
+
+def load_messages(path: str) -> list:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+async def _replay(messages: list, db_path: str, batch_size) -> float:
+    from vnstock_pipeline.stream.processors import DuckDBProcessor
+
+    proc = DuckDBProcessor(db_path, batch_size=batch_size)
+    t0 = time.perf_counter()
+    for msg in messages:
+        await proc.process(msg)
+    if batch_size:
+        await proc.flush()
+    elapsed = time.perf_counter() - t0
+    proc.close()
+    return elapsed
+
+
+def _table_rows(db_path: str) -> dict:
+    import duckdb
+
+    con = duckdb.connect(db_path, read_only=True)
+    try:
+        out = {}
+        for (name,) in con.execute("SELECT table_name FROM information_schema.tables ORDER BY 1").fetchall():
+            cols = sorted(c[1] for c in con.execute(f'PRAGMA table_info("{name}")').fetchall())
+            col_sql = ", ".join(f'CAST("{c}" AS VARCHAR)' for c in cols)
+            out[name] = (cols, sorted(con.execute(f'SELECT {col_sql} FROM "{name}"').fetchall(), key=repr))
+        return out
+    finally:
+        con.close()
+
+
+def run_benchmark(messages: list, batch_size: int = 5000) -> list:
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        dbs = {}
+        for label, bs in (("row INSERT", None), (f"batch {batch_size} (Arrow)", batch_size)):
+            db = dbs[label] = os.path.join(tmp, f"{bs or 'row'}.duckdb")
+            elapsed = asyncio.run(_replay(messages, db, bs))
+            rows.append((label, elapsed, len(messages) / elapsed))
+        a, b = (_table_rows(db) for db in dbs.values())
+        assert a == b, "2 chế độ ghi ra dữ liệu khác nhau"
+    return rows
+
+
+async def _forward(messages: list, forward_type: str, batch_size: int) -> float:
+    """Gửi qua ForwardingProcessor tới receiver chạy cùng event loop; return số giây tới khi receiver nhận đủ."""
+    from vnstock_pipeline.stream.processors import ForwardingProcessor
+
+    got = [0]
+    done = asyncio.Event()
+
+    def _count(k):
+        got[0] += k
+        if got[0] >= len(messages):
+            done.set()
+
+    if forward_type == "socket":
+        async def on_conn(reader, writer):
+            while True:
+                chunk = await reader.read(1 << 16)
+                if not chunk:
+                    break
+                _count(chunk.count(b"\n"))
+            writer.close()
+
+        server = await asyncio.start_server(on_conn, "127.0.0.1", 0)
+        url = "127.0.0.1:%d" % server.sockets[0].getsockname()[1]
+        stop = server.close
+    else:
+        from aiohttp import web
+
+        async def on_post(request):
+            body = await request.json()
+            _count(len(body) if isinstance(body, list) else 1)
+            return web.Response(text="ok")
+
+        app = web.Application()
+        app.router.add_post("/hook", on_post)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        url = "http://127.0.0.1:%d/hook" % site._server.sockets[0].getsockname()[1]
+        stop = runner.cleanup
+
+    proc = ForwardingProcessor(url, forward_type, batch_size=batch_size, flush_interval=0.05)
+    t0 = time.perf_counter()
+    for msg in messages:
+        await proc.process(msg)
+    await proc.flush(force=True)
+    await asyncio.wait_for(done.wait(), 60)
+    elapsed = time.perf_counter() - t0
+    await proc.aclose()
+    res = stop()
+    if asyncio.iscoroutine(res):
+        await res
+    assert got[0] == len(messages), f"receiver nhận {got[0]}/{len(messages)}"
+    return elapsed
+
+
+def run_forward_benchmark(messages: list, batch_size: int = 500) -> list:
+    rows = []
+    for forward_type in ("socket", "webhook"):
+        for bs in (1, batch_size):
+            elapsed = asyncio.run(_forward(messages, forward_type, bs))
+            rows.append((f"{forward_type} batch={bs}", elapsed, len(messages) / elapsed))
+    return rows
+
+
+def print_report(rows: list, n: int, title: str = "DUCKDB SINK"):
+    print(f"\n============ {title} BENCHMARK ({n} message) ============")
+    print(f"{'mode':<26}{'giây':>10}{'rows/s':>14}")
+    for label, elapsed, rps in rows:
+        print(f"{label:<26}{elapsed:>10.2f}{rps:>14,.0f}")
+    for base, fast in zip(rows[::2], rows[1::2]):
+        print(f"speedup {fast[0]}: x{fast[2] / base[2]:.1f}")
+    print("=" * 50)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark sink stream: từng message vs theo lô (offline)")
+    ap.add_argument("--sink", choices=("duckdb", "forward"), default="duckdb")
+    ap.add_argument("--replay", default=None, help="file JSONL message đã ghi; mặc định: message giả lập")
+    ap.add_argument("--messages", type=int, default=5000, help="số message giả lập")
+    ap.add_argument("--batch-size", type=int, default=None, help="mặc định: 5000 (duckdb), 500 (forward)")
+    args = ap.parse_args(argv)
+    messages = load_messages(args.replay) if args.replay else make_messages(args.messages)
+    if args.sink == "forward":
+        print_report(run_forward_benchmark(messages, args.batch_size or 500), len(messages), "FORWARD SINK")
+    else:
+        print_report(run_benchmark(messages, args.batch_size or 5000), len(messages))
+
+
+if __name__ == "__main__":
+    main()
@@ -44,3 +44,12 @@ TELEGRAM_KILLZONE_ONLY = False
 TELEGRAM_ALERT_SCORE_MIN = 2.5   # bạn chỉnh tuỳ khẩu vị
 KILLZONE_WINDOWS = ["10:45-11:30", "14:10-15:00"]
 
+# --- Ưu tiên cập nhật cache: vị thế đang giữ + watchlist (chuỗi "FPT,HPG,...") ---
+POSITIONS = [s.strip().upper() for s in str(get_config("POSITIONS", "")).split(",") if s.strip()]
+WATCHLIST = [s.strip().upper() for s in str(get_config("WATCHLIST", "")).split(",") if s.strip()]
+
+# --- Scanner executor: "threads" | "processes" | "inline" ---
+SCAN_EXECUTOR = get_config("SCAN_EXECUTOR", "threads")
+
+# --- Scanner copy-free mode: 1 frame làm việc/mã, detector ghi thẳng vào đó (0 = hành vi copy cũ) ---
+SCAN_COPY_FREE = str(get_config("SCAN_COPY_FREE", "1")).strip().lower() not in ("0", "false", "no", "off")
@@ -5,6 +5,23 @@ import logging
 import pandas as pd
 from datetime import datetime, timedelta
 from config import now_vn
+import perf
+from source_router import ROUTER
+from resample import source_tf, derive_timeframes
+from trading_calendar import is_fresh
+from ohlcv_store import (
+    read_bars,
+    read_bars_bulk,
+    write_bars,
+    has_symbol,
+    manifest_entry,
+    symbol_version,
+    store_version,
+    import_legacy_file,
+    legacy_path,
+    clean_symbol,
+    normalize_tf,
+)
 
 # [SPONSOR] Import thư viện cao cấp (nếu có)
 try:
@@ -18,7 +35,7 @@ logging.getLogger('urllib3').setLevel(logging.WARNING)
 
 # --- ĐƯỜNG DẪN DỮ LIỆU ---
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-CACHE_DIR = os.path.join(BASE_DIR, "data_cache")
+CACHE_DIR = os.environ.get("DATA_CACHE_DIR") or os.path.join(BASE_DIR, "data_cache")  # env: chạy trên cache khác (benchmark)
 
 # Tự động tạo folder nếu chưa có (để tránh lỗi path)
 if not os.path.exists(CACHE_DIR):
@@ -60,7 +77,7 @@ def calculate_full_indicators(df):
 # =========================
 @st.cache_data(show_spinner=False)
 def _read_parquet_tail_cached(path: str, mtime: float, tail_n: int) -> pd.DataFrame:
-    """Read parquet quickly and return only the last N rows.
+    """Read a legacy per-symbol parquet quickly and return only the last N rows.
 
     - `mtime` is included to invalidate cache when the file changes.
     - This function is *read-only* and never triggers any API calls.
@@ -87,27 +104,49 @@ def _read_parquet_tail_cached(path: str, mtime: float, tail_n: int) -> pd.DataFr
         return pd.DataFrame()
 
 
+@st.cache_data(show_spinner=False)
+def _read_store_tail_cached(symbol: str, timeframe: str, version: str, tail_n: int) -> pd.DataFrame:
+    """Store read for one symbol; `version` (manifest entry) invalidates the cache."""
+    try:
+        return read_bars(symbol, timeframe, tail_n=tail_n)
+    except Exception:
+        return pd.DataFrame()
+
+
+@st.cache_data(show_spinner=False)
+def _read_store_bulk_cached(symbols: tuple, timeframe: str, version: int, tail_n: int) -> dict:
+    """Store read for many symbols in one dataset scan; `version` = manifest mtime."""
+    try:
+        return read_bars_bulk(list(symbols), timeframe, tail_n=tail_n)
+    except Exception:
+        return {}
+
+
+@perf.timed("data.read_cache")
 def read_cache_fast(symbol: str, timeframe: str = "1D", tail_n: int = 300, end_date=None) -> pd.DataFrame:
-    """Fast path for scanner: only read local parquet cache.
+    """Fast path for scanner: only read local cache (columnar store, legacy parquet fallback).
 
     - Never calls API.
     - Never computes indicators.
     - Returns only tail_n rows (after optional end_date cut).
     """
-    symbol = (symbol or "").strip().upper()
-    symbol_clean = "".join([ch for ch in symbol if ch.isalnum()])
-    tf = (timeframe or "1D").strip()
-    file_path = os.path.join(CACHE_DIR, f"{symbol_clean}_{tf}.parquet")
-
-    if not os.path.exists(file_path):
-        return pd.DataFrame()
+    symbol_clean = clean_symbol(symbol)
+    tf = normalize_tf(timeframe)
 
-    try:
-        mtime = os.path.getmtime(file_path)
-    except Exception:
-        mtime = 0.0
+    df = pd.DataFrame()
+    version = symbol_version(symbol_clean, tf)
+    if version:
+        df = _read_store_tail_cached(symbol_clean, tf, version, int(tail_n) if tail_n else 0)
+    else:
+        file_path = legacy_path(symbol_clean, tf, CACHE_DIR)
+        if not os.path.exists(file_path):
+            return pd.DataFrame()
+        try:
+            mtime = os.path.getmtime(file_path)
+        except Exception:
+            mtime = 0.0
+        df = _read_parquet_tail_cached(file_path, mtime, int(tail_n) if tail_n else 0)
 
-    df = _read_parquet_tail_cached(file_path, mtime, int(tail_n) if tail_n else 0)
     df = _validate_ohlcv_df(df)
     if df is None or df.empty:
         return pd.DataFrame()
@@ -119,6 +158,23 @@ def read_cache_fast(symbol: str, timeframe: str = "1D", tail_n: int = 300, end_d
             pass
     return df
 
+
+@perf.timed("data.read_bulk")
+def read_cache_bulk(symbols, timeframe: str = "1D", tail_n: int = 300) -> dict:
+    """Bulk fast path for Phase 1: {symbol: last tail_n bars} from ONE store scan.
+
+    Symbols not yet in the store fall back to `read_cache_fast` (legacy file).
+    """
+    tf = normalize_tf(timeframe)
+    syms = sorted({clean_symbol(s) for s in (symbols or []) if clean_symbol(s)})
+    out = dict(_read_store_bulk_cached(tuple(syms), tf, store_version(tf), int(tail_n) if tail_n else 0))
+    for s in syms:
+        if s not in out:
+            df = read_cache_fast(s, timeframe=tf, tail_n=tail_n)
+            if df is not None and not df.empty:
+                out[s] = df
+    return out
+
 def normalize_columns(df):
     """Chuẩn hóa tên cột về chuẩn chung"""
     if df is None or df.empty: return df
@@ -139,10 +195,38 @@ def _validate_ohlcv_df(df: pd.DataFrame) -> pd.DataFrame:
     # Kiểm tra Index
     try:
         if not isinstance(df.index, pd.DatetimeIndex):
-            df.index = pd.to_datetime(df.index)
+            # set_axis: frame mới dùng chung dữ liệu, không sửa index của frame caller đang giữ
+            df = df.set_axis(pd.to_datetime(df.index), axis=0)
     except Exception: return pd.DataFrame()
     return df
 
+_INDEX_SYMBOLS = ["VNINDEX", "VN30", "HNX", "HNX30", "UPCOM"]
+VCI_BATCH_SIZE = 50  # số mã / 1 request gap-chart của VCI
+
+def _normalize_history_frame(temp: pd.DataFrame, is_index: bool) -> pd.DataFrame:
+    """Frame từ Quote.history -> OHLCV chuẩn (index Date, giá đơn vị nghìn đồng)."""
+    if temp is None or temp.empty: return pd.DataFrame()
+
+    df_res = normalize_columns(temp)
+    
+    # Xử lý Index Date
+    if "Date" in df_res.columns:
+        df_res["Date"] = pd.to_datetime(df_res["Date"])
+        df_res.set_index("Date", inplace=True)
+    
+    if not isinstance(df_res.index, pd.DatetimeIndex):
+        df_res.index = pd.to_datetime(df_res.index)
+
+    # Xử lý lỗi đơn vị giá (VND thường trả về giá * 1000)
+    if not is_index and "Close" in df_res.columns:
+        try:
+            if df_res["Close"].mean() > 5000: # Giá > 5000 thường là chưa chia 1000
+                for c in ["Open", "High", "Low", "Close"]:
+                    if c in df_res.columns: df_res[c] = df_res[c] / 1000.0
+        except Exception: pass
+
+    return _validate_ohlcv_df(df_res)
+
 def fetch_stock_data(symbol: str, start_str: str, end_str: str, interval: str, mode: str = "history"):
     """Hàm gọi API thực tế (fallback khi không có cache)"""
     symbol = (symbol or "").strip().upper()
@@ -156,45 +240,71 @@ def fetch_stock_data(symbol: str, start_str: str, end_str: str, interval: str, m
     except Exception: return pd.DataFrame()
 
     # Ưu tiên nguồn: TCBS (nhanh) -> VCI (đủ) -> VND (backtest)
+    # (chỉ là thứ tự lúc chưa có số liệu; sau đó ROUTER xếp theo latency/lỗi thực tế)
     sources = ["tcbs", "vci"] 
     if mode == "history": sources = ["vnd", "tcbs", "vci"]
 
-    is_index = symbol in ["VNINDEX", "VN30", "HNX", "HNX30", "UPCOM"]
+    is_index = symbol in _INDEX_SYMBOLS
 
-    for src in sources:
-        try:
-            quote = Quote(source=src, symbol=symbol)
-            temp = quote.history(start=start_str, end=end_str, interval=interval)
-            
-            if temp is None or temp.empty: continue
-
-            df_res = normalize_columns(temp)
-            
-            # Xử lý Index Date
-            if "Date" in df_res.columns:
-                df_res["Date"] = pd.to_datetime(df_res["Date"])
-                df_res.set_index("Date", inplace=True)
-            
-            if not isinstance(df_res.index, pd.DatetimeIndex):
-                df_res.index = pd.to_datetime(df_res.index)
-
-            # Xử lý lỗi đơn vị giá (VND thường trả về giá * 1000)
-            if not is_index and "Close" in df_res.columns:
+    def _one(src):
+        quote = Quote(source=src, symbol=symbol)
+        temp = quote.history(start=start_str, end=end_str, interval=interval)
+        return _normalize_history_frame(temp, is_index)
+
+    _, df_res = ROUTER.call(f"history:{interval}", sources, _one)
+    return df_res if df_res is not None else pd.DataFrame()
+
+def fetch_stock_data_batch(symbols, start_str: str, end_str: str, interval: str, chunk_size: int = VCI_BATCH_SIZE) -> dict:
+    """
+    Lịch sử nhiều mã qua VCI gap-chart: mỗi `chunk_size` mã = 1 request (thay vì 1 request/mã).
+    Return {SYMBOL: OHLCV DataFrame}; mã thiếu trong kết quả -> caller tự fallback fetch_stock_data.
+    """
+    symbols = [s.strip().upper() for s in symbols if str(s).strip()]
+    if not symbols: return {}
+
+    key = _get_vnstock_key()
+    if key: os.environ["VNSTOCK_API_KEY"] = key
+
+    try: from vnstock_data.explorer.vci.quote import history_batch
+    except Exception: return {}
+
+    out = {}
+    with perf.stage("data.fetch_batch"):
+        for i in range(0, len(symbols), max(1, int(chunk_size))):
+            chunk = symbols[i:i + max(1, int(chunk_size))]
+            try:
+                frames = history_batch(chunk, start=start_str, end=end_str, interval=interval, chunk_size=chunk_size)
+            except Exception:
+                continue
+            perf.count("data.fetch_calls")
+            for sym, temp in frames.items():
                 try:
-                    if df_res["Close"].mean() > 5000: # Giá > 5000 thường là chưa chia 1000
-                        for c in ["Open", "High", "Low", "Close"]:
-                            if c in df_res.columns: df_res[c] = df_res[c] / 1000.0
-                except Exception: pass
-
-            df_res = _validate_ohlcv_df(df_res)
-            if df_res is None or df_res.empty: continue
-            
-            return df_res # Trả về ngay khi lấy được
-        except Exception: 
-            continue
-            
-    return pd.DataFrame()
+                    df_res = _normalize_history_frame(temp, sym in _INDEX_SYMBOLS)
+                except Exception:
+                    continue
+                if df_res is not None and not df_res.empty:
+                    out[sym] = df_res
+    return out
+
+# Nến làm nóng trước cửa sổ trả về: EMA50/RSI14 hội tụ (lệch < 1e-5 so với tính cả lịch sử), SMA/Vol_MA 20 cần 20
+INDICATOR_WARMUP = 250
+
 
+def _indicators_tail(df, days_to_load):
+    """Tính chỉ báo chỉ trên days_to_load + INDICATOR_WARMUP nến cuối thay vì toàn bộ lịch sử."""
+    with perf.stage("data.indicators"):
+        return calculate_full_indicators(df.tail(int(days_to_load) + INDICATOR_WARMUP).copy())
+
+
+def _finish_cache_frame(df, days_to_load, compute_indicators):
+    """Cache-hit return: store giữ OHLCV thô nên chỉ báo được tính lại khi cần (chỉ trên tail + warm-up)."""
+    if df is None or df.empty:
+        return pd.DataFrame()
+    if compute_indicators:
+        df = _indicators_tail(df, days_to_load)
+    return df.tail(days_to_load)
+
+@perf.timed("data.load")
 def load_data_with_cache(symbol, days_to_load=365, timeframe='1D', end_date=None, *, allow_fetch: bool = True, compute_indicators: bool = True):
     """Smart loader (cache-first, fill-gap).
 
@@ -213,9 +323,18 @@ def load_data_with_cache(symbol, days_to_load=365, timeframe='1D', end_date=None
         "15M": "15m", "15m": "15m", "15": "15m",
     }
     interval = tf_map.get(tf, tf)
-    tf_norm = tf  # keep file naming stable with caller
+    tf_norm = normalize_tf(tf)  # store folder theo TF chuẩn (1D/1H/15m)
 
-    file_path = os.path.join(CACHE_DIR, f"{symbol_clean}_{tf_norm}.parquet")
+    # Khung dựng (30m/1H/2H từ 15m, 1W/1M từ 1D): chỉ tải khung nguồn rồi dựng lại từ store
+    src_tf = source_tf(tf_norm)
+    if src_tf and allow_fetch and end_date is None:
+        span = {"1W": 7, "1M": 31}.get(tf_norm, 1)  # days_to_load nến khung dựng ~ số ngày lịch khung nguồn
+        load_data_with_cache(symbol, days_to_load * span, src_tf, allow_fetch=True, compute_indicators=False)
+        try:
+            derive_timeframes([symbol_clean], (tf_norm,))
+        except Exception:
+            pass
+        allow_fetch = False
 
     now = now_vn()
     today_date = now.date()
@@ -224,88 +343,78 @@ def load_data_with_cache(symbol, days_to_load=365, timeframe='1D', end_date=None
     df_old = pd.DataFrame()
     last_cached_date = None
 
-    # --- STEP 1: read cache ---
-    if os.path.exists(file_path):
-        try:
-            df_old = pd.read_parquet(file_path)
-            if df_old is not None and not df_old.empty:
-                if "Date" in df_old.columns:
-                    df_old["Date"] = pd.to_datetime(df_old["Date"], errors="coerce")
-                    df_old.set_index("Date", inplace=True)
-                if not isinstance(df_old.index, pd.DatetimeIndex):
-                    df_old.index = pd.to_datetime(df_old.index, errors="coerce")
-                df_old = df_old.sort_index()
-                last_cached_date = df_old.index.max()
-        except Exception:
-            df_old = pd.DataFrame()
+    # --- STEP 1: read cache (columnar store; legacy file được chuyển vào store lần đầu) ---
+    if not has_symbol(symbol_clean, tf_norm):
+        import_legacy_file(symbol_clean, tf_norm, CACHE_DIR)
+    try:
+        # Chỉ báo cần thêm INDICATOR_WARMUP nến làm nóng; không tính chỉ báo thì chỉ cần tail
+        tail_hint = int(days_to_load) + (INDICATOR_WARMUP if compute_indicators else 0)
+        with perf.stage("data.store_read"):
+            df_old = read_bars(symbol_clean, tf_norm, tail_n=tail_hint, end_date=end_date)
+        if df_old is not None and not df_old.empty:
+            last_cached_date = df_old.index.max()
+    except Exception:
+        df_old = pd.DataFrame()
 
     # Backtest cut (never fetch beyond end_date)
     if end_date is not None:
         if df_old is not None and not df_old.empty:
             try:
                 df_bt = df_old[df_old.index <= end_date]
-                return df_bt.tail(days_to_load)
+                return _finish_cache_frame(df_bt, days_to_load, compute_indicators)
             except Exception:
-                return df_old.tail(days_to_load)
+                return _finish_cache_frame(df_old, days_to_load, compute_indicators)
         today_str = end_date.strftime("%Y-%m-%d")
 
     # If scan-mode disallows fetch, return cache tail only
     if not allow_fetch:
-        return df_old.tail(days_to_load) if df_old is not None else pd.DataFrame()
+        return _finish_cache_frame(df_old, days_to_load, compute_indicators)
 
-    # --- STEP 2: decide update ---
+    # --- STEP 2: decide update (lịch HOSE: cuối tuần/lễ/ngoài phiên không có nến mới -> không gọi API) ---
     need_update = True
     if last_cached_date is not None and end_date is None:
-        last_date_val = last_cached_date.date()
-        # Before market opens: don't refetch if we already have yesterday
-        if now.hour < 9:
-            yesterday = today_date - timedelta(days=1)
-            if last_date_val >= yesterday:
-                need_update = False
-        # After market opens: if cache already includes today, we can skip (you can add intraday TTL here)
-        elif last_date_val == today_date:
-            need_update = False
+        written_at = (manifest_entry(symbol_clean, tf_norm) or {}).get("mtime")
+        need_update = not is_fresh(last_cached_date, tf_norm, now, written_at=written_at)
 
     if not need_update and df_old is not None and not df_old.empty:
-        return df_old.tail(days_to_load)
+        perf.count("data.fresh_skips")
+        return _finish_cache_frame(df_old, days_to_load, compute_indicators)
 
     # --- STEP 3: fetch missing gap ---
     if last_cached_date is not None:
-        days_gap = (today_date - last_cached_date.date()).days
-        if days_gap <= 0:
-            start_date_str = today_str
-            fetch_mode = "history"
-        else:
-            start_date_str = (last_cached_date + timedelta(days=1)).strftime("%Y-%m-%d")
-            fetch_mode = "history"
+        # Từ ngày của nến cuối: nến đó có thể được ghi lúc còn đang chạy -> lấy lại bản chốt
+        start_date_str = last_cached_date.strftime("%Y-%m-%d")
+        fetch_mode = "history"
     else:
         start_date_str = (now - timedelta(days=days_to_load + 20)).strftime("%Y-%m-%d")
         fetch_mode = "history"
 
     if start_date_str > today_str:
-        return df_old.tail(days_to_load)
+        return _finish_cache_frame(df_old, days_to_load, compute_indicators)
 
-    df_new = fetch_stock_data(symbol, start_date_str, today_str, interval, mode=fetch_mode)
+    perf.count("data.fetch_calls")
+    with perf.stage("data.fetch"):
+        df_new = fetch_stock_data(symbol, start_date_str, today_str, interval, mode=fetch_mode)
     df_new = _validate_ohlcv_df(df_new)
 
-    # --- STEP 4: merge + persist ---
+    # --- STEP 4: merge + persist (append delta: chỉ ghi nến mới, không ghi lại lịch sử) ---
     if df_new is not None and not df_new.empty:
+        try:
+            with perf.stage("data.store_write"):
+                write_bars(symbol_clean, tf_norm, df_new)
+        except Exception:
+            pass
+
         if df_old is not None and not df_old.empty:
             df_final = pd.concat([df_old, df_new])
             df_final = df_final[~df_final.index.duplicated(keep="last")]
         else:
             df_final = df_new
         df_final = df_final.sort_index()
-
-        if compute_indicators:
-            df_final = calculate_full_indicators(df_final)
-
-        try:
-            df_final.to_parquet(file_path)
-        except Exception:
-            pass
     else:
         df_final = df_old
+    if compute_indicators and df_final is not None and not df_final.empty:
+        df_final = _indicators_tail(df_final, days_to_load)
 
     # Final clean
     if df_final is not None and not df_final.empty:
@@ -0,0 +1,260 @@
+# fetch_engine.py - ENGINE TẢI DỮ LIỆU ASYNC (RATE LIMIT + CONCURRENCY THÍCH ỨNG / NGUỒN)
+"""Asyncio fetch engine used by the bulk updater (pipeline_manager.run_bulk_update).
+
+Every call is tagged with its data source ("vci", "tcbs", "vnd"). Per source:
+
+- a token bucket caps the request rate (SOURCE_LIMITS: rate/s + burst),
+- an adaptive limiter caps in-flight requests: +1 slot per `limit` successes
+  (additive increase), halved on 429/5xx/connection errors (multiplicative
+  decrease) together with an exponential cooldown on that source's bucket,
+- throttled calls are retried up to `retries` times.
+
+The vendored clients are blocking (requests), so calls run in a bounded thread
+pool and the event loop only does scheduling; keep-alive connection reuse comes
+from the per-host sessions in vnstock_data.core.utils.client. No fixed sleeps:
+a refresh runs as fast as each source accepts::
+
+    engine = FetchEngine()
+    results = engine.run_all({sym: ("vci", fn, (sym,), {}) for sym in symbols})
+"""
+import re
+import time
+import asyncio
+import threading
+import concurrent.futures
+
+# rate: request/s trung bình | burst: số request được bắn dồn | start/min/max: số request song song
+# cooldown (tuỳ chọn): giây nghỉ cả nguồn khi bị throttle lần đầu (mặc định COOLDOWN_BASE_S)
+SOURCE_LIMITS = {
+    "vci":  {"rate": 6.0, "burst": 12, "start": 4, "min": 1, "max": 16},
+    "tcbs": {"rate": 4.0, "burst": 8,  "start": 4, "min": 1, "max": 12},
+    "vnd":  {"rate": 3.0, "burst": 6,  "start": 3, "min": 1, "max": 8},
+}
+DEFAULT_LIMIT = {"rate": 3.0, "burst": 6, "start": 2, "min": 1, "max": 8}
+COOLDOWN_BASE_S = 1.0
+COOLDOWN_MAX_S = 30.0
+
+# send_request_direct: "Failed to fetch data: 429 - Too Many Requests"
+_STATUS_RE = re.compile(r"(?:status(?: code)?|fetch data):?\s*(\d{3})", re.IGNORECASE)
+
+
+def throttle_status(exc: BaseException):
+    """
+    Mã HTTP nếu nguồn đang quá tải (429/5xx), 0 nếu là lỗi kết nối/timeout,
+    None nếu là lỗi khác (4xx, sai mã, dữ liệu rỗng...) -> không retry.
+    """
+    last = getattr(exc, "last_attempt", None)  # tenacity.RetryError của Quote adapter
+    if last is not None and callable(getattr(last, "exception", None)):
+        exc = last.exception() or exc
+    if not isinstance(exc, (ConnectionError, TimeoutError, concurrent.futures.TimeoutError)):
+        return None
+    m = _STATUS_RE.search(str(exc))
+    if not m:
+        return 0
+    code = int(m.group(1))
+    return code if code == 429 or code >= 500 else None
+
+
+class TokenBucket:
+    """Token bucket cho asyncio; pause() chặn cả bucket (nguồn vừa trả 429)."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.t_last = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.t_last) * self.rate)
+        self.t_last = now
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+                await asyncio.sleep((1.0 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+
+class AdaptiveLimiter:
+    """Giới hạn số request song song kiểu AIMD (tăng dần khi ổn, giảm nửa khi bị throttle)."""
+
+    def __init__(self, start: int, min_limit: int, max_limit: int):
+        self.limit = float(start)
+        self.min_limit = float(min_limit)
+        self.max_limit = float(max_limit)
+        self.in_flight = 0
+        self.epoch = 0  # tăng mỗi lần giảm limit
+        self._cond = asyncio.Condition()
+
+    async def acquire(self) -> int:
+        """Chờ slot; return epoch lúc bắt đầu request (đưa lại cho release)."""
+        async with self._cond:
+            while self.in_flight >= int(self.limit):
+                await self._cond.wait()
+            self.in_flight += 1
+            return self.epoch
+
+    async def release(self, epoch: int, ok: bool = True, throttled: bool = False) -> bool:
+        """
+        Trả slot. Chỉ giảm limit 1 lần cho mỗi đợt quá tải: request bắt đầu trước lần giảm
+        gần nhất (epoch cũ) bị 429 thì không giảm thêm. Return True nếu đã giảm limit.
+        """
+        async with self._cond:
+            self.in_flight -= 1
+            decreased = False
+            if throttled and epoch == self.epoch:
+                self.limit = max(self.min_limit, self.limit / 2.0)
+                self.epoch += 1
+                decreased = True
+            elif ok:
+                self.limit = min(self.max_limit, self.limit + 1.0 / max(self.limit, 1.0))
+            self._cond.notify_all()
+            return decreased
+
+
+class _Source:
+    def __init__(self, name: str, cfg: dict):
+        self.name = name
+        self.bucket = TokenBucket(cfg["rate"], cfg["burst"])
+        self.limiter = AdaptiveLimiter(cfg["start"], cfg["min"], cfg["max"])
+        self.cooldown = float(cfg.get("cooldown", COOLDOWN_BASE_S))
+        self.strikes = 0  # số lần throttle liên tiếp -> cooldown tăng theo cấp số nhân
+        self.stats = {"calls": 0, "ok": 0, "throttled": 0, "errors": 0}
+
+
+class FetchEngine:
+    """
+    Chạy hàm blocking (Quote.history, history_batch, ghi store...) dưới rate limit theo nguồn.
+    Một engine sống trong 1 event loop (run_all/asyncio.run); thread pool dùng chung.
+    """
+
+    def __init__(self, limits: dict = None, max_threads: int = 32, retries: int = 3):
+        self.limits = dict(SOURCE_LIMITS, **(limits or {}))
+        self.max_threads = int(max_threads)
+        self.retries = int(retries)
+        self._sources = {}
+        self._pool = None
+        self._loop = None
+
+    def _source(self, name: str) -> _Source:
+        name = (name or "").lower()
+        src = self._sources.get(name)
+        if src is None:
+            src = self._sources[name] = _Source(name, self.limits.get(name, DEFAULT_LIMIT))
+        return src
+
+    def _executor(self):
+        if self._pool is None:
+            self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_threads, thread_name_prefix="fetch")
+        return self._pool
+
+    async def offload(self, fn, *args, **kwargs):
+        """Chạy hàm blocking không gọi mạng (vd: ghi store) trên thread pool của engine."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor(), lambda: fn(*args, **kwargs))
+
+    async def call(self, source: str, fn, *args, on_start=None, **kwargs):
+        """
+        fn(*args, **kwargs) trên thread pool, qua bucket + limiter của `source`; retry khi bị throttle.
+        on_start(): gọi mỗi lần thử, ngay khi đã có slot + token (trước request thật) - để người gọi
+        đo latency/hedge không tính thời gian xếp hàng và backoff.
+        """
+        self._bind_loop()
+        src = self._source(source)
+        attempt = 0
+        while True:
+            epoch = await src.limiter.acquire()
+            try:
+                await src.bucket.acquire()
+                src.stats["calls"] += 1
+                if on_start is not None:
+                    on_start()
+                result = await self.offload(fn, *args, **kwargs)
+            except asyncio.CancelledError:
+                await src.limiter.release(epoch, ok=False)  # bị huỷ (vd: hedge thua): trả slot, không đổi limit
+                raise
+            except Exception as e:
+                throttled = throttle_status(e) is not None
+                if await src.limiter.release(epoch, ok=False, throttled=throttled):
+                    # đợt quá tải mới -> nghỉ cả nguồn, lâu dần nếu bị liên tiếp
+                    src.strikes += 1
+                    src.bucket.pause(min(COOLDOWN_MAX_S, src.cooldown * 2 ** (src.strikes - 1)))
+                if not throttled or attempt >= self.retries:
+                    src.stats["errors"] += 1
+                    raise
+                src.stats["throttled"] += 1
+                attempt += 1
+                continue
+            src.strikes = 0
+            src.stats["ok"] += 1
+            await src.limiter.release(epoch, ok=True)
+            return result
+
+    def _bind_loop(self):
+        """Engine dùng lại qua nhiều asyncio.run: giữ limit/stats đã học, tạo lại lock cho loop mới."""
+        loop = asyncio.get_running_loop()
+        if loop is self._loop:
+            return
+        self._loop = loop
+        for src in self._sources.values():
+            src.bucket._lock = asyncio.Lock()
+            src.limiter._cond = asyncio.Condition()
+            src.limiter.in_flight = 0
+
+    def stats(self) -> dict:
+        return {name: dict(s.stats, limit=round(s.limiter.limit, 2)) for name, s in self._sources.items()}
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    async def gather(self, jobs: dict) -> dict:
+        """jobs = {key: (source, fn, args, kwargs)} -> {key: (ok, result_or_exception)}."""
+        async def one(key, job):
+            source, fn, args, kwargs = job
+            try:
+                return key, (True, await self.call(source, fn, *args, **(kwargs or {})))
+            except Exception as e:
+                return key, (False, e)
+
+        pairs = await asyncio.gather(*(one(k, j) for k, j in jobs.items()))
+        return dict(pairs)
+
+    def run_all(self, jobs: dict) -> dict:
+        return run_sync(self.gather(jobs))
+
+
+def run_sync(coro):
+    """asyncio.run cả khi thread hiện tại đã có loop chạy (Streamlit/Jupyter): chạy ở thread riêng."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    out = {}
+
+    def _runner():
+        try:
+            out["v"] = asyncio.run(coro)
+        except BaseException as e:
+            out["e"] = e
+
+    t = threading.Thread(target=_runner, daemon=True)
+    t.start()
+    t.join()
+    if "e" in out:
+        raise out["e"]
+    return out.get("v")
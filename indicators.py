@@ -37,9 +37,10 @@ def calculate_indicators(df: pd.DataFrame) -> pd.DataFrame:
 
     return df
 
-def apply_vsa(df: pd.DataFrame, vol_len: int = 20) -> pd.DataFrame:
-    # (Giữ nguyên code cũ)
-    df = df.copy()
+def apply_vsa(df: pd.DataFrame, vol_len: int = 20, copy: bool = True) -> pd.DataFrame:
+    # (Giữ nguyên code cũ) - copy=False: ghi cột VSA thẳng vào df của caller
+    if copy:
+        df = df.copy()
     if "Volume" not in df.columns:
         df["VSA_Signal"] = "Normal"
         return df
@@ -86,72 +87,91 @@ def detect_rsi_divergence(df: pd.DataFrame, lookback: int = 30):
 # 5. PRICE ACTION (NẾN ĐẢO CHIỀU) - LOGIC TỪ AMIBROKER
 # ==============================================================================
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+def _prev(a: np.ndarray) -> np.ndarray:
+    """Như Series.shift(1) trên mảng float: phần tử đầu là NaN."""
+    return np.concatenate([[np.nan], a[:-1]])
+
+def _rolling_min(a: np.ndarray, window: int) -> np.ndarray:
+    """Như Series.rolling(window).min(): NaN cho window-1 phần tử đầu (và cửa sổ có NaN)."""
+    out = np.full(len(a), np.nan)
+    if len(a) >= window:
+        out[window - 1:] = sliding_window_view(a, window).min(axis=1)
+    return out
 
-def detect_price_action(df: pd.DataFrame):
+def detect_price_action(df: pd.DataFrame, copy: bool = True):
     """
     Phát hiện các mẫu nến Price Action (PA) đảo chiều và tiếp diễn.
+    copy=False: thêm cột PA_* thẳng vào df (frame làm việc do scanner sở hữu).
     """
     if df is None or df.empty or len(df) < 15:
         return df
 
-    df = df.copy()
+    if copy:
+        df = df.copy()
     
-    # 1. Chuẩn bị dữ liệu cơ bản
-    high = df['High']
-    low = df['Low']
-    close = df['Close']
-    open_ = df['Open']
+    # 1. Chuẩn bị dữ liệu cơ bản (mảng numpy: không tạo Series trung gian cho từng phép so sánh)
+    high = df['High'].to_numpy(dtype=float)
+    low = df['Low'].to_numpy(dtype=float)
+    close = df['Close'].to_numpy(dtype=float)
+    open_ = df['Open'].to_numpy(dtype=float)
     
     # Tính ATR nếu chưa có (dùng cho Pinbar)
     if 'ATRr_14' not in df.columns:
         df.ta.atr(length=14, append=True)
-    atr = df.get('ATRr_14', df['High'] - df['Low']) # Fallback nếu lỗi
+    atr = df['ATRr_14'].to_numpy(dtype=float) if 'ATRr_14' in df.columns else high - low # Fallback nếu lỗi
 
     # Các thành phần nến
     bar_range = high - low
     upper_wick = high - np.maximum(open_, close)
     lower_wick = np.minimum(open_, close) - low
+    # Nến trước (= shift(1), nến đầu NaN -> mọi so sánh False), dùng lại cho mọi pattern
+    prev_high = _prev(high)
+    prev_low = _prev(low)
+    prev_close = _prev(close)
+    prev_open = _prev(open_)
     
     # --- LOGIC PATTERNS ---
 
     # 1. Reversal Bar
-    df['PA_RevBar_Bull'] = (low < low.shift(1)) & (close > open_)
-    df['PA_RevBar_Bear'] = (high > high.shift(1)) & (close < open_)
+    df['PA_RevBar_Bull'] = (low < prev_low) & (close > open_)
+    df['PA_RevBar_Bear'] = (high > prev_high) & (close < open_)
 
     # 2. Key Reversal Bar (Mạnh hơn loại 1)
-    df['PA_KeyRev_Bull'] = (open_ < open_.shift(1)) & (close > close.shift(1))
-    df['PA_KeyRev_Bear'] = (open_ > open_.shift(1)) & (close < close.shift(1))
+    df['PA_KeyRev_Bull'] = (open_ < prev_open) & (close > prev_close)
+    df['PA_KeyRev_Bear'] = (open_ > prev_open) & (close < prev_close)
 
     # 3. Pin Bar (Đuôi dài)
     # Bull: Đuôi dưới dài > 60% thân, đuôi trên ngắn
-    df['PA_PinBar_Bull'] = (bar_range > atr * 0.5) & \
+    wide = bar_range > atr * 0.5
+    df['PA_PinBar_Bull'] = wide & \
                            (lower_wick >= 0.6 * bar_range) & \
                            (upper_wick <= 0.3 * bar_range)
     
     # Bear: Đuôi trên dài > 60% thân
-    df['PA_PinBar_Bear'] = (bar_range > atr * 0.5) & \
+    df['PA_PinBar_Bear'] = wide & \
                            (upper_wick >= 0.6 * bar_range) & \
                            (lower_wick <= 0.3 * bar_range)
 
     # 4. Inside Bar
-    df['PA_InsideBar'] = (high < high.shift(1)) & (low > low.shift(1))
+    inside = (high < prev_high) & (low > prev_low)
+    df['PA_InsideBar'] = inside
 
     # 5. Outside Bar (Engulfing)
-    df['PA_OutsideBar'] = (high > high.shift(1)) & (low < low.shift(1))
+    df['PA_OutsideBar'] = (high > prev_high) & (low < prev_low)
     # Engulfing Bullish chuẩn
-    df['PA_Engulf_Bull'] = (open_ < close.shift(1)) & (close > open_.shift(1)) & (close > open_)
+    df['PA_Engulf_Bull'] = (open_ < prev_close) & (close > prev_open) & (close > open_)
     # Engulfing Bearish chuẩn
-    df['PA_Engulf_Bear'] = (open_ > close.shift(1)) & (close < open_.shift(1)) & (close < open_)
+    df['PA_Engulf_Bear'] = (open_ > prev_close) & (close < prev_open) & (close < open_)
 
     # 6. NR7 / NR4 (Nến biên độ hẹp - Nén giá)
-    range_val = high - low
-    df['PA_NR7'] = range_val == range_val.rolling(7).min()
-    df['PA_NR4'] = range_val == range_val.rolling(4).min()
+    range_val = bar_range
+    df['PA_NR7'] = range_val == _rolling_min(range_val, 7)
+    df['PA_NR4'] = range_val == _rolling_min(range_val, 4)
 
     # 7. Fakey (Inside Bar bị phá vỡ giả)
-    prev_inside = df['PA_InsideBar'].shift(1).fillna(False)
-    prev_high = high.shift(1)
-    prev_low = low.shift(1)
+    prev_inside = np.concatenate([[False], inside[:-1]])
     
     # Bull Fakey: Quét Low nến Inside trước đó rồi đóng cửa cao hơn
     df['PA_Fakey_Bull'] = prev_inside & (low < prev_low) & (close > prev_high)
@@ -0,0 +1,168 @@
+# live_bars.py - VÁ NẾN ĐANG CHẠY TỪ 1 SNAPSHOT BẢNG GIÁ (THAY VÌ 1 REQUEST HISTORY / MÃ)
+"""Live-bar mode: one price-board call refreshes today's bars for the universe.
+
+During the session, ``patch_live_bars(symbols)`` takes one snapshot via
+vnstock_pipeline.tasks.price_board.PriceBoardFetcher (a single VCI
+``price/symbols/getList`` POST for up to BOARD_CHUNK symbols) and, for every
+cached symbol:
+
+- 1D: creates or patches today's bar (open/high/low of the day, last match
+  price as close, accumulated volume),
+- 15m: patches the current bucket; volume is the day's accumulated volume
+  minus the 15m bars already stored for today, open is the previous close
+  when the bucket is new, high/low extend with the snapshot price (moves
+  between two snapshots are not seen until the next history fetch),
+- derived timeframes (1H, 30m, 2H, 1W, 1M) are rebuilt incrementally.
+
+Rows go through the normal store writers, so manifest mtime marks them as
+written mid-bar and trading_calendar.is_fresh() fetches the final bar once
+it has closed. Prices are converted to the store unit (thousand VND).
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+import perf
+from ohlcv_store import load_manifest, read_bars_bulk, write_bars_bulk, clean_symbol
+from resample import derive_timeframes
+from trading_calendar import is_trading_day, prev_trading_day, bar_starts, expected_last_bar, MORNING_OPEN, DAY_FINAL
+
+BOARD_CHUNK = 400   # số mã / 1 request bảng giá
+INTRADAY_TF = "15m"
+
+# Tên cột sau price_board(flatten_columns=True, drop_levels=[0]) -> OHLCV (lấy tên đầu tiên có mặt)
+BOARD_COLUMNS = {
+    "symbol": ("symbol", "listing_symbol"),
+    "Close": ("match_price", "match_match_price"),
+    "Open": ("open_price", "match_open_price", "open"),
+    "High": ("highest", "match_highest", "high"),
+    "Low": ("lowest", "match_lowest", "low"),
+    "Volume": ("accumulated_volume", "match_accumulated_volume", "total_volume"),
+}
+
+
+def fetch_board(symbols) -> pd.DataFrame:
+    """Bảng giá cho cả list: 1 request / BOARD_CHUNK mã."""
+    from vnstock_pipeline.tasks.price_board import PriceBoardFetcher
+
+    symbols = [clean_symbol(s) for s in symbols if clean_symbol(s)]
+    fetcher = PriceBoardFetcher()
+    parts = []
+    for i in range(0, len(symbols), BOARD_CHUNK):
+        fetcher.tickers = symbols[i:i + BOARD_CHUNK]
+        perf.count("live.board_calls")
+        parts.append(fetcher.fetch(fetcher.tickers[0]))
+    return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+
+
+def board_quotes(board: pd.DataFrame) -> pd.DataFrame:
+    """Snapshot bảng giá -> frame [Open, High, Low, Close, Volume] index symbol (giá VND như nguồn)."""
+    if board is None or board.empty:
+        return pd.DataFrame()
+    cols = {}
+    for name, candidates in BOARD_COLUMNS.items():
+        src = next((c for c in candidates if c in board.columns), None)
+        if src is not None:
+            cols[name] = board[src]
+    if "symbol" not in cols or "Close" not in cols:
+        return pd.DataFrame()
+    out = pd.DataFrame({k: (v if k == "symbol" else pd.to_numeric(v, errors="coerce")) for k, v in cols.items()})
+    out["symbol"] = out["symbol"].astype(str).map(clean_symbol)
+    out = out[out["Close"] > 0].drop_duplicates("symbol", keep="last").set_index("symbol")
+    for c in ("Open", "High", "Low"):
+        if c not in out.columns:
+            out[c] = np.nan
+    if "Volume" not in out.columns:
+        out["Volume"] = np.nan
+    return out[["Open", "High", "Low", "Close", "Volume"]]
+
+
+def _price_scale(price: float, ref) -> float:
+    """Store lưu nghìn đồng; bảng giá trả VND -> chia 1000 khi lệch ~1000 lần so với close cũ."""
+    if ref is not None and ref > 0:
+        return 1000.0 if price / ref > 100 else 1.0
+    return 1000.0 if price > 5000 else 1.0
+
+
+def _bar(prev: pd.Series, o, h, l, c, v) -> dict:
+    """Gộp snapshot vào nến đang có (prev=None -> nến mới)."""
+    if prev is None:
+        o = c if np.isnan(o) else o
+        return {"Open": o, "High": np.nanmax([h, o, c]), "Low": np.nanmin([l, o, c]), "Close": c,
+                "Volume": 0.0 if np.isnan(v) else v}
+    return {
+        "Open": prev["Open"] if np.isnan(o) else o,
+        "High": np.nanmax([prev["High"], h, c]),
+        "Low": np.nanmin([prev["Low"], l, c]),
+        "Close": c,
+        "Volume": prev["Volume"] if np.isnan(v) else v,
+    }
+
+
+def patch_live_bars(symbols=None, now=None, board: pd.DataFrame = None, root: str = None, force: bool = False) -> dict:
+    """
+    Vá nến hôm nay (1D + bucket 15m hiện tại) từ 1 snapshot bảng giá rồi dựng lại khung dẫn xuất.
+    symbols=None -> mọi mã trong store 1D. board: snapshot có sẵn (không gọi API).
+    Ngoài phiên (và force=False) không làm gì. Return {"symbols", "1D", "15m", "derived", "board_s"}.
+    """
+    if now is None:
+        from config import now_vn
+        now = now_vn()
+    now = pd.Timestamp(now)
+    if now.tzinfo is not None:
+        now = now.tz_convert("Asia/Ho_Chi_Minh").tz_localize(None)
+    today = now.normalize()
+    tod = now - today
+    if not force and not (is_trading_day(today) and MORNING_OPEN <= tod < DAY_FINAL):
+        return {"symbols": 0, "1D": 0, "15m": 0, "derived": {}, "board_s": 0.0}
+
+    d1_manifest = load_manifest("1D", root)
+    syms = sorted(d1_manifest) if symbols is None else sorted({clean_symbol(s) for s in symbols} & set(d1_manifest))
+    if not syms:
+        return {"symbols": 0, "1D": 0, "15m": 0, "derived": {}, "board_s": 0.0}
+
+    t0 = time.perf_counter()
+    if board is None:
+        board = fetch_board(syms)
+    board_s = time.perf_counter() - t0
+    quotes = board_quotes(board)
+    syms = [s for s in syms if s in quotes.index]
+
+    d1_last = read_bars_bulk(syms, "1D", tail_n=1, root=root)
+    intra = read_bars_bulk(syms, INTRADAY_TF, tail_n=40, root=root)  # 40 nến 15m > 1 phiên
+    bucket = pd.Timestamp(bar_starts([now], INTRADAY_TF)[0])
+    # Chỉ vá khi store liền mạch tới ngay trước nến đang chạy; có gap thì để lượt tải history lấp
+    d1_prev = pd.Timestamp(prev_trading_day(today))
+    intra_prev = expected_last_bar(INTRADAY_TF, bucket - pd.Timedelta(1))
+
+    d1_frames, intra_frames = {}, {}
+    for sym in syms:
+        q = quotes.loc[sym]
+        last = d1_last.get(sym)
+        ref = float(last["Close"].iloc[-1]) if last is not None and len(last) else None
+        k = _price_scale(float(q["Close"]), ref)
+        o, h, l, c = (float(q[x]) / k for x in ("Open", "High", "Low", "Close"))
+        v = float(q["Volume"])
+
+        if last is not None and len(last) and last.index[-1] >= d1_prev:
+            prev = last.iloc[-1] if last.index[-1] == today else None
+            d1_frames[sym] = pd.DataFrame([_bar(prev, o, h, l, c, v)], index=pd.DatetimeIndex([today], name="Date"))
+
+        bars = intra.get(sym)
+        if bars is None or not len(bars) or bars.index[-1] < intra_prev:
+            continue
+        done_today = bars[(bars.index >= today) & (bars.index < bucket)]
+        prev_bar = bars.iloc[-1] if bars.index[-1] == bucket else None
+        vol = max(0.0, v - float(done_today["Volume"].sum())) if not np.isnan(v) else 0.0
+        open_ = float(bars["Close"].iloc[-1]) if prev_bar is None else np.nan
+        # Bucket 15m chỉ biết giá hiện tại, high/low của ngày không thuộc về bucket này
+        intra_frames[sym] = pd.DataFrame(
+            [_bar(prev_bar, open_, np.nan, np.nan, c, vol)], index=pd.DatetimeIndex([bucket], name="Date")
+        )
+
+    with perf.stage("live.write"):
+        n_d1 = write_bars_bulk(d1_frames, "1D", root=root) if d1_frames else 0
+        n_intra = write_bars_bulk(intra_frames, INTRADAY_TF, root=root) if intra_frames else 0
+        derived = derive_timeframes(syms, root=root)
+    return {"symbols": len(syms), "1D": n_d1, INTRADAY_TF: n_intra, "derived": derived, "board_s": round(board_s, 3)}
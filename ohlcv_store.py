@@ -0,0 +1,681 @@
+# ohlcv_store.py - KHO OHLCV DẠNG CỘT (NHIỀU MÃ / 1 DATASET)
+"""Columnar OHLCV store shared by data.py, pipeline_manager.py and scanner.py.
+
+Layout (one dataset per timeframe, partitioned by month)::
+
+    data_cache/store/{TF}/{YYYY-MM}/part-0.parquet   # compacted base: all symbols, sorted by (symbol, Date)
+    data_cache/store/{TF}/{YYYY-MM}/part-d*.parquet  # append-only delta segments (new bars only)
+    data_cache/store/{TF}/_manifest.json             # per-symbol index (see MANIFEST_FIELDS)
+
+- A month file holds every symbol, so a universe read of the last N bars opens
+  only ~N/bars_per_month files instead of one file per symbol.
+- Rows are sorted by symbol so parquet row-group statistics prune other symbols
+  on single-symbol reads.
+- Writers append a small delta segment (cost ~ new bars, not history);
+  compaction folds deltas back into the base file (inline when a month has
+  too many deltas, or from the background compactor).
+- The manifest is maintained by every writer and answers freshness/liquidity
+  questions ("last bar of SYM", "5-bar avg volume") without decoding parquet.
+"""
+import os
+import json
+import glob
+import math
+import time
+import threading
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pyarrow.dataset as ds
+import perf
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# --- ĐƯỜNG DẪN ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.environ.get("DATA_CACHE_DIR") or os.path.join(BASE_DIR, "data_cache")  # env: chạy trên cache khác (benchmark)
+STORE_DIR = os.path.join(CACHE_DIR, "store")
+LEGACY_DIR = os.path.join(CACHE_DIR, "legacy")
+
+OHLCV_COLS = ["Open", "High", "Low", "Close", "Volume"]
+MANIFEST_FILE = "_manifest.json"
+LOCK_FILE = "_manifest.json.lock"  # khoá liên tiến trình cho ghi store (scanner pool, stream, backfill, app)
+# first/last: ISO time nến đầu/cuối | rows: số nến | last_close: giá đóng cửa nến cuối
+# vol_avg_5/vol_avg_20: KL trung bình 5/20 nến cuối | mtime: epoch lần ghi gần nhất
+MANIFEST_FIELDS = ("first", "last", "rows", "last_close", "vol_avg_5", "vol_avg_20", "mtime")
+STATS_BARS = 20
+BASE_PART = "part-0.parquet"
+DELTA_PREFIX = "part-d"   # "part-0" < "part-d..." -> thứ tự tên file = thứ tự ghi
+MAX_DELTA_FILES = 64      # quá ngưỡng này thì compact ngay tháng đó khi ghi
+ROW_GROUP_SIZE = 32_768
+
+# Số nến tối thiểu / tháng (ước lượng thấp, đã trừ lễ) -> chọn số tháng cần đọc
+BARS_PER_MONTH = {"1D": 18, "1H": 80, "15m": 280, "1m": 4000, "30m": 160, "2H": 54, "1W": 4, "1M": 1}
+
+_TF_ALIASES = {
+    "D": "1D", "DAY": "1D", "1D": "1D",
+    "H": "1H", "60": "1H", "1H": "1H",
+    "15": "15m", "15M": "15m", "15m": "15m",
+    "30": "30m", "30M": "30m", "30m": "30m",
+    "120": "2H", "2H": "2H",
+    "W": "1W", "WEEK": "1W", "1W": "1W",
+    "MONTH": "1M", "1MO": "1M", "1M": "1M",
+    "1m": "1m",  # phút, không phải tháng
+}
+
+_locks = {}
+_locks_guard = threading.Lock()
+_manifest_cache = {}
+_compactor = None
+_held = threading.local()  # thread này đang giữ khoá file của thư mục nào (cho phép lồng nhau)
+
+
+def normalize_tf(timeframe: str) -> str:
+    tf = (timeframe or "1D").strip()
+    return _TF_ALIASES.get(tf, _TF_ALIASES.get(tf.upper(), tf))
+
+
+def clean_symbol(symbol: str) -> str:
+    symbol = (symbol or "").strip().upper()
+    return "".join([ch for ch in symbol if ch.isalnum()])
+
+
+def _tf_dir(timeframe: str, root: str = None) -> str:
+    return os.path.join(root or STORE_DIR, normalize_tf(timeframe))
+
+
+def _lock_for(timeframe: str) -> threading.RLock:
+    tf = normalize_tf(timeframe)
+    with _locks_guard:
+        if tf not in _locks:
+            _locks[tf] = threading.RLock()
+        return _locks[tf]
+
+
+def _flock(fh, lock: bool):
+    if fcntl is not None:
+        fcntl.flock(fh.fileno(), fcntl.LOCK_EX if lock else fcntl.LOCK_UN)
+        return
+    fh.seek(0)
+    if not lock:
+        msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+        return
+    while True:
+        try:
+            msvcrt.locking(fh.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except OSError:  # LK_LOCK bỏ cuộc sau ~10s -> thử tiếp
+            continue
+
+
+@contextmanager
+def _store_lock(timeframe: str, root: str = None):
+    """
+    Khoá ghi 1 timeframe: RLock trong process + flock trên _manifest.json.lock giữa các process,
+    để load -> ghi delta -> save manifest không ghi đè entry của process khác. Lồng nhau được trong 1 thread.
+    """
+    tf = normalize_tf(timeframe)
+    tf_dir = _tf_dir(tf, root)
+    with _lock_for(tf):
+        held = _held.__dict__.setdefault("dirs", {})
+        if held.get(tf_dir):
+            held[tf_dir] += 1
+            try:
+                yield
+            finally:
+                held[tf_dir] -= 1
+            return
+        os.makedirs(tf_dir, exist_ok=True)
+        with open(os.path.join(tf_dir, LOCK_FILE), "a+b") as fh:
+            _flock(fh, True)
+            held[tf_dir] = 1
+            try:
+                yield
+            finally:
+                held[tf_dir] = 0
+                _flock(fh, False)
+
+
+# =========================
+# MANIFEST
+# =========================
+def _manifest_path(timeframe: str, root: str = None) -> str:
+    return os.path.join(_tf_dir(timeframe, root), MANIFEST_FILE)
+
+
+def load_manifest(timeframe: str, root: str = None, fresh: bool = False) -> dict:
+    """Return {symbol: {MANIFEST_FIELDS...}} for a timeframe (read-only copy). fresh=True: bỏ qua cache mtime."""
+    path = _manifest_path(timeframe, root)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return {}
+    cached = _manifest_cache.get(path)
+    if fresh or cached is None or cached[0] != mtime:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                cached = (mtime, json.load(f))
+        except Exception:
+            return {}
+        _manifest_cache[path] = cached
+    return dict(cached[1])
+
+
+def _save_manifest(timeframe: str, manifest: dict, root: str = None):
+    path = _manifest_path(timeframe, root)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, separators=(",", ":"), sort_keys=True)
+    os.replace(tmp, path)
+
+
+def store_version(timeframe: str, root: str = None) -> int:
+    """Changes whenever any symbol of the timeframe is written (cache key)."""
+    try:
+        return os.stat(_manifest_path(timeframe, root)).st_mtime_ns
+    except OSError:
+        return 0
+
+
+def symbol_version(symbol: str, timeframe: str, root: str = None) -> str:
+    """Changes only when this symbol's bars change (cache key)."""
+    entry = load_manifest(timeframe, root).get(clean_symbol(symbol))
+    if not entry:
+        return ""
+    return f"{entry.get('last')}|{entry.get('rows')}|{entry.get('mtime')}"
+
+
+def manifest_entry(symbol: str, timeframe: str, root: str = None) -> dict:
+    """Manifest row of one symbol ({} if not cached). O(1), never reads parquet."""
+    return dict(load_manifest(timeframe, root).get(clean_symbol(symbol)) or {})
+
+
+def last_bar_time(symbol: str, timeframe: str, root: str = None):
+    entry = load_manifest(timeframe, root).get(clean_symbol(symbol))
+    if not entry or not entry.get("last"):
+        return None
+    return pd.Timestamp(entry["last"])
+
+
+def has_symbol(symbol: str, timeframe: str, root: str = None) -> bool:
+    return clean_symbol(symbol) in load_manifest(timeframe, root)
+
+
+# =========================
+# NORMALIZE
+# =========================
+def _to_store_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """DatetimeIndex/`Date` column -> flat frame [Date, OHLCV] (float64, tz-naive)."""
+    if df is None or df.empty:
+        return pd.DataFrame()
+    out = df
+    if "Date" in out.columns:
+        out = out.set_index("Date")
+    if any(c not in out.columns for c in OHLCV_COLS):
+        return pd.DataFrame()
+    idx = pd.to_datetime(out.index, errors="coerce")
+    if getattr(idx, "tz", None) is not None:
+        idx = idx.tz_localize(None)
+    out = pd.DataFrame(
+        {c: pd.to_numeric(out[c], errors="coerce").astype("float64").values for c in OHLCV_COLS},
+        index=idx,
+    )
+    out = out[out.index.notna()]
+    out = out[~out.index.duplicated(keep="last")].sort_index()
+    out.index = out.index.astype("datetime64[ns]")
+    out.index.name = "Date"
+    return out.reset_index()
+
+
+def _to_ohlcv_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Flat store rows -> OHLCV frame indexed by Date (the shape callers expect)."""
+    if df is None or df.empty:
+        return pd.DataFrame()
+    out = df.set_index("Date")[OHLCV_COLS]
+    out.index = pd.DatetimeIndex(out.index, name="Date")
+    return out
+
+
+def _month_key(ts) -> str:
+    return pd.Timestamp(ts).strftime("%Y-%m")
+
+
+def _list_months(timeframe: str, root: str = None) -> list:
+    base = _tf_dir(timeframe, root)
+    if not os.path.isdir(base):
+        return []
+    return sorted(d for d in os.listdir(base) if len(d) == 7 and d[4] == "-")
+
+
+def _month_files(timeframe: str, month: str, root: str = None) -> list:
+    return sorted(glob.glob(os.path.join(_tf_dir(timeframe, root), month, "*.parquet")))
+
+
+# =========================
+# WRITE (append-only delta + compaction)
+# =========================
+def _delta_files(timeframe: str, month: str, root: str = None) -> list:
+    return [p for p in _month_files(timeframe, month, root) if os.path.basename(p).startswith(DELTA_PREFIX)]
+
+
+def _write_month(timeframe: str, month: str, rows: pd.DataFrame, root: str = None):
+    month_dir = os.path.join(_tf_dir(timeframe, root), month)
+    os.makedirs(month_dir, exist_ok=True)
+    path = os.path.join(month_dir, BASE_PART)
+    rows = rows.sort_values(["symbol", "Date"], kind="mergesort")
+    table = pa.Table.from_pandas(rows[["symbol", "Date"] + OHLCV_COLS], preserve_index=False)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    pq.write_table(table, tmp, row_group_size=ROW_GROUP_SIZE)
+    os.replace(tmp, path)
+
+
+def _append_delta(timeframe: str, month: str, rows: pd.DataFrame, root: str = None):
+    month_dir = os.path.join(_tf_dir(timeframe, root), month)
+    os.makedirs(month_dir, exist_ok=True)
+    name = f"{DELTA_PREFIX}{time.time_ns():020d}-{os.getpid()}-{threading.get_ident()}.parquet"
+    path = os.path.join(month_dir, name)
+    rows = rows.sort_values(["symbol", "Date"], kind="mergesort")
+    table = pa.Table.from_pandas(rows[["symbol", "Date"] + OHLCV_COLS], preserve_index=False)
+    tmp = f"{path}.tmp"
+    pq.write_table(table, tmp)
+    os.replace(tmp, path)
+
+
+def compact_month(timeframe: str, month: str, root: str = None) -> int:
+    """Fold delta segments of one month into part-0.parquet. Return deltas removed.
+
+    The deduplicated content is unchanged, so the manifest (rows, first/last, stats) stays as is;
+    `rows` is kept exact at write time by write_bars_bulk.
+    """
+    tf = normalize_tf(timeframe)
+    with _store_lock(tf, root):
+        deltas = _delta_files(tf, month, root)
+        if not deltas:
+            return 0
+        rows = _dedupe(_scan(tf, [month], ds.scalar(True), root=root))
+        if rows is None or rows.empty:
+            return 0
+        _write_month(tf, month, rows, root)
+        for p in deltas:
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+        return len(deltas)
+
+
+def compact_store(timeframe: str, min_deltas: int = 1, root: str = None) -> int:
+    """Compact every month of a timeframe having >= `min_deltas` delta segments."""
+    removed = 0
+    for month in _list_months(timeframe, root):
+        if len(_delta_files(timeframe, month, root)) >= max(1, int(min_deltas)):
+            removed += compact_month(timeframe, month, root)
+    return removed
+
+
+def start_background_compaction(timeframes=("1D", "1H", "15m"), interval_s: float = 300.0, root: str = None):
+    """Start (once per process) a daemon thread that compacts the store periodically."""
+    global _compactor
+    with _locks_guard:
+        if _compactor is not None and _compactor.is_alive():
+            return _compactor
+
+        def _loop():
+            while True:
+                for tf in timeframes:
+                    try:
+                        compact_store(tf, root=root)
+                    except Exception:
+                        pass
+                time.sleep(interval_s)
+
+        _compactor = threading.Thread(target=_loop, name="ohlcv-store-compactor", daemon=True)
+        _compactor.start()
+        return _compactor
+
+
+def write_bars_bulk(frames: dict, timeframe: str, root: str = None, mode: str = "append") -> int:
+    """Write bars for many symbols as ONE delta segment per touched month.
+
+    `frames` = {symbol: DataFrame(OHLCV, DatetimeIndex or Date column)}.
+    - mode="append": (symbol, Date) already in the store are skipped, so a refresh writes only
+      new bars, bars filling gaps, and the last bar (intraday re-fetch). Skipped/gap-filled rows are
+      counted (perf counters "store.append_overlap_skipped" / "store.append_gap_filled").
+    - mode="upsert": every row is written (e.g. adjusted history re-download).
+    Manifest `rows` counts only keys not already stored, so it stays exact.
+    Newer segments override older rows with the same (symbol, Date).
+    Return number of rows written.
+    """
+    tf = normalize_tf(timeframe)
+
+    with _store_lock(tf, root):
+        manifest = load_manifest(tf, root, fresh=True)  # đọc lại dưới khoá: có thể process khác vừa ghi
+        parts = []
+        for sym, df in (frames or {}).items():
+            flat = _to_store_frame(df)
+            if flat.empty:
+                continue
+            flat.insert(0, "symbol", clean_symbol(sym))
+            parts.append(flat)
+        if not parts:
+            return 0
+        new_rows = pd.concat(parts, ignore_index=True).drop_duplicates(["symbol", "Date"], keep="last")
+
+        def _bound(key):
+            return pd.to_datetime(new_rows["symbol"].map(lambda s: (manifest.get(s) or {}).get(key)))
+
+        first_of, last_of = _bound("first"), _bound("last")
+        at_last = (new_rows["Date"] == last_of).to_numpy()
+        inside = (new_rows["Date"] >= first_of).to_numpy() & (new_rows["Date"] < last_of).to_numpy()
+        # Nến trong [first, last): tra khoá (symbol, Date) đã có ở các tháng đó -> manifest `rows` đúng,
+        # append bỏ nến đã có nhưng vẫn lấp gap. Refresh thường (chỉ nến >= last) không phải đọc gì thêm.
+        is_new = ~at_last
+        if inside.any():
+            ov = new_rows[inside]
+            rows = _scan(tf, sorted(set(ov["Date"].dt.strftime("%Y-%m"))),
+                         ds.field("symbol").isin(sorted(set(ov["symbol"]))), root=root)
+            if rows is not None and not rows.empty:
+                keys = pd.MultiIndex.from_frame(new_rows[["symbol", "Date"]])
+                is_new &= ~(keys.isin(pd.MultiIndex.from_frame(rows[["symbol", "Date"]])) & inside)
+        if mode == "append":
+            keep = is_new | at_last  # nến cuối đã có vẫn ghi lại (bản chốt của nến đang chạy)
+            n_skip = int((~keep).sum())
+            n_gap = int((keep & inside).sum())
+            if n_skip:
+                perf.count("store.append_overlap_skipped", n_skip)
+            if n_gap:
+                perf.count("store.append_gap_filled", n_gap)
+            new_rows, is_new = new_rows[keep], is_new[keep]
+            if new_rows.empty:
+                return 0
+
+        months = new_rows["Date"].dt.strftime("%Y-%m")
+        for month, chunk in new_rows.groupby(months, sort=True):
+            _append_delta(tf, month, chunk, root)
+
+        new_count = pd.Series(is_new, index=new_rows.index).groupby(new_rows["symbol"]).sum()
+        for sym, g in new_rows.groupby("symbol"):
+            entry = dict(manifest.get(sym) or {})
+            first = g["Date"].min()
+            last = g["Date"].max()
+            n_new = int(new_count[sym])
+            entry["first"] = min(entry.get("first") or first.isoformat(), first.isoformat())
+            entry["last"] = max(entry.get("last") or last.isoformat(), last.isoformat())
+            entry["rows"] = int(entry.get("rows", 0)) + n_new
+            manifest[sym] = entry
+
+        # Close/KL trung bình lấy từ STATS_BARS nến cuối (chỉ các mã vừa ghi)
+        touched = sorted(new_rows["symbol"].unique())
+        anchor = max(pd.Timestamp(manifest[sym]["last"]) for sym in touched)
+        tails = _tail_by_symbol(
+            _scan(tf, _months_for_tail(tf, anchor, STATS_BARS, root), ds.field("symbol").isin(touched), root=root),
+            STATS_BARS,
+        )
+        now_ts = time.time()
+        for sym in touched:
+            manifest[sym].update(_tail_stats(tails.get(sym)))
+            manifest[sym]["mtime"] = now_ts
+        os.makedirs(_tf_dir(tf, root), exist_ok=True)
+        _save_manifest(tf, manifest, root)
+
+        # Giới hạn số delta / tháng để đọc không bị chậm dần
+        for month in sorted(set(months)):
+            if len(_delta_files(tf, month, root)) > MAX_DELTA_FILES:
+                compact_month(tf, month, root)
+
+    return len(new_rows)
+
+
+def _tail_stats(df: pd.DataFrame) -> dict:
+    if df is None or df.empty:
+        return {"last_close": None, "vol_avg_5": None, "vol_avg_20": None}
+    vol = df["Volume"]
+    return {
+        "last_close": float(df["Close"].iloc[-1]),
+        "vol_avg_5": float(vol.tail(5).mean()),
+        "vol_avg_20": float(vol.tail(20).mean()),
+    }
+
+
+def rebuild_manifest(timeframe: str, root: str = None) -> dict:
+    """Recompute the whole manifest from parquet (recovery / upgrade of old manifests)."""
+    tf = normalize_tf(timeframe)
+    if not os.path.isdir(_tf_dir(tf, root)):
+        return {}
+    with _store_lock(tf, root):
+        rows = _scan(tf, _list_months(tf, root), ds.scalar(True), root=root)
+        manifest = {}
+        rows = _dedupe(rows)
+        if rows is not None and not rows.empty:
+            now_ts = time.time()
+            for sym, g in rows.groupby("symbol", sort=False):
+                entry = {
+                    "first": g["Date"].iloc[0].isoformat(),
+                    "last": g["Date"].iloc[-1].isoformat(),
+                    "rows": int(len(g)),
+                    "mtime": now_ts,
+                }
+                entry.update(_tail_stats(_to_ohlcv_frame(g.tail(STATS_BARS))))
+                manifest[sym] = entry
+        _save_manifest(tf, manifest, root)
+    return manifest
+
+
+def ensure_manifest_stats(timeframe: str, root: str = None) -> bool:
+    """Rebuild once if any entry predates the current MANIFEST_FIELDS. Return True if rebuilt."""
+    manifest = load_manifest(timeframe, root)
+    if not manifest or all(all(k in e for k in MANIFEST_FIELDS) for e in manifest.values()):
+        return False
+    rebuild_manifest(timeframe, root)
+    return True
+
+
+def write_bars(symbol: str, timeframe: str, df: pd.DataFrame, root: str = None, mode: str = "append") -> int:
+    """Write bars for one symbol (see write_bars_bulk for `mode`)."""
+    return write_bars_bulk({symbol: df}, timeframe, root=root, mode=mode)
+
+
+# =========================
+# READ
+# =========================
+def _months_for_tail(timeframe: str, anchor, tail_n: int, root: str = None) -> list:
+    months = _list_months(timeframe, root)
+    if anchor is not None:
+        months = [m for m in months if m <= _month_key(anchor)]
+    if not tail_n or tail_n <= 0:
+        return months
+    per_month = BARS_PER_MONTH.get(normalize_tf(timeframe), 18)
+    n_months = int(math.ceil(tail_n / per_month)) + 1
+    return months[-n_months:]
+
+
+def _scan(timeframe: str, months: list, symbol_filter, end_date=None, root: str = None) -> pd.DataFrame:
+    flt = symbol_filter
+    if end_date is not None:
+        flt = flt & (ds.field("Date") <= pa.scalar(pd.Timestamp(end_date).to_pydatetime(), type=pa.timestamp("ns")))
+    columns = ["symbol", "Date"] + OHLCV_COLS
+    for attempt in range(2):
+        paths = []
+        for m in months:
+            paths.extend(_month_files(timeframe, m, root))
+        if not paths:
+            return pd.DataFrame()
+        try:
+            tables = []
+            # Fragment giữ thứ tự paths (base trước, delta theo thời điểm ghi) -> `_seg` để nến ghi sau thắng
+            for seg, frag in enumerate(ds.dataset(paths, format="parquet").get_fragments()):
+                t = frag.to_table(columns=columns, filter=flt)
+                if t.num_rows:
+                    tables.append(t.append_column("_seg", pa.array([seg] * t.num_rows, type=pa.int32())))
+            break
+        except (FileNotFoundError, OSError):
+            # Compaction vừa xoá delta giữa lúc liệt kê và đọc -> liệt kê lại
+            if attempt:
+                raise
+    if not tables:
+        return pd.DataFrame()
+    return pa.concat_tables(tables).to_pandas()
+
+
+def _dedupe(rows: pd.DataFrame) -> pd.DataFrame:
+    """Sort by (symbol, Date); the newest segment wins on duplicate keys."""
+    if rows is None or rows.empty:
+        return rows
+    keys = ["symbol", "Date", "_seg"] if "_seg" in rows.columns else ["symbol", "Date"]
+    rows = rows.sort_values(keys, kind="mergesort")
+    rows = rows.drop_duplicates(["symbol", "Date"], keep="last")
+    return rows.drop(columns="_seg", errors="ignore")
+
+
+def _tail_by_symbol(rows: pd.DataFrame, tail_n: int) -> dict:
+    out = {}
+    rows = _dedupe(rows)
+    if rows is None or rows.empty:
+        return out
+    for sym, g in rows.groupby("symbol", sort=False):
+        if tail_n and tail_n > 0:
+            g = g.tail(int(tail_n))
+        out[sym] = _to_ohlcv_frame(g)
+    return out
+
+
+def read_bars(symbol: str, timeframe: str = "1D", tail_n: int = 0, end_date=None, root: str = None) -> pd.DataFrame:
+    """Read one symbol (optionally last `tail_n` bars up to `end_date`). Never calls API."""
+    sym = clean_symbol(symbol)
+    entry = load_manifest(timeframe, root).get(sym)
+    if not entry:
+        return pd.DataFrame()
+    anchor = pd.Timestamp(entry["last"])
+    if end_date is not None:
+        anchor = min(anchor, pd.Timestamp(end_date))
+    flt = ds.field("symbol") == sym
+    rows = _scan(timeframe, _months_for_tail(timeframe, anchor, tail_n, root), flt, end_date, root)
+    df = _tail_by_symbol(rows, tail_n).get(sym, pd.DataFrame())
+    # Cửa sổ tháng không đủ nến (mã ngừng GD, lễ dài...) -> đọc toàn bộ
+    if tail_n and len(df) < int(tail_n) and int(entry.get("rows", 0)) > len(df):
+        rows = _scan(timeframe, _months_for_tail(timeframe, anchor, 0, root), flt, end_date, root)
+        df = _tail_by_symbol(rows, tail_n).get(sym, pd.DataFrame())
+    return df
+
+
+def read_bars_since(since: dict, timeframe: str, root: str = None) -> dict:
+    """{symbol: Timestamp | None} -> {symbol: bars with Date >= since} in one scan (None = full history).
+
+    Months before the earliest `since` are not opened, so an incremental reader
+    (e.g. resample.derive_timeframes) pays for new bars only.
+    """
+    tf = normalize_tf(timeframe)
+    manifest = load_manifest(tf, root)
+    since = {clean_symbol(s): v for s, v in (since or {}).items()}
+    since = {s: v for s, v in since.items() if s in manifest}
+    if not since:
+        return {}
+    months = _list_months(tf, root)
+    if all(v is not None for v in since.values()):
+        lo = _month_key(min(pd.Timestamp(v) for v in since.values()))
+        months = [m for m in months if m >= lo]
+    rows = _dedupe(_scan(tf, months, ds.field("symbol").isin(sorted(since)), root=root))
+    out = {}
+    if rows is None or rows.empty:
+        return out
+    for sym, g in rows.groupby("symbol", sort=False):
+        if since[sym] is not None:
+            g = g[g["Date"] >= pd.Timestamp(since[sym])]
+        if not g.empty:
+            out[sym] = _to_ohlcv_frame(g)
+    return out
+
+
+def read_bars_bulk(symbols, timeframe: str = "1D", tail_n: int = 300, end_date=None, root: str = None) -> dict:
+    """Read the last `tail_n` bars of many symbols in one dataset scan.
+
+    Return {symbol: OHLCV DataFrame}; symbols absent from the store are omitted.
+    """
+    manifest = load_manifest(timeframe, root)
+    syms = sorted({clean_symbol(s) for s in (symbols or [])} & set(manifest))
+    if not syms:
+        return {}
+    anchor = max(pd.Timestamp(manifest[s]["last"]) for s in syms)
+    if end_date is not None:
+        anchor = min(anchor, pd.Timestamp(end_date))
+    rows = _scan(timeframe, _months_for_tail(timeframe, anchor, tail_n, root),
+                 ds.field("symbol").isin(syms), end_date, root)
+    out = _tail_by_symbol(rows, tail_n)
+
+    if tail_n:
+        for s in syms:
+            have = len(out.get(s, ()))
+            if have < int(tail_n) and int(manifest[s].get("rows", 0)) > have:
+                df = read_bars(s, timeframe, tail_n=tail_n, end_date=end_date, root=root)
+                if not df.empty:
+                    out[s] = df
+    return out
+
+
+# =========================
+# LEGACY ({SYM}_{TF}.parquet) MIGRATION
+# =========================
+def legacy_path(symbol: str, timeframe: str, cache_dir: str = None) -> str:
+    return os.path.join(cache_dir or CACHE_DIR, f"{clean_symbol(symbol)}_{timeframe}.parquet")
+
+
+def _read_legacy(path: str) -> pd.DataFrame:
+    df = pd.read_parquet(path)
+    if df is None or df.empty:
+        return pd.DataFrame()
+    if "Date" in df.columns:
+        df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
+        df = df.set_index("Date")
+    return df
+
+
+def import_legacy_file(symbol: str, timeframe: str, cache_dir: str = None, root: str = None) -> bool:
+    """Move one legacy per-symbol parquet into the store (file is archived to data_cache/legacy)."""
+    path = legacy_path(symbol, timeframe, cache_dir)
+    if not os.path.exists(path):
+        return False
+    try:
+        n = write_bars(symbol, timeframe, _read_legacy(path), root=root, mode="upsert")
+    except Exception:
+        return False
+    try:
+        os.makedirs(LEGACY_DIR, exist_ok=True)
+        os.replace(path, os.path.join(LEGACY_DIR, os.path.basename(path)))
+    except Exception:
+        pass
+    return n > 0
+
+
+def migrate_legacy_cache(timeframes=("1D", "1H", "15m"), cache_dir: str = None, root: str = None) -> int:
+    """Import every legacy `{SYM}_{TF}.parquet` in bulk (one rewrite per month). Return files migrated."""
+    cache_dir = cache_dir or CACHE_DIR
+    migrated = 0
+    for tf in timeframes:
+        paths = glob.glob(os.path.join(cache_dir, f"*_{tf}.parquet"))
+        if not paths:
+            continue
+        frames = {}
+        for p in paths:
+            sym = os.path.basename(p)[: -len(f"_{tf}.parquet")]
+            try:
+                frames[sym] = _read_legacy(p)
+            except Exception:
+                continue
+        if not frames:
+            continue
+        write_bars_bulk(frames, tf, root=root, mode="upsert")
+        compact_store(tf, root=root)
+        os.makedirs(LEGACY_DIR, exist_ok=True)
+        for sym in frames:
+            try:
+                os.replace(legacy_path(sym, tf, cache_dir), os.path.join(LEGACY_DIR, f"{sym}_{tf}.parquet"))
+                migrated += 1
+            except Exception:
+                pass
+    return migrated
@@ -0,0 +1,119 @@
+# perf.py - ĐO THỜI GIAN TỪNG STAGE (NHẸ, THREAD-LOCAL)
+"""Hot-path stage timers and counters.
+
+Instrumented code wraps a stage in ``with perf.stage("name"):`` (or bumps
+``perf.count("name")``). Nothing is recorded unless a collector is active on
+the current thread, so the cost outside a scan is one thread-local lookup::
+
+    with perf.collect() as rec:
+        scan_symbol("FPT")
+    rec.as_dict()  # {"stages": {name: {count, total_s, max_s}}, "counters": {...}}
+
+Recorders are plain data (as_dict / merge), so per-symbol timings can come
+back from thread or process workers and be summed per scan.
+"""
+import time
+import functools
+import threading
+from contextlib import contextmanager
+
+_local = threading.local()
+
+
+class Recorder:
+    def __init__(self):
+        self.stages = {}    # name -> [count, total_s, max_s]
+        self.counters = {}  # name -> int
+
+    def add(self, name: str, seconds: float):
+        s = self.stages.get(name)
+        if s is None:
+            self.stages[name] = [1, seconds, seconds]
+        else:
+            s[0] += 1
+            s[1] += seconds
+            if seconds > s[2]:
+                s[2] = seconds
+
+    def bump(self, name: str, n: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def merge(self, other):
+        """Cộng dồn Recorder hoặc dict từ as_dict()."""
+        if isinstance(other, Recorder):
+            other = other.as_dict()
+        for name, st in (other or {}).get("stages", {}).items():
+            s = self.stages.get(name)
+            if s is None:
+                self.stages[name] = [st["count"], st["total_s"], st["max_s"]]
+            else:
+                s[0] += st["count"]
+                s[1] += st["total_s"]
+                s[2] = max(s[2], st["max_s"])
+        for name, n in (other or {}).get("counters", {}).items():
+            self.bump(name, n)
+        return self
+
+    def total(self, prefix: str = "") -> float:
+        return sum(s[1] for name, s in self.stages.items() if name.startswith(prefix))
+
+    def as_dict(self) -> dict:
+        return {
+            "stages": {name: {"count": s[0], "total_s": s[1], "max_s": s[2]} for name, s in self.stages.items()},
+            "counters": dict(self.counters),
+        }
+
+
+def current():
+    return getattr(_local, "rec", None)
+
+
+@contextmanager
+def collect(rec: Recorder = None):
+    """
+    Bật thu thập trên thread hiện tại. Lồng nhau: recorder trong che recorder ngoài,
+    khi thoát thì khôi phục recorder ngoài (muốn cộng dồn thì caller tự merge).
+    """
+    rec = rec if rec is not None else Recorder()
+    prev = getattr(_local, "rec", None)
+    _local.rec = rec
+    try:
+        yield rec
+    finally:
+        _local.rec = prev
+
+
+@contextmanager
+def stage(name: str):
+    rec = getattr(_local, "rec", None)
+    if rec is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        rec.add(name, time.perf_counter() - t0)
+
+
+def count(name: str, n: int = 1):
+    rec = getattr(_local, "rec", None)
+    if rec is not None:
+        rec.bump(name, n)
+
+
+def timed(name: str):
+    """Decorator: cả hàm là 1 stage."""
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            rec = getattr(_local, "rec", None)
+            if rec is None:
+                return fn(*args, **kwargs)
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                rec.add(name, time.perf_counter() - t0)
+        return wrapper
+    return deco
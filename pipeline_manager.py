@@ -1,15 +1,23 @@
 # src/pipeline_manager.py
 import os
-import time
-import math
 import pandas as pd
+import asyncio
 import concurrent.futures
 from datetime import datetime, timedelta, date
-from config import now_vn
+from config import now_vn, WATCHLIST, POSITIONS
+from fetch_engine import FetchEngine, run_sync
+from source_router import ROUTER
+from resample import DERIVED_TF, derive_timeframes
+from trading_calendar import last_trading_day, expected_last_bar, shift_trading_days
+from update_queue import UpdateQueue, prioritize, TIER_NAMES
+from ohlcv_store import (
+    write_bars, write_bars_bulk, load_manifest, clean_symbol, ensure_manifest_stats, migrate_legacy_cache,
+    compact_store, start_background_compaction,
+)
 
 # --- ĐỊNH NGHĨA ĐƯỜNG DẪN TUYỆT ĐỐI ---
 BASE_DIR = os.path.dirname(os.path.abspath(__file__)) 
-CACHE_DIR = os.path.join(BASE_DIR, "data_cache")      
+CACHE_DIR = os.environ.get("DATA_CACHE_DIR") or os.path.join(BASE_DIR, "data_cache")  # env: chạy trên cache khác (benchmark)
 
 if not os.path.exists(CACHE_DIR):
     os.makedirs(CACHE_DIR)
@@ -59,141 +67,199 @@ class SimpleScheduler:
                 pass 
         return "Xong"
 
-Scheduler = SimpleScheduler
+    def run_batched(self, tickers, fetcher_kwargs, exporter_kwargs, chunk_size=50):
+        """
+        Tải nhiều mã / request (VCI gap-chart) rồi ghi 1 lần vào store cho mỗi chunk.
+        Mã không có trong response batch -> chạy lại từng mã qua run() như cũ.
+        Return list mã phải fallback.
+        """
+        tickers = list(tickers)
+        done = set()
+        for i in range(0, len(tickers), chunk_size):
+            chunk = tickers[i : i + chunk_size]
+            try:
+                frames = self.fetcher._vn_call_batch(chunk, chunk_size=chunk_size, **fetcher_kwargs)
+            except Exception as e:
+                print(f"   ⚠️ Batch {chunk[0]}..{chunk[-1]} lỗi: {e}")
+                continue
+            if frames:
+                self.exporter.export_bulk(frames, **exporter_kwargs)
+                done.update(frames)
+
+        missing = [t for t in tickers if t not in done]
+        if missing:
+            print(f"   ↪️ {len(missing)} mã không có trong batch -> tải từng mã")
+            self.run(missing, fetcher_kwargs, exporter_kwargs)
+        return missing
+
+
+class AsyncScheduler(SimpleScheduler):
+    """
+    Cùng interface với SimpleScheduler nhưng chạy trên FetchEngine (asyncio):
+    mỗi request đi qua token bucket + concurrency thích ứng của nguồn (vci/tcbs/vnd),
+    bị 429/5xx thì tự giảm tốc và retry -> không cần time.sleep cố định giữa các batch.
+    """
+    def __init__(self, fetcher, exporter, max_workers=10, engine=None):
+        super().__init__(fetcher, exporter, max_workers=max_workers)
+        self.engine = engine or FetchEngine(max_threads=max(8, int(max_workers) * 2))
+
+    async def _fetch_one(self, ticker, f_kwargs, e_kwargs):
+        """
+        Từng mã: nguồn khoẻ nhất trước (ROUTER), chậm quá tail latency thì hedge sang nguồn kế;
+        mỗi lần gọi vẫn tính vào rate limit của đúng nguồn đó.
+        """
+        def _via(src, on_start):
+            return self.engine.call(src, self.fetcher._vn_call_source, ticker, src, on_start=on_start, **f_kwargs)
+
+        _, df = await ROUTER.acall(f"history:{f_kwargs.get('interval', '1D')}", self.fetcher.SOURCES, _via)
+        if df is None:
+            return False
+        await self.engine.offload(self.exporter.export, df, ticker, **e_kwargs)
+        return True
+
+    async def _fetch_chunk(self, chunk, f_kwargs, e_kwargs, chunk_size):
+        try:
+            frames = await self.engine.call("vci", self.fetcher._vn_call_batch, chunk, chunk_size=chunk_size, **f_kwargs)
+        except Exception as e:
+            print(f"   ⚠️ Batch {chunk[0]}..{chunk[-1]} lỗi: {e}")
+            return set()
+        if frames:
+            await self.engine.offload(self.exporter.export_bulk, frames, **e_kwargs)
+        return set(frames or {})
+
+    async def _run_job(self, tickers, f_kwargs, e_kwargs, chunk_size=None):
+        tickers = list(tickers)
+        if not chunk_size:
+            await asyncio.gather(*(self._fetch_one(t, f_kwargs, e_kwargs) for t in tickers))
+            return []
+        chunks = [tickers[i : i + chunk_size] for i in range(0, len(tickers), chunk_size)]
+        done = set().union(*await asyncio.gather(*(self._fetch_chunk(c, f_kwargs, e_kwargs, chunk_size) for c in chunks)))
+        missing = [t for t in tickers if t not in done]
+        if missing:
+            print(f"   ↪️ [{f_kwargs.get('interval', '1D')}] {len(missing)} mã không có trong batch -> tải từng mã")
+            await asyncio.gather(*(self._fetch_one(t, f_kwargs, e_kwargs) for t in missing))
+        return missing
+
+    def run(self, tickers, fetcher_kwargs, exporter_kwargs):
+        run_sync(self._run_job(tickers, fetcher_kwargs, exporter_kwargs))
+        return "Xong"
+
+    def run_batched(self, tickers, fetcher_kwargs, exporter_kwargs, chunk_size=50):
+        return run_sync(self._run_job(tickers, fetcher_kwargs, exporter_kwargs, chunk_size))
+
+    def run_many(self, jobs, chunk_size=50):
+        """
+        Nhiều job (tickers, fetcher_kwargs, exporter_kwargs) chạy đồng thời trong 1 event loop
+        (vd: 1H và 15m cùng lúc); rate limit theo nguồn vẫn dùng chung. Return list missing / job.
+        """
+        async def _all():
+            return await asyncio.gather(*(self._run_job(t, fk, ek, chunk_size) for t, fk, ek in jobs))
+        return run_sync(_all())
+
+Scheduler = AsyncScheduler
 
 # ==============================================================================
 # 3. CẤU HÌNH PIPELINE
 # ==============================================================================
+VCI_BATCH_SIZE = 50  # số mã / 1 request gap-chart (history_batch)
 
 class AppCacheFetcher(VNFetcher):
+    SOURCES = ['tcbs', 'vnd', 'vci']
+
+    def _vn_call_source(self, ticker: str, src: str, **kwargs) -> pd.DataFrame:
+        """1 lần gọi 1 nguồn; lỗi được raise để engine phân biệt throttle (429/5xx) với lỗi thường."""
+        from vnstock_data import Quote
+
+        quote = Quote(source=src, symbol=ticker)
+        df = quote.history(start=kwargs.get('start'), end=kwargs.get('end'), interval=kwargs.get('interval', '1D'))
+        if df is None or df.empty:
+            return pd.DataFrame()
+        df = df.rename(columns={
+            'time': 'Date', 'open': 'Open', 'high': 'High', 
+            'low': 'Low', 'close': 'Close', 'volume': 'Volume'
+        })
+        if 'Date' in df.columns:
+            df['Date'] = pd.to_datetime(df['Date'])
+            df = df.set_index('Date')
+        return df
+
     def _vn_call(self, ticker: str, **kwargs) -> pd.DataFrame:
+        _, df = ROUTER.call(
+            f"history:{kwargs.get('interval', '1D')}", self.SOURCES,
+            lambda src: self._vn_call_source(ticker, src, **kwargs),
+        )
+        return df if df is not None else pd.DataFrame()
+
+    def _vn_call_batch(self, tickers, chunk_size: int = 50, **kwargs) -> dict:
+        """Nhiều mã / 1 request VCI (gap-chart nhận list symbols). Return {ticker: df}."""
         try:
-            from vnstock_data import Quote
+            from vnstock_data.explorer.vci.quote import history_batch
         except Exception:
-            return pd.DataFrame()
-            
-        start = kwargs.get('start')
-        end = kwargs.get('end')
-        interval = kwargs.get('interval', '1D') 
-        
-        sources = ['tcbs', 'vnd', 'vci']
-        for src in sources:
-            try:
-                quote = Quote(source=src, symbol=ticker)
-                df = quote.history(start=start, end=end, interval=interval)
-                if df is not None and not df.empty:
-                    df = df.rename(columns={
-                        'time': 'Date', 'open': 'Open', 'high': 'High', 
-                        'low': 'Low', 'close': 'Close', 'volume': 'Volume'
-                    })
-                    if 'Date' in df.columns:
-                        df['Date'] = pd.to_datetime(df['Date'])
-                        df = df.set_index('Date')
-                    return df
-            except:
-                continue
-        return pd.DataFrame()
+            return {}
+
+        frames = history_batch(
+            tickers, start=kwargs.get('start'), end=kwargs.get('end'),
+            interval=kwargs.get('interval', '1D'), chunk_size=chunk_size,
+        )
+        out = {}
+        for ticker, df in frames.items():
+            df = df.rename(columns={
+                'time': 'Date', 'open': 'Open', 'high': 'High', 
+                'low': 'Low', 'close': 'Close', 'volume': 'Volume'
+            })
+            if 'Date' in df.columns:
+                df['Date'] = pd.to_datetime(df['Date'])
+                df = df.set_index('Date')
+            if not df.empty:
+                out[ticker] = df
+        return out
 
 class ParquetCacheExporter(Exporter):
+    """Ghi vào columnar store (data_cache/store/{TF}) thay vì 1 file parquet/mã.
+
+    Append-only: chỉ nến mới (và nến cuối đang chạy) được ghi thành delta segment,
+    không đọc/ghi lại lịch sử cũ.
+    """
     def export(self, data: pd.DataFrame, ticker: str, **kwargs):
+        interval = kwargs.get('interval', '1D')
         output_dir = kwargs.get('output_dir', CACHE_DIR)
-        interval = kwargs.get('interval', '1D') 
-        file_path = os.path.join(output_dir, f"{ticker}_{interval}.parquet")
-        
-        if os.path.exists(file_path):
-            try:
-                df_old = pd.read_parquet(file_path)
-                data = pd.concat([df_old, data])
-                data = data[~data.index.duplicated(keep='last')]
-                data = data.sort_index()
-            except: pass
-            
-        data.to_parquet(file_path)
+        root = None if output_dir == CACHE_DIR else os.path.join(output_dir, "store")
+        write_bars(ticker, interval, data, root=root)
+
+    def export_bulk(self, frames: dict, **kwargs):
+        """Cả batch {ticker: df} -> 1 delta segment / tháng (thay vì 1 lần ghi / mã)."""
+        interval = kwargs.get('interval', '1D')
+        output_dir = kwargs.get('output_dir', CACHE_DIR)
+        root = None if output_dir == CACHE_DIR else os.path.join(output_dir, "store")
+        write_bars_bulk(frames, interval, root=root)
 
 # ==============================================================================
 # 4. LOGIC TÍNH NGÀY GIAO DỊCH THÔNG MINH (HỖ TRỢ KHOẢNG THỜI GIAN)
 # ==============================================================================
 def get_last_trading_date():
     """
-    Tìm ngày giao dịch gần nhất (Trừ lễ tết, cuối tuần).
+    Tìm ngày giao dịch gần nhất đã chốt nến (Trừ lễ tết, cuối tuần, trước 15:15 hôm nay).
+    Lịch nghỉ lễ: trading_calendar.HOLIDAY_RANGES.
     """
-    candidate = now_vn()
-    
-    # -----------------------------------------------------------
-    # CẤU HÌNH LỊCH NGHỈ LỄ (CẬP NHẬT TẠI ĐÂY)
-    # -----------------------------------------------------------
-    
-    # 1. Ngày lễ cố định (Dương lịch) - Chỉ cần MM-DD
-    FIXED_HOLIDAYS_MMDD = ["01-01", "04-30", "05-01", "09-02"]
-    
-    # 2. Khoảng thời gian nghỉ dài (Tết, Giỗ tổ...) - Format: ("YYYY-MM-DD", "YYYY-MM-DD")
-    # Ví dụ: Tết Ất Tỵ nghỉ từ 25/01 đến hết 02/02/2025
-    HOLIDAY_RANGES = [
-        ("2026-01-01", "2026-01-04"), # Tết Dương
-        ("2026-02-14", "2026-02-22"), # Tết Âm
-        ("2026-04-25", "2026-04-27"), # Giỗ tổ
-        ("2026-04-30", "2026-05-03"), # 30/4
-        ("2026-08-29", "2026-09-02"), # 2/9
-    ]
-    # -----------------------------------------------------------
+    return last_trading_day(now_vn(), complete=True)
 
-    while True:
-        candidate_str = candidate.strftime('%Y-%m-%d')
-        mm_dd = candidate.strftime('%m-%d')
-
-        # 1. Check Giờ Giao Dịch (Nếu là Hôm nay)
-        if candidate.date() == now_vn().date():
-            if candidate.hour < 15 or (candidate.hour == 15 and candidate.minute < 15):
-                candidate -= timedelta(days=1)
-                continue
-
-        # 2. Check Cuối Tuần (T7, CN)
-        if candidate.weekday() >= 5:
-            candidate -= timedelta(days=1)
-            continue
-
-        # 3. Check Ngày Lễ Cố Định (01/01, 30/04...)
-        if mm_dd in FIXED_HOLIDAYS_MMDD:
-            candidate -= timedelta(days=1)
-            continue
-            
-        # 4. Check Khoảng Nghỉ Lễ (Range)
-        is_in_range = False
-        for start_str, end_str in HOLIDAY_RANGES:
-            if start_str <= candidate_str <= end_str:
-                is_in_range = True
-                break
-        
-        if is_in_range:
-            candidate -= timedelta(days=1)
-            continue
-
-        # Nếu không dính điều kiện nào -> Đây là ngày giao dịch
-        return candidate.date()
-
-def filter_uptodate_tickers(tickers, interval, target_date_obj):
-    """Lọc bỏ mã đã có dữ liệu mới nhất"""
+def filter_uptodate_tickers(tickers, interval, target_date_obj=None):
+    """
+    Lọc bỏ mã đã có nến cuối kỳ vọng của `interval` (đọc manifest, không decode parquet).
+    target_date_obj: ngày giao dịch mục tiêu (mặc định: ngày đã chốt gần nhất);
+    intraday phải có tới nến cuối phiên của ngày đó, không chỉ 1 nến bất kỳ.
+    """
+    target = target_date_obj if target_date_obj is not None else get_last_trading_date()
+    expected = expected_last_bar(interval, target, complete=True)
+    manifest = load_manifest(interval)
     needed = []
     skipped = 0
     
     for sym in tickers:
-        file_path = os.path.join(CACHE_DIR, f"{sym}_{interval}.parquet")
-        if not os.path.exists(file_path):
-            needed.append(sym)
-            continue
-            
-        try:
-            df = pd.read_parquet(file_path)
-            if df.empty:
-                needed.append(sym)
-                continue
-            
-            last_date_in_cache = df.index[-1].date()
-            if last_date_in_cache >= target_date_obj:
-                skipped += 1
-            else:
-                needed.append(sym)
-        except:
+        entry = manifest.get(clean_symbol(sym))
+        if entry and entry.get('last') and pd.Timestamp(entry['last']) >= expected:
+            skipped += 1
+        else:
             needed.append(sym)
             
     return needed, skipped
@@ -202,7 +268,28 @@ def filter_uptodate_tickers(tickers, interval, target_date_obj):
 # 5. HÀM CHẠY CHÍNH
 # ==============================================================================
 
-def run_bulk_update(tickers_list, days_back=200):
+# Lọc thanh khoản trước khi tải intraday (giá nghìn đồng, turnover 10 Tỷ)
+MIN_PRICE = 5.0
+MIN_VOL = 50_000
+MIN_TURNOVER = 10_000_000
+
+def is_liquid(entry) -> bool:
+    """Manifest D1 của 1 mã đạt chuẩn thanh khoản (close, KL TB 5 phiên, giá trị GD)."""
+    try:
+        if not entry or int(entry.get('rows', 0)) <= 5:
+            return False
+        close = float(entry['last_close'])
+        vol_avg = float(entry['vol_avg_5'])
+        return close > MIN_PRICE and vol_avg > MIN_VOL and close * vol_avg > MIN_TURNOVER
+    except Exception:
+        return False
+
+def run_bulk_update(tickers_list, days_back=200, watchlist=None, positions=None, on_event=None):
+    """
+    Cập nhật D1 + 15m cho list mã theo thứ tự ưu tiên (update_queue):
+    vị thế/watchlist (mặc định config.POSITIONS/WATCHLIST) -> ứng viên Phase 1 -> phần còn lại.
+    on_event(dict): gọi khi từng mã / từng tier xong (xem update_queue).
+    """
     if not HAS_PIPELINE:
         return "⚠️ Lỗi: Chưa cài đặt thư viện 'vnstock_data'."
         
@@ -218,84 +305,109 @@ def run_bulk_update(tickers_list, days_back=200):
         now = now_vn()
         end_date_api = now.strftime('%Y-%m-%d') 
         start_date_d1 = (now - timedelta(days=days_back)).strftime('%Y-%m-%d')
-        start_date_intra = (now - timedelta(days=4)).strftime('%Y-%m-%d')
+        # 3 phiên gần nhất (không phải 4 ngày lịch: qua Tết/lễ dài sẽ ra khoảng rỗng)
+        start_date_intra = shift_trading_days(target_date, -3).strftime('%Y-%m-%d')
 
         print(f"📅 Ngày giao dịch mục tiêu: {target_date_str} (Hôm nay: {now.strftime('%d/%m %H:%M')})")
 
-        # --- BƯỚC 1: TẢI D1 (CHECK CACHE) ---
+        # Cache cũ dạng {SYM}_{TF}.parquet -> chuyển 1 lần vào columnar store
+        n_migrated = migrate_legacy_cache()
+        if n_migrated:
+            print(f"📦 Đã chuyển {n_migrated} file cache cũ vào store.")
+        ensure_manifest_stats('1D')
+        start_background_compaction(('1D', '15m') + tuple(DERIVED_TF))
+
+        # --- BƯỚC 1: XẾP ƯU TIÊN + CHECK CACHE D1 ---
+        ranked = prioritize(
+            tickers_list,
+            watchlist=WATCHLIST if watchlist is None else watchlist,
+            positions=POSITIONS if positions is None else positions,
+        )
+        tiers = {}
+        for _, tier in ranked:
+            tiers[tier] = tiers.get(tier, 0) + 1
+        print("🎯 Thứ tự cập nhật: " + ", ".join(f"{TIER_NAMES[t]} {n}" for t, n in sorted(tiers.items())))
+
         d1_needed, d1_skipped = filter_uptodate_tickers(tickers_list, '1D', target_date)
-        
         if d1_needed:
             print(f"🔄 [1/3] Cần tải D1 cho {len(d1_needed)} mã (Skip {d1_skipped} mã đã đủ)...")
-            scheduler.run(
-                tickers=d1_needed,
-                fetcher_kwargs={'start': start_date_d1, 'end': end_date_api, 'interval': '1D'},
-                exporter_kwargs={'output_dir': CACHE_DIR, 'interval': '1D'}
-            )
         else:
             print(f"✅ [1/3] D1 đã đủ dữ liệu đến {target_date_str}. Bỏ qua tải.")
 
-        # --- BƯỚC 2: LỌC THANH KHOẢN ---
-        valid_tickers = []
-        min_price = 5.0        
-        min_vol = 50_000       
-        # Turnover 10 Tỷ (đơn vị nghìn đồng)
-        min_val = 10_000_000   
+        # --- BƯỚC 2+3: LỌC THANH KHOẢN (MANIFEST) -> TẢI INTRADAY (CHỈ 15m; 30m/1H/2H DỰNG TỪ 15m) ---
+        # Chạy theo từng nhóm D1 vừa xong, không đợi D1 của cả universe
+        print("🔍 [2/3] Check thanh khoản từ Cache (manifest) ngay khi D1 của mã đã vào store...")
+        liquid = []
+        intra_needed = []
 
-        print("🔍 [2/3] Check thanh khoản từ Cache...")
-        for sym in tickers_list:
-            try:
-                path = os.path.join(CACHE_DIR, f"{sym}_1D.parquet")
-                if os.path.exists(path):
-                    df = pd.read_parquet(path)
-                    if len(df) > 5:
-                        last = df.iloc[-1]
-                        
-                        close = float(last['Close'])
-                        vol_avg = float(df['Volume'].tail(5).mean())
-                        turnover = close * vol_avg
-                        
-                        if close > min_price and vol_avg > min_vol and turnover > min_val:
-                            valid_tickers.append(sym)
-            except: continue
-        
-        print(f"✅ Đã lọc: {len(valid_tickers)}/{len(tickers_list)} mã đạt chuẩn > 10 Tỷ.")
+        def _needs_intraday(symbols):
+            manifest = load_manifest('1D')
+            ok = [s for s in symbols if is_liquid(manifest.get(s))]
+            liquid.extend(ok)
+            needed, _ = filter_uptodate_tickers(ok, '15m', target_date)
+            intra_needed.extend(needed)
+            return needed
 
-        # --- BƯỚC 3: TẢI INTRADAY (BATCHING + CHECK CACHE) ---
-        if valid_tickers:
-            h1_needed, h1_skipped = filter_uptodate_tickers(valid_tickers, '1H', target_date)
-            
-            if h1_needed:
-                BATCH_SIZE = 20 
-                total = len(h1_needed)
-                num_batches = math.ceil(total / BATCH_SIZE)
-                
-                print(f"🔄 [3/3] Cần tải Intraday cho {total} mã (Skip {len(valid_tickers) - total} mã)...")
-
-                for i in range(0, total, BATCH_SIZE):
-                    batch = h1_needed[i : i + BATCH_SIZE]
-                    print(f"   📦 Batch {(i//BATCH_SIZE)+1}/{num_batches}: Tải {len(batch)} mã...")
-                    
-                    scheduler.run(batch, 
-                        {'start': start_date_intra, 'end': end_date_api, 'interval': '1H'}, 
-                        {'output_dir': CACHE_DIR, 'interval': '1H'})
-                    
-                    scheduler.run(batch, 
-                        {'start': start_date_intra, 'end': end_date_api, 'interval': '15m'}, 
-                        {'output_dir': CACHE_DIR, 'interval': '15m'})
-
-                    if i + BATCH_SIZE < total:
-                        print("   zzz Nghỉ 10s...") 
-                        time.sleep(10)
-            else:
-                print(f"✅ [3/3] Intraday đã đủ dữ liệu đến {target_date_str}. Bỏ qua tải.")
+        queue = UpdateQueue(
+            scheduler,
+            d1_kwargs={'start': start_date_d1, 'end': end_date_api, 'interval': '1D'},
+            intra_kwargs={'start': start_date_intra, 'end': end_date_api, 'interval': '15m'},
+            exporter_kwargs={'output_dir': CACHE_DIR},
+            needs_intraday=_needs_intraday,
+            on_event=on_event,
+            chunk_size=VCI_BATCH_SIZE,
+        )
+        q_stats = queue.run(ranked, d1_needed)
+
+        print(f"✅ Đã lọc: {len(liquid)}/{len(tickers_list)} mã đạt chuẩn > 10 Tỷ.")
+        if intra_needed:
+            print(f"🔄 [3/3] Đã tải Intraday cho {len(intra_needed)} mã (Skip {len(liquid) - len(intra_needed)} mã).")
+        elif liquid:
+            print(f"✅ [3/3] Intraday đã đủ dữ liệu đến {target_date_str}. Bỏ qua tải.")
         else:
             print("⚠️ Không có mã nào đạt chuẩn thanh khoản.")
+        print(f"🧵 Update queue: {q_stats}")
+
+        # Khung dựng (30m/1H/2H từ 15m, 1W/1M từ D1): chỉ mã có nến nguồn mới
+        derived = derive_timeframes(tickers_list)
+        print(f"🧱 Dựng khung từ store: {derived}")
 
-        return f"✅ Hoàn tất! (D1 mới: {len(d1_needed)}, Intra mới: {len(h1_needed)})"
+        print(f"📶 Fetch engine: {scheduler.engine.stats()}")
+        print(f"🧭 Source router: {ROUTER.snapshot()}")
+
+        # Gộp delta segment của lần update này để lượt scan sau đọc ít file nhất
+        for tf in ('1D', '15m') + tuple(DERIVED_TF):
+            compact_store(tf)
+
+        return f"✅ Hoàn tất! (D1 mới: {len(d1_needed)}, Intra mới: {len(intra_needed)})"
         
     except Exception as e:
         return f"❌ Lỗi Runtime: {str(e)}"
 
+def stream_bulk_update(tickers_list, days_back=200, watchlist=None, positions=None):
+    """
+    run_bulk_update ở thread nền, yield event ngay khi có (mã/tier xong),
+    cuối cùng yield {"event": "done", "result": <chuỗi kết quả>}.
+    """
+    import queue as _queue
+    import threading
+
+    events = _queue.Queue()
+    out = {}
+
+    def _runner():
+        try:
+            out["result"] = run_bulk_update(tickers_list, days_back, watchlist, positions, on_event=events.put)
+        finally:
+            events.put(None)
+
+    threading.Thread(target=_runner, daemon=True, name="bulk-update").start()
+    while True:
+        ev = events.get()
+        if ev is None:
+            break
+        yield ev
+    yield {"event": "done", "result": out.get("result", "❌ Lỗi Runtime: update dừng bất thường")}
+
 def run_universe_pipeline(universe_list, days=20):
     return run_bulk_update(universe_list, days_back=days)
\ No newline at end of file
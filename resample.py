@@ -0,0 +1,97 @@
+# resample.py - DỰNG KHUNG 30m/1H/2H/1W/1M TỪ KHUNG NHỎ NHẤT TRONG STORE
+"""Derived timeframes, built locally instead of being fetched.
+
+Only the finest timeframe is downloaded (15m intraday, 1D daily); the rest is
+aggregated from the store (open=first, high=max, low=min, close=last,
+volume=sum) and written back as ordinary store timeframes, so readers
+(data.load_data_with_cache, scanner) do not change.
+
+Intraday buckets follow the HOSE session, labelled by bucket start:
+
+- morning 09:00-11:30 and afternoon 13:00-14:45 are anchored separately, so no
+  bar spans the lunch break (2H -> 09:00, 11:00 (half bar), 13:00),
+- ATC (14:30-14:45) and the closing print fold into the last afternoon bucket,
+- stray prints outside the session are clamped into the nearest session.
+
+1W is labelled by Monday, 1M by the 1st of the month. Bucketing lives in
+trading_calendar.bar_starts so freshness checks use the same labels.
+
+``derive_timeframes()`` is incremental: per symbol it re-reads the source only
+from the last derived bucket (which may have been partial) and skips symbols
+whose source has not been written since the last derivation.
+"""
+import numpy as np
+import pandas as pd
+
+from trading_calendar import bar_starts
+from ohlcv_store import (
+    OHLCV_COLS, normalize_tf, clean_symbol, load_manifest, read_bars_since, write_bars_bulk,
+)
+
+# Khung dựng -> khung nguồn (nhỏ nhất được tải về)
+DERIVED_TF = {"30m": "15m", "1H": "15m", "2H": "15m", "1W": "1D", "1M": "1D"}
+
+
+def source_tf(timeframe: str):
+    """Khung nguồn của 1 khung dựng (None nếu khung được tải trực tiếp)."""
+    return DERIVED_TF.get(normalize_tf(timeframe))
+
+
+def resample_bars(df: pd.DataFrame, timeframe: str) -> pd.DataFrame:
+    """OHLCV (DatetimeIndex, khung nhỏ) -> OHLCV khung `timeframe` (30m/1H/2H/1W/1M)."""
+    tf = normalize_tf(timeframe)
+    if tf not in DERIVED_TF:
+        raise ValueError(f"Không dựng được khung {timeframe!r} (hỗ trợ: {', '.join(DERIVED_TF)})")
+    if df is None or df.empty:
+        return pd.DataFrame(columns=OHLCV_COLS)
+    if not df.index.is_monotonic_increasing:
+        df = df.sort_index()
+
+    keys = bar_starts(df.index, tf)
+    first = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    last = np.r_[first[1:] - 1, len(keys) - 1]
+    cols = {c: df[c].to_numpy(dtype="float64") for c in OHLCV_COLS}
+    out = pd.DataFrame(
+        {
+            "Open": cols["Open"][first],
+            "High": np.fmax.reduceat(cols["High"], first),
+            "Low": np.fmin.reduceat(cols["Low"], first),
+            "Close": cols["Close"][last],
+            "Volume": np.add.reduceat(np.nan_to_num(cols["Volume"]), first),
+        },
+        index=pd.DatetimeIndex(keys[first], name="Date"),
+    )
+    return out
+
+
+def derive_timeframes(symbols=None, timeframes=None, root: str = None) -> dict:
+    """
+    Cập nhật các khung dựng trong store từ khung nguồn. symbols=None -> mọi mã có trong khung nguồn.
+    Return {timeframe: số nến đã ghi}.
+    """
+    written = {}
+    for tf in [normalize_tf(t) for t in (timeframes or DERIVED_TF)]:
+        src_tf = DERIVED_TF[tf]
+        src_manifest = load_manifest(src_tf, root)
+        dst_manifest = load_manifest(tf, root)
+        syms = set(src_manifest) if symbols is None else {clean_symbol(s) for s in symbols} & set(src_manifest)
+
+        since = {}
+        for sym in syms:
+            entry = dst_manifest.get(sym)
+            if entry and entry.get("last"):
+                # Nguồn chưa ghi gì từ lần dựng trước -> bỏ qua
+                if float(entry.get("mtime") or 0) >= float(src_manifest[sym].get("mtime") or 0):
+                    continue
+                since[sym] = pd.Timestamp(entry["last"])  # bucket cuối có thể còn dở -> dựng lại
+            else:
+                since[sym] = None
+
+        frames = {}
+        if since:
+            for sym, df in read_bars_since(since, src_tf, root).items():
+                bars = resample_bars(df, tf)
+                if not bars.empty:
+                    frames[sym] = bars
+        written[tf] = write_bars_bulk(frames, tf, root=root) if frames else 0
+    return written
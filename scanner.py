@@ -1,23 +1,50 @@
 # scanner.py
+import os
 import pandas as pd
 import numpy as np
 from datetime import datetime
-from config import now_vn, TELEGRAM_KILLZONE_ONLY, TELEGRAM_ALERT_SCORE_MIN, KILLZONE_WINDOWS
+from config import now_vn, TELEGRAM_KILLZONE_ONLY, TELEGRAM_ALERT_SCORE_MIN, KILLZONE_WINDOWS, SCAN_EXECUTOR, SCAN_COPY_FREE
 from data import load_data_with_cache
 from data import read_cache_fast  # cache-only reader for Phase 1
+from data import read_cache_bulk  # 1 store scan cho cả universe (Phase 1)
+from trading_calendar import expected_last_bar
+from update_queue import save_phase1_scores
 from smc_core import (
     ensure_smc_columns,
+    smc_frame,
+    smc_context,
     detect_entry_models,
+    detect_entry_models_batch,
+    batch_context,
+    stack_ohlcv,
+    batch_ema,
+    OHLCV_COLS,
     detect_liquidity_sweep,
     calculate_advanced_score
 )
 from indicators import detect_price_action
+import perf
 
 
 def ema(series: pd.Series, span: int = 50) -> pd.Series:
     return series.ewm(span=span, adjust=False).mean()
 
 
+def _scan_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Frame làm việc do scanner sở hữu (SCAN_COPY_FREE): OHLCV float64 trong 1 block liền
+    + Swing_High/Swing_Low tính sẵn. Đây là lần copy duy nhất từ frame nạp về; các bước sau
+    (EMA, PA) ghi thẳng vào frame này, detector SMC chỉ đọc view của nó.
+    """
+    if df is None or df.empty or not set(OHLCV_COLS).issubset(df.columns):
+        return ensure_smc_columns(df)
+    block = np.empty((len(df), len(OHLCV_COLS)), dtype=float)
+    for j, c in enumerate(OHLCV_COLS):
+        block[:, j] = df[c].to_numpy(dtype=float)
+    out = pd.DataFrame(block, index=df.index, columns=list(OHLCV_COLS), copy=False)
+    return ensure_smc_columns(out, copy=False)
+
+
 def _parse_hhmm(s: str) -> int:
     h, m = s.split(":")
     return int(h) * 60 + int(m)
@@ -74,12 +101,19 @@ def check_candlestick_signal(df, trend_side):
 # ==============================================================================
 # 2. LOGIC CHIẾN THUẬT: SMART TIMEFRAME (AN TOÀN HƠN)
 # ==============================================================================
-def strategy_smart_timeframe(symbol, d1_side, df_htf=None, end_date=None):
+def _ltf_plan(hour: int):
+    """Khung LTF dùng để confirm theo giờ: sáng 1H/20 ngày, chiều 15m/5 ngày."""
+    return ("1H", 20) if hour < 11 else ("15m", 5)
+
+
+def strategy_smart_timeframe(symbol, d1_side, df_htf=None, end_date=None, ctx_htf=None, allow_fetch=True):
     """
     LTF confirm (backtest-safe):
     - Load LTF theo end_date để không look-ahead
     - Confirm SMC trước, nếu chưa thì confirm PA
     - FIX lỗi NoneType * float: robust parse zone (y0/y1, low/high, bottom/top) + fallback SL
+    - ctx_htf: SMCContext của df_htf (từ scan_symbol) để không tính lại artifact D1
+    - allow_fetch=False: chỉ đọc store (worker process, dữ liệu đã được process cha làm mới)
     """
     if end_date is not None:
         current_hour = end_date.hour
@@ -92,19 +126,21 @@ def strategy_smart_timeframe(symbol, d1_side, df_htf=None, end_date=None):
     refined_entry = None
     refined_sl = None
 
-    df_htf = ensure_smc_columns(df_htf) if df_htf is not None and not df_htf.empty else None
+    df_htf = smc_frame(df_htf) if df_htf is not None and not df_htf.empty else None
+    ctx_htf = ctx_htf if ctx_htf is not None else smc_context(df_htf)
 
     try:
-        tf = "1H" if current_hour < 11 else "15m"
-        days = 20 if current_hour < 11 else 5
+        tf, days = _ltf_plan(current_hour)
 
-        df_ltf_raw = load_data_with_cache(symbol, days_to_load=days, timeframe=tf, end_date=end_date)
+        with perf.stage("ltf.load"):
+            df_ltf_raw = load_data_with_cache(symbol, days_to_load=days, timeframe=tf, end_date=end_date,
+                                              allow_fetch=allow_fetch, compute_indicators=False)
 
         if df_ltf_raw is not None and not df_ltf_raw.empty:
-            df_ltf = ensure_smc_columns(df_ltf_raw)
-
             # 1) KIỂM TRA SMC MODEL TRÊN KHUNG NHỎ
-            entry_ltf = detect_entry_models(df_htf=df_htf, df_ltf=df_ltf) if df_htf is not None else None
+            with perf.stage("ltf.smc"):
+                df_ltf = _scan_frame(df_ltf_raw) if SCAN_COPY_FREE else ensure_smc_columns(df_ltf_raw)
+                entry_ltf = detect_entry_models(df_htf=df_htf, df_ltf=df_ltf, ctx=ctx_htf) if df_htf is not None else None
 
             if entry_ltf and entry_ltf.get("entry") == d1_side:
                 is_confirmed = True
@@ -140,8 +176,9 @@ def strategy_smart_timeframe(symbol, d1_side, df_htf=None, end_date=None):
 
             # 2) KIỂM TRA PRICE ACTION NẾU SMC CHƯA XÁC NHẬN
             if not is_confirmed:
-                df_ltf_pa = detect_price_action(df_ltf)
-                has_sig, name, sl_pa = check_candlestick_signal(df_ltf_pa, d1_side)
+                with perf.stage("ltf.pa"):
+                    df_ltf_pa = detect_price_action(df_ltf, copy=not SCAN_COPY_FREE)
+                    has_sig, name, sl_pa = check_candlestick_signal(df_ltf_pa, d1_side)
 
                 if has_sig:
                     is_confirmed = True
@@ -166,17 +203,21 @@ def strategy_smart_timeframe(symbol, d1_side, df_htf=None, end_date=None):
 # ==============================================================================
 # 3. HÀM SCANNER CHÍNH (THÊM EMA50 FILTER ĐỒNG BỘ BACKTEST)
 # ==============================================================================
-def scan_symbol(symbol, days=200, ema_span=50, nav=1e9, risk_pct=0.01, max_positions=5):
+@perf.timed("scan.symbol")
+def scan_symbol(symbol, days=200, ema_span=50, nav=1e9, risk_pct=0.01, max_positions=5, allow_fetch=True):
     def _ret(res, reason):
         return (res, reason)
 
     try:
         # 1) Tải D1
-        df_d1 = load_data_with_cache(symbol, days_to_load=days, timeframe="1D")
+        with perf.stage("scan.d1_load"):
+            df_d1 = load_data_with_cache(symbol, days_to_load=days, timeframe="1D", allow_fetch=allow_fetch,
+                                         compute_indicators=False)
         if df_d1 is None or len(df_d1) < 60:
             return _ret(None, "Dữ liệu thiếu")
 
-        df_d1 = ensure_smc_columns(df_d1)
+        df_d1 = _scan_frame(df_d1) if SCAN_COPY_FREE else ensure_smc_columns(df_d1)
+        ctx = smc_context(df_d1)  # artifact SMC D1 tính 1 lần cho cả bước 4, 6, 7
         last_row = df_d1.iloc[-1]
         close = float(last_row["Close"])
 
@@ -192,7 +233,8 @@ def scan_symbol(symbol, days=200, ema_span=50, nav=1e9, risk_pct=0.01, max_posit
         # 4) Nhận diện tín hiệu (ưu tiên SMC, không có mới PA)
         side, d1_pattern, zone = "NEUTRAL", "None", None
 
-        entry = detect_entry_models(df_htf=df_d1)
+        with perf.stage("scan.d1_smc"):
+            entry = detect_entry_models(df_htf=df_d1, ctx=ctx)
         if entry and entry.get("entry") != "NEUTRAL":
             side = entry.get("entry")
             d1_pattern = f"SMC: {entry.get('model')}"
@@ -200,7 +242,8 @@ def scan_symbol(symbol, days=200, ema_span=50, nav=1e9, risk_pct=0.01, max_posit
 
         if side == "NEUTRAL":
             # PA D1 chỉ dùng khi không có SMC
-            df_pa = detect_price_action(df_d1.copy())
+            with perf.stage("scan.d1_pa"):
+                df_pa = detect_price_action(df_d1, copy=False) if SCAN_COPY_FREE else detect_price_action(df_d1.copy())
             for s in ["BUY", "SELL"]:
                 has_pa, name, pa_sl = check_candlestick_signal(df_pa, s)
                 if has_pa:
@@ -220,7 +263,9 @@ def scan_symbol(symbol, days=200, ema_span=50, nav=1e9, risk_pct=0.01, max_posit
             return _ret(None, "Trend EMA50 (Too Strong)")
 
         # 6) Xác nhận đa khung
-        is_confirm, tf_conf, pat_conf, entry_ltf, sl_ltf = strategy_smart_timeframe(symbol, side, df_htf=df_d1)
+        with perf.stage("scan.ltf_confirm"):
+            is_confirm, tf_conf, pat_conf, entry_ltf, sl_ltf = strategy_smart_timeframe(
+                symbol, side, df_htf=df_d1, ctx_htf=ctx, allow_fetch=allow_fetch)
 
         final_poi = float(entry_ltf) if is_confirm and entry_ltf is not None else close
         # POI_D1: vùng D1 (midpoint của zone) để bạn nhìn "đúng chất SMC"
@@ -243,10 +288,10 @@ def scan_symbol(symbol, days=200, ema_span=50, nav=1e9, risk_pct=0.01, max_posit
             return _ret(None, "Risk invalid")
 
         # 7) TP levels theo SMC
-        from smc_core import detect_fvg_zones, detect_order_blocks, detect_liquidity_sweep
-        fvgs = detect_fvg_zones(df_d1)
-        obs = detect_order_blocks(df_d1)
-        sweep_data = detect_liquidity_sweep(df_d1)
+        with perf.stage("scan.tp_levels"):
+            fvgs = ctx.fvgs()
+            obs = ctx.obs()
+            sweep_data = ctx.sweep()
 
         tp_levels = []
         if side == "BUY":
@@ -297,7 +342,8 @@ def scan_symbol(symbol, days=200, ema_span=50, nav=1e9, risk_pct=0.01, max_posit
             "vol_spike": last_row["Volume"] > df_d1["Volume"].tail(6).iloc[:-1].mean() * 1.2,
             "liquidity_sweep": sweep_data is not None
         }
-        score_res = calculate_advanced_score(scoring_data)
+        with perf.stage("scan.scoring"):
+            score_res = calculate_advanced_score(scoring_data)
         final_score = score_res["raw_score"]
         if is_confirm:
             final_score = min(final_score + 1.2, 5.0)
@@ -359,6 +405,7 @@ def _healthcheck_core():
     required = [
         "ensure_smc_columns",
         "detect_entry_models",
+        "smc_context",
         "detect_liquidity_sweep",
         "compute_smc_levels",       # bạn đang có hàm này
         "detect_breaker_blocks",
@@ -705,17 +752,19 @@ def export_journal(df_results):
 # 6. TWO-PHASE UNIVERSE SCAN (D1 shortlist -> scan_symbol confirm 1H/15m)
 # ==============================================================================
 
-def _phase1_d1_candidate(symbol: str, days: int = 60, ema_span: int = 50):
+def _phase1_d1_candidate(symbol: str, days: int = 60, ema_span: int = 50, df_d1=None):
     """
     Phase 1: D1-only, cache-only.
+    `df_d1`: frame đã nạp sẵn bởi read_cache_bulk (None -> tự đọc cache).
     Return: (candidate_dict_or_None, reject_reason)
     """
     try:
-        df_d1 = read_cache_fast(symbol, timeframe="1D", tail_n=max(260, days))
+        if df_d1 is None:
+            df_d1 = read_cache_fast(symbol, timeframe="1D", tail_n=max(260, days))
         if df_d1 is None or len(df_d1) < 60:
             return None, "No D1 cache"
 
-        df_d1 = ensure_smc_columns(df_d1)
+        df_d1 = _scan_frame(df_d1) if SCAN_COPY_FREE else ensure_smc_columns(df_d1)
         last_row = df_d1.iloc[-1]
         close = float(last_row["Close"])
 
@@ -734,31 +783,253 @@ def _phase1_d1_candidate(symbol: str, days: int = 60, ema_span: int = 50):
         if not entry:
             return None, "No setup D1"
 
-        side = entry.get("entry")
-        model = entry.get("model", "")
-        poi = entry.get("poi")
-
-        # quick score proxy: distance to EMA + model weight
-        dist_ema = abs(close - float(ema50)) / close if close else 9.0
-        base = 1.0
-        if "SILVER" in str(model).upper(): base += 0.7
-        if "BPR" in str(model).upper(): base += 0.5
-        if "FVG" in str(model).upper(): base += 0.4
-        score_proxy = base + max(0.0, 1.5 - dist_ema * 10.0)
-
-        cand = {
-            "Symbol": symbol,
-            "Signal": side,
-            "ScoreProxy": float(round(score_proxy, 3)),
-            "Price": float(close),
-            "POI_D1": float(poi) if poi is not None else None,
-            "Model": model,
-        }
-        return cand, "OK"
+        return _phase1_make_candidate(symbol, entry, close, ema50), "OK"
     except Exception as e:
         return None, str(e)
 
 
+def _phase1_make_candidate(symbol: str, entry: dict, close: float, ema50: float) -> dict:
+    side = entry.get("entry")
+    model = entry.get("model", "")
+    poi = entry.get("poi")
+
+    # quick score proxy: distance to EMA + model weight
+    dist_ema = abs(close - float(ema50)) / close if close else 9.0
+    base = 1.0
+    if "SILVER" in str(model).upper(): base += 0.7
+    if "BPR" in str(model).upper(): base += 0.5
+    if "FVG" in str(model).upper(): base += 0.4
+    score_proxy = base + max(0.0, 1.5 - dist_ema * 10.0)
+
+    return {
+        "Symbol": symbol,
+        "Signal": side,
+        "ScoreProxy": float(round(score_proxy, 3)),
+        "Price": float(close),
+        "POI_D1": float(poi) if poi is not None else None,
+        "Model": model,
+    }
+
+
+def _phase1_batch(symbols, d1_frames: dict, days: int = 60, ema_span: int = 50):
+    """
+    Phase 1 dạng batch: xếp D1 cả universe thành tensor (mã × nến × OHLCV), tính EMA,
+    lọc thanh khoản, swing và điều kiện của các entry model cho mọi mã cùng lúc.
+    Kết quả (candidate dict / lý do loại) giống hệt _phase1_d1_candidate từng mã.
+
+    Return: (candidates, rejected) với rejected = list[(symbol, reason)]
+    """
+    candidates, rejected = [], []
+    batch_syms, fallback = [], []
+    for sym in symbols:
+        df = d1_frames.get(sym)
+        if df is None or len(df) < 60:
+            rejected.append((sym, "No D1 cache"))
+        elif not set(OHLCV_COLS).issubset(df.columns) or "Swing_High" in df.columns or "Swing_Low" in df.columns:
+            fallback.append(sym)  # frame lạ -> đi đường từng mã cho chắc
+        else:
+            batch_syms.append(sym)
+
+    if batch_syms:
+        width = max(len(d1_frames[sym]) for sym in batch_syms)
+        ohlcv, lengths = stack_ohlcv(d1_frames, batch_syms, width)
+        close = ohlcv[:, -1, 3]
+        vol_tail = ohlcv[:, -5:, 4]
+        with np.errstate(all="ignore"):
+            vol_avg_5 = np.nansum(vol_tail, axis=1) / (~np.isnan(vol_tail)).sum(axis=1)
+        ema_last = batch_ema(ohlcv[:, :, 3], ema_span)[:, -1]
+        state = detect_entry_models_batch(ohlcv, lengths)
+
+        for k, sym in enumerate(batch_syms):
+            if close[k] <= 10 or vol_avg_5[k] < 100000:
+                rejected.append((sym, "Low liquidity"))
+                continue
+            if np.isnan(ema_last[k]):
+                rejected.append((sym, "EMA nan"))
+                continue
+            try:
+                if state["resolved"][k]:
+                    entry = state["entries"][k]
+                else:
+                    ctx = batch_context(state, k, d1_frames[sym])
+                    entry = detect_entry_models(df_htf=ctx.df, ctx=ctx)
+                if not entry:
+                    rejected.append((sym, "No setup D1"))
+                    continue
+                candidates.append(_phase1_make_candidate(sym, entry, float(close[k]), float(ema_last[k])))
+            except Exception as e:
+                rejected.append((sym, str(e)))
+
+    for sym in fallback:
+        cand, reason = _phase1_d1_candidate(sym, days, ema_span, d1_frames.get(sym))
+        if cand:
+            candidates.append(cand)
+        else:
+            rejected.append((sym, reason))
+
+    return candidates, rejected
+
+
+# ==============================================================================
+# 7. EXECUTOR BACKEND (threads / processes / inline) cho cả 2 phase
+# ==============================================================================
+EXECUTOR_BACKENDS = ("threads", "processes", "inline")
+_PROCESS_POOLS = {}
+
+
+def _worker_init():
+    """Chạy 1 lần/worker process: import sẵn các module nặng (spawn trên Windows phải import lại)."""
+    import smc_core  # noqa: F401
+    import indicators  # noqa: F401
+    import scanner  # noqa: F401
+
+
+def _get_process_pool(max_workers: int):
+    """Pool process sống qua nhiều lần scan (tránh trả phí spawn + import mỗi lần bấm Scan)."""
+    import concurrent.futures
+
+    pool = _PROCESS_POOLS.get(max_workers)
+    if pool is None:
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, initializer=_worker_init)
+        _PROCESS_POOLS[max_workers] = pool
+    return pool
+
+
+def _run_tasks(fn, tasks: dict, backend: str, max_workers: int):
+    """
+    Chạy fn(*args) cho từng task {key: args} theo backend.
+    Return list[(key, ok, value)] với value = kết quả hoặc exception.
+    """
+    import concurrent.futures
+
+    if backend == "inline" or len(tasks) <= 1:
+        out = []
+        for key, args in tasks.items():
+            try:
+                out.append((key, True, fn(*args)))
+            except Exception as e:
+                out.append((key, False, e))
+        return out
+
+    if backend == "processes":
+        # CPU-bound -> không cần nhiều process hơn số core
+        max_workers = max(1, min(int(max_workers), os.cpu_count() or 1))
+        try:
+            ex = _get_process_pool(max_workers)
+            futs = {ex.submit(fn, *args): key for key, args in tasks.items()}
+        except Exception as e:
+            print(f"⚠️ Process pool lỗi ({e}) -> chuyển sang threads")
+            _PROCESS_POOLS.clear()
+            return _run_tasks(fn, tasks, "threads", max_workers)
+        out = []
+        for fut in concurrent.futures.as_completed(futs):
+            try:
+                out.append((futs[fut], True, fut.result()))
+            except concurrent.futures.process.BrokenProcessPool as e:
+                _PROCESS_POOLS.pop(max_workers, None)
+                out.append((futs[fut], False, e))
+            except Exception as e:
+                out.append((futs[fut], False, e))
+        return out
+
+    out = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, int(max_workers))) as ex:
+        futs = {ex.submit(fn, *args): key for key, args in tasks.items()}
+        for fut in concurrent.futures.as_completed(futs):
+            try:
+                out.append((futs[fut], True, fut.result()))
+            except Exception as e:
+                out.append((futs[fut], False, e))
+    return out
+
+
+def _pack_frame(df):
+    """
+    DataFrame -> (values, dates int64, columns): gửi sang process rẻ hơn pickle cả DataFrame.
+    Chỉ gửi OHLCV (Phase 1 chỉ cần OHLCV, swing tính lại ở worker).
+    """
+    if df is None or df.empty:
+        return None
+    cols = [c for c in OHLCV_COLS if c in df.columns]
+    values = df[cols].to_numpy(dtype=np.float64) if cols != list(df.columns) else df.to_numpy(dtype=np.float64)
+    return values, pd.DatetimeIndex(df.index).as_unit("ns").asi8, tuple(cols)
+
+
+def _unpack_frame(packed):
+    if packed is None:
+        return pd.DataFrame()
+    values, dates, columns = packed
+    return pd.DataFrame(values, columns=list(columns), index=pd.DatetimeIndex(dates.view("datetime64[ns]"), name="Date"))
+
+
+def _timed_task(fn, *args):
+    """Chạy fn(*args) dưới perf.collect -> (value, timings dict). Module-level để pickle sang process."""
+    import time
+
+    with perf.collect() as rec:
+        t0 = time.perf_counter()
+        value = fn(*args)
+        rec.add("task." + getattr(fn, "__name__", "fn"), time.perf_counter() - t0)
+    return value, rec.as_dict()
+
+
+def _run_timed(fn, tasks: dict, backend: str, max_workers: int, rec, per_key: dict = None):
+    """
+    Như _run_tasks nhưng mỗi task tự đo stage của nó (chạy được cả trong worker process),
+    rồi cộng vào rec của scan; per_key: {key: Recorder} để giữ timings theo mã.
+    """
+    wrapped = {key: (fn, *args) for key, args in tasks.items()}
+    out = []
+    for key, ok, value in _run_tasks(_timed_task, wrapped, backend, max_workers):
+        if ok:
+            value, timings = value
+            rec.merge(timings)
+            if per_key is not None:
+                per_key.setdefault(key, perf.Recorder()).merge(timings)
+        out.append((key, ok, value))
+    return out
+
+
+def _scan_timings(backend, rec, per_symbol: dict, **totals) -> dict:
+    """Gói timings của 1 lần scan thành dict thuần (dễ đưa lên DataFrame/UI)."""
+    d = rec.as_dict()
+    return {
+        "backend": backend,
+        **{k: float(v) for k, v in totals.items()},
+        "stages": d["stages"],
+        "counters": d["counters"],
+        "per_symbol": {
+            sym: {
+                "total_s": r.total("task."),
+                "stages": {name: s[1] for name, s in r.stages.items() if not name.startswith("task.")},
+            }
+            for sym, r in per_symbol.items()
+        },
+    }
+
+
+def _phase1_symbol_task(symbol, packed, days, ema_span):
+    return _phase1_d1_candidate(symbol, days, ema_span, _unpack_frame(packed))
+
+
+def _phase1_batch_task(symbols, packed: dict, days, ema_span):
+    frames = {sym: _unpack_frame(p) for sym, p in packed.items()}
+    return _phase1_batch(symbols, frames, days, ema_span)
+
+
+def _refresh_task(symbol, days, ltf, ltf_days):
+    """Tải bù D1 + LTF của 1 mã vào store (chạy ở process cha, trước khi phát task cho worker)."""
+    load_data_with_cache(symbol, days_to_load=days, timeframe="1D", compute_indicators=False)
+    load_data_with_cache(symbol, days_to_load=ltf_days, timeframe=ltf, compute_indicators=False)
+    return True
+
+
+def _chunks(items: list, n_chunks: int, min_size: int = 50) -> list:
+    n_chunks = max(1, min(int(n_chunks), len(items) // max(1, min_size)))
+    size = -(-len(items) // n_chunks) if items else 1
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
 def scan_universe_two_phase(
     symbols,
     days: int = 60,
@@ -769,53 +1040,149 @@ def scan_universe_two_phase(
     shortlist_n: int = 60,
     max_workers_phase1: int = 16,
     max_workers_phase2: int = 10,
+    phase1_batch: bool = True,
+    executor: str = None,
+    return_timings: bool = False,
 ):
     """
     Two-phase scanning:
       Phase 1: D1-only cache scan to build shortlist
+               (phase1_batch=True: tính cả universe trên tensor 1 lần, False: thread/mã như cũ)
       Phase 2: run full scan_symbol (D1 + 1H/15m) only on shortlist
 
-    Return: (results_list, rejected_list)
+    executor: "threads" | "processes" | "inline" (None -> config.SCAN_EXECUTOR).
+      - processes: worker import sẵn smc_core/indicators, nhận mảng numpy thay vì DataFrame
+      - Phase 1 batch + processes: universe chia chunk, mỗi worker chạy batch trên chunk của mình
+      - Phase 2 + processes: process cha tải bù dữ liệu shortlist trước, worker chạy allow_fetch=False
+
+    Return: (results_list, rejected_list) hoặc (results_list, rejected_list, timings) nếu return_timings
       - results_list: list[dict] like scan_symbol output
       - rejected_list: list[(symbol, reason)]
+      - timings: {backend, total_s, load_s, phase1_s, phase2_s,
+                  stages: {name: {count, total_s, max_s}}, counters, per_symbol: {sym: {total_s, stages}}}
     """
-    import concurrent.futures
+    import time
+
+    backend = (executor or SCAN_EXECUTOR or "threads").lower()
+    if backend not in EXECUTOR_BACKENDS:
+        raise ValueError(f"executor phải là 1 trong {EXECUTOR_BACKENDS}, nhận: {executor}")
 
     symbols = [s.strip().upper() for s in symbols if str(s).strip()]
     rejected = []
     candidates = []
+    rec = perf.Recorder()   # cộng dồn mọi stage của lần scan này
+    per_symbol = {}         # sym -> Recorder
 
     # -------- Phase 1 --------
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers_phase1) as ex:
-        futs = {ex.submit(_phase1_d1_candidate, sym, days, ema_span): sym for sym in symbols}
-        for fut in concurrent.futures.as_completed(futs):
-            sym = futs[fut]
-            cand, reason = fut.result()
+    t0 = time.perf_counter()
+    # Nạp D1 của cả universe trong 1 lần đọc store (thay vì 1 file/mã)
+    with perf.collect(rec):
+        d1_frames = read_cache_bulk(symbols, timeframe="1D", tail_n=max(260, days))
+    t_load = time.perf_counter() - t0
+    # So với lịch HOSE: mã có nến D1 cuối cũ hơn kỳ vọng sẽ tải lại ở Phase 2, mã fresh thì không gọi API
+    expected_d1 = expected_last_bar("1D")
+    n_stale = sum(1 for df in d1_frames.values() if df is not None and len(df) and df.index[-1] < expected_d1)
+    rec.bump("scan.d1_stale", n_stale)
+
+    pack = _pack_frame if backend == "processes" else (lambda df: df)
+    if phase1_batch:
+        if backend == "processes":
+            tasks = {
+                i: (chunk, {sym: pack(d1_frames.get(sym)) for sym in chunk}, days, ema_span)
+                for i, chunk in enumerate(_chunks(symbols, max_workers_phase1))
+            }
+            outputs = _run_timed(_phase1_batch_task, tasks, backend, max_workers_phase1, rec)
+        else:
+            # threads/inline: batch 1 lần trên cả universe (NumPy đã vector hoá, thread không lợi thêm)
+            outputs = _run_timed(_phase1_batch, {0: (symbols, d1_frames, days, ema_span)}, "inline", 1, rec)
+        for key, ok, value in outputs:
+            if not ok:
+                chunk = tasks[key][0] if backend == "processes" else symbols
+                rejected.extend((sym, f"P1: {value}") for sym in chunk)
+                continue
+            cands, p1_rejected = value
+            candidates.extend(cands)
+            rejected.extend((sym, f"P1: {reason}") for sym, reason in p1_rejected)
+    else:
+        fn = _phase1_symbol_task if backend == "processes" else _phase1_d1_candidate
+        tasks = {
+            sym: (sym, pack(d1_frames.get(sym, pd.DataFrame())), days, ema_span)
+            if backend == "processes" else (sym, days, ema_span, d1_frames.get(sym, pd.DataFrame()))
+            for sym in symbols
+        }
+        for sym, ok, value in _run_timed(fn, tasks, backend, max_workers_phase1, rec, per_symbol):
+            cand, reason = value if ok else (None, str(value))
             if cand:
                 candidates.append(cand)
             else:
                 rejected.append((sym, f"P1: {reason}"))
+    t_p1 = time.perf_counter() - t0
 
     # Sort & shortlist
     if candidates:
         candidates.sort(key=lambda x: (str(x.get("Signal","")), -float(x.get("ScoreProxy", 0)), str(x.get("Symbol",""))))
         shortlist = [c["Symbol"] for c in candidates[:max(1, int(shortlist_n))]]
+        save_phase1_scores(candidates)  # run_bulk_update lần sau cập nhật các mã này trước phần còn lại
     else:
+        print(f"⏱️ Scan [{backend}] P1 {t_p1:.2f}s (load {t_load:.2f}s, {len(symbols)} mã, {n_stale} D1 cũ) -> 0 candidate")
+        if return_timings:
+            timings = _scan_timings(backend, rec, per_symbol, total_s=t_p1, load_s=t_load, phase1_s=t_p1, phase2_s=0.0)
+            return [], rejected, timings
         return [], rejected
 
     # -------- Phase 2 --------
+    t1 = time.perf_counter()
     results = []
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers_phase2) as ex:
-        futs = {ex.submit(scan_symbol, sym, days, ema_span, nav, risk_pct, max_positions): sym for sym in shortlist}
-        for fut in concurrent.futures.as_completed(futs):
-            sym = futs[fut]
-            try:
-                res, reason = fut.result()
-            except Exception as e:
-                res, reason = None, str(e)
-            if res:
-                results.append(res)
-            else:
-                rejected.append((sym, f"P2: {reason}"))
-
+    allow_fetch = backend != "processes"
+    if not allow_fetch:
+        # Worker process không fetch/ghi store: nhiều process cùng tải 1 mã cũ -> ghi trùng, tốn quota API.
+        # Process cha làm mới D1 + LTF của shortlist (threads, 1 mã/thread) rồi worker chỉ đọc.
+        ltf, ltf_days = _ltf_plan(now_vn().hour)
+        refresh = {sym: (sym, days, ltf, ltf_days) for sym in shortlist}
+        for sym, ok, value in _run_timed(_refresh_task, refresh, "threads", max_workers_phase2, rec):
+            if not ok:
+                print(f"⚠️ Làm mới dữ liệu {sym} lỗi: {value}")
+    tasks = {sym: (sym, days, ema_span, nav, risk_pct, max_positions, allow_fetch) for sym in shortlist}
+    for sym, ok, value in _run_timed(scan_symbol, tasks, backend, max_workers_phase2, rec, per_symbol):
+        res, reason = value if ok else (None, str(value))
+        if res:
+            results.append(res)
+        else:
+            rejected.append((sym, f"P2: {reason}"))
+    t_p2 = time.perf_counter() - t1
+
+    print(
+        f"⏱️ Scan [{backend}] P1 {t_p1:.2f}s (load {t_load:.2f}s, {len(symbols)} mã, {n_stale} D1 cũ, "
+        f"{len(symbols) / max(t_p1, 1e-9):.0f} mã/s) | P2 {t_p2:.2f}s ({len(shortlist)} mã, "
+        f"{len(shortlist) / max(t_p2, 1e-9):.1f} mã/s)"
+    )
+    if return_timings:
+        timings = _scan_timings(backend, rec, per_symbol, total_s=t_p1 + t_p2, load_s=t_load,
+                                phase1_s=t_p1, phase2_s=t_p2)
+        return results, rejected, timings
     return results, rejected
+
+
+def compare_executor_backends(symbols, backends=EXECUTOR_BACKENDS, repeat: int = 1, **scan_kwargs):
+    """
+    Chạy scan_universe_two_phase với từng backend, in thời gian + speedup so với inline.
+    Return: dict backend -> giây (best of `repeat`).
+    """
+    import time
+
+    timings = {}
+    for backend in backends:
+        best = None
+        for _ in range(max(1, int(repeat))):
+            t0 = time.perf_counter()
+            scan_universe_two_phase(symbols, executor=backend, **scan_kwargs)
+            dt = time.perf_counter() - t0
+            best = dt if best is None else min(best, dt)
+        timings[backend] = best
+
+    base = timings.get("inline") or max(timings.values())
+    print("================ EXECUTOR BACKENDS ================")
+    for backend, dt in timings.items():
+        print(f"{backend:<10} {dt:8.2f}s   x{base / max(dt, 1e-9):.2f} vs inline")
+    print("===================================================")
+    return timings
@@ -1,7 +1,7 @@
 # seed_data.py
 import os
 import pandas as pd
-from pipeline_manager import run_bulk_update
+from backfill import run_backfill
 from universe import get_vnallshare_universe
 from data import load_data_with_cache
 
@@ -19,13 +19,13 @@ def seed_cache_for_git():
         return
 
     # 2. Chạy tải dữ liệu (Sẽ lưu vào folder /data_cache)
-    # Tải D1 (365 ngày), 1H (100 ngày), 15m (30 ngày)
-    # Lưu ý: Chạy ở local nên cứ để nó chạy từ từ, không sợ timeout
+    # Tải D1 (365 ngày), 15m (30 ngày); 30m/1H/2H/1W/1M dựng từ store
+    # Có checkpoint (data_cache/backfill/seed.jsonl): bị ngắt giữa chừng thì chạy lại là làm tiếp
     print("⏳ Đang tải dữ liệu (có thể mất vài phút)...")
-    result = run_bulk_update(universe, days_back=365)
+    result = run_backfill(universe, timeframes=("1D", "15m"), days={"1D": 365, "15m": 30}, name="seed")
     
     print(result)
-    print("✅ Đã xong! Kiểm tra folder 'data_cache' xem có file .parquet chưa.")
+    print("✅ Đã xong! Kiểm tra folder 'data_cache/store' (1 dataset parquet / timeframe).")
 
 if __name__ == "__main__":
     seed_cache_for_git()
\ No newline at end of file
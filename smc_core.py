@@ -1,6 +1,18 @@
 # src/smc_core.py
+import warnings
+
 import pandas as pd
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+import perf
+
+# numba (đã có sẵn qua pandas_ta) -> tăng tốc kernel tìm điểm phá vỡ; thiếu thì dùng NumPy
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except Exception:
+    HAS_NUMBA = False
 
 # ==============================================================================
 # 0) SWINGS (Fractals) + ENSURE COLUMNS
@@ -9,50 +21,64 @@ import numpy as np
 def detect_swings(df: pd.DataFrame, lookback: int = 2, copy: bool = True) -> pd.DataFrame:
     """
     Fractals kiểu 5 nến (lookback=2).
+    copy=False: ghi thẳng cột Swing_High/Swing_Low vào df (frame do caller sở hữu).
     """
     if df is None or df.empty or len(df) < (lookback * 2 + 1):
         return df
 
     if copy:
-        df = df.copy() if copy else df if copy else df
-    # Ensure columns exist (in-place when copy=False)
-    df["Swing_High"] = False
-    df["Swing_Low"] = False
+        df = df.copy()
 
-    h = df["High"].values
-    l = df["Low"].values
+    h = df["High"].to_numpy()
+    l = df["Low"].to_numpy()
     n = len(df)
+    # Tính cả cột 1 lần trên mảng rồi gán, không set từng đoạn iloc (mỗi lần set có thể copy block)
+    sh = np.zeros(n, dtype=bool)
+    sl = np.zeros(n, dtype=bool)
 
     if lookback == 2 and n > 5:
-        is_sh = (h[2:-2] > h[:-4]) & (h[2:-2] > h[1:-3]) & (h[2:-2] > h[3:-1]) & (h[2:-2] > h[4:])
-        is_sl = (l[2:-2] < l[:-4]) & (l[2:-2] < l[1:-3]) & (l[2:-2] < l[3:-1]) & (l[2:-2] < l[4:])
-        df.iloc[2:-2, df.columns.get_loc("Swing_High")] = is_sh
-        df.iloc[2:-2, df.columns.get_loc("Swing_Low")] = is_sl
-        return df
+        sh[2:-2] = (h[2:-2] > h[:-4]) & (h[2:-2] > h[1:-3]) & (h[2:-2] > h[3:-1]) & (h[2:-2] > h[4:])
+        sl[2:-2] = (l[2:-2] < l[:-4]) & (l[2:-2] < l[1:-3]) & (l[2:-2] < l[3:-1]) & (l[2:-2] < l[4:])
+    elif n > 2 * lookback:
+        # Cửa sổ trượt (2*lookback+1): đỉnh/đáy = max/min của cửa sổ (cho phép bằng nhau)
+        win = 2 * lookback + 1
+        h_win = sliding_window_view(np.asarray(h, dtype=float), win)
+        l_win = sliding_window_view(np.asarray(l, dtype=float), win)
+        sh[lookback:n - lookback] = h[lookback:n - lookback] == h_win.max(axis=1)
+        sl[lookback:n - lookback] = l[lookback:n - lookback] == l_win.min(axis=1)
+
+    df["Swing_High"] = sh
+    df["Swing_Low"] = sl
+    return df
 
-    for i in range(lookback, n - lookback):
-        hi = h[i]
-        lo = l[i]
-        if hi == np.max(h[i - lookback:i + lookback + 1]):
-            df.iat[i, df.columns.get_loc("Swing_High")] = True
-        if lo == np.min(l[i - lookback:i + lookback + 1]):
-            df.iat[i, df.columns.get_loc("Swing_Low")] = True
 
-    return df
+def has_smc_columns(df: pd.DataFrame) -> bool:
+    """True nếu df đã có Swing_High/Swing_Low dùng được (không cần tính lại)."""
+    if df is None or "Swing_High" not in df.columns or "Swing_Low" not in df.columns:
+        return False
+    if len(df) <= 10:
+        return True
+    return bool(df["Swing_High"].to_numpy().any()) and bool(df["Swing_Low"].to_numpy().any())
 
 
+def smc_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Frame có cột swing cho các hàm chỉ ĐỌC: đã có thì trả lại chính df (không copy),
+    chưa có thì trả bản copy đã thêm cột (không đụng vào frame của caller).
+    """
+    if df is None or df.empty or has_smc_columns(df):
+        return df
+    return ensure_smc_columns(df, copy=True)
+
+
+@perf.timed("smc.ensure_columns")
 def ensure_smc_columns(df: pd.DataFrame, copy: bool = True) -> pd.DataFrame:
     if df is None or df.empty:
         return df
     if copy:
         df = df.copy()
-    if "Swing_High" not in df.columns or "Swing_Low" not in df.columns:
+    if not has_smc_columns(df):
         df = detect_swings(df, lookback=2, copy=False)
-    else:
-        if df["Swing_High"].sum() == 0 and len(df) > 10:
-            df = detect_swings(df, lookback=2, copy=False)
-        if df["Swing_Low"].sum() == 0 and len(df) > 10:
-            df = detect_swings(df, lookback=2, copy=False)
     return df
 
 
@@ -63,7 +89,7 @@ def ensure_smc_columns(df: pd.DataFrame, copy: bool = True) -> pd.DataFrame:
 def compute_smc_levels(df: pd.DataFrame) -> dict:
     if df is None or df.empty:
         return {}
-    df = ensure_smc_columns(df)
+    df = smc_frame(df)
 
     last_sh_idx = df[df["Swing_High"]].last_valid_index()
     last_sl_idx = df[df["Swing_Low"]].last_valid_index()
@@ -108,76 +134,126 @@ def compute_smc_levels(df: pd.DataFrame) -> dict:
 # 2) FVG & ORDER BLOCKS
 # ==============================================================================
 
+def _future_extreme(values: np.ndarray, window: int, use_min: bool) -> np.ndarray:
+    """out[i] = min/max(values[i+1 : i+1+window]) (window<=0 -> tới hết chuỗi); NaN nếu rỗng."""
+    n = len(values)
+    out = np.full(n, np.nan)
+    if n < 2:
+        return out
+    if window and window > 0:
+        # van Herk/Gil-Werman: min/max trượt bằng prefix/suffix theo block độ dài `window`
+        # -> bộ nhớ O(n) (reduce trên sliding_window_view copy cả ma trận n x window)
+        w = int(window)
+        fill = np.inf if use_min else -np.inf
+        arr = np.concatenate([values[1:], np.full(w - 1 + (-(n - 2 + w)) % w, fill)])
+        blocks = arr.reshape(-1, w)
+        acc = np.minimum.accumulate if use_min else np.maximum.accumulate
+        pre = acc(blocks, axis=1).ravel()
+        suf = acc(blocks[:, ::-1], axis=1)[:, ::-1].ravel()
+        pick = np.minimum if use_min else np.maximum
+        out[:-1] = pick(suf[:n - 1], pre[w - 1:w - 1 + n - 1])
+    else:
+        acc = np.minimum.accumulate if use_min else np.maximum.accumulate
+        out[:-1] = acc(values[:0:-1])[::-1]
+    return out
+
+
 def detect_fvg_zones(df: pd.DataFrame, max_zones: int = 5, future_window: int = 60) -> list:
-    """Detect Fair Value Gaps.
+    """Detect Fair Value Gaps (vectorized, newest first).
 
     Perf: limit the "future" invalidation scan to `future_window` bars to avoid O(n^2) behavior.
     """
     if df is None or df.empty or len(df) < 5:
         return []
-    highs = df["High"].values
-    lows = df["Low"].values
+    if max_zones <= 0:
+        return []
+    highs = df["High"].to_numpy(dtype=float)
+    lows = df["Low"].to_numpy(dtype=float)
     dates = df.index
     avg_range = (df["High"] - df["Low"]).mean()
     min_gap = avg_range * 0.3
+
+    # i chạy 3 .. n-2 (nến giữa = i-1)
+    i = np.arange(3, len(df) - 1)
+    h2, l2, hi, li = highs[i - 2], lows[i - 2], highs[i], lows[i]
+
+    bull_gap = h2 < li
+    bear_gap = ~bull_gap & (l2 > hi)
+    fut_min = _future_extreme(lows, future_window, use_min=True)[i]
+    fut_max = _future_extreme(highs, future_window, use_min=False)[i]
+    # FVG còn hiệu lực: giá tương lai chưa lấp tới 50% gap
+    bull_ok = bull_gap & ((li - h2) > min_gap) & ~(fut_min <= (li + h2) / 2)
+    bear_ok = bear_gap & ((l2 - hi) > min_gap) & ~(fut_max >= (l2 + hi) / 2)
+
     zones = []
-    
-    for i in range(len(df) - 2, 2, -1):
-        if len(zones) >= max_zones: break
-        # Bullish FVG
-        if highs[i - 2] < lows[i]:
-            if (lows[i] - highs[i - 2]) > min_gap:
-                future_lows = lows[i + 1:i + 1 + int(future_window)] if future_window else lows[i + 1:]
-                mid = (lows[i] + highs[i-2]) / 2
-                if not (len(future_lows) > 0 and np.min(future_lows) <= mid):
-                    zones.append({"type": "FVG_BULL", "side": "bull", "y0": float(highs[i-2]), "y1": float(lows[i]), "bottom": float(highs[i-2]), "top": float(lows[i]), "start_idx": dates[i-2]})
-        # Bearish FVG
-        elif lows[i - 2] > highs[i]:
-            if (lows[i - 2] - highs[i]) > min_gap:
-                future_highs = highs[i + 1:i + 1 + int(future_window)] if future_window else highs[i + 1:]
-                mid = (lows[i-2] + highs[i]) / 2
-                if not (len(future_highs) > 0 and np.max(future_highs) >= mid):
-                    zones.append({"type": "FVG_BEAR", "side": "bear", "y0": float(highs[i]), "y1": float(lows[i-2]), "bottom": float(highs[i]), "top": float(lows[i-2]), "start_idx": dates[i-2]})
+    for k in np.nonzero(bull_ok | bear_ok)[0][::-1][:int(max_zones)]:
+        j = int(i[k])
+        if bull_ok[k]:
+            zones.append({"type": "FVG_BULL", "side": "bull", "y0": float(highs[j-2]), "y1": float(lows[j]), "bottom": float(highs[j-2]), "top": float(lows[j]), "start_idx": dates[j-2]})
+        else:
+            zones.append({"type": "FVG_BEAR", "side": "bear", "y0": float(highs[j]), "y1": float(lows[j-2]), "bottom": float(highs[j]), "top": float(lows[j-2]), "start_idx": dates[j-2]})
     return zones
 
 
+if HAS_NUMBA:
+    @njit(cache=True)
+    def _first_break_nb(closes, starts, levels, above):
+        out = np.full(len(starts), -1, dtype=np.int64)
+        n = len(closes)
+        for k in range(len(starts)):
+            lvl = levels[k]
+            for j in range(starts[k] + 1, n):
+                c = closes[j]
+                if (above and c > lvl) or ((not above) and c < lvl):
+                    out[k] = j
+                    break
+        return out
+
+
+def _first_break(closes: np.ndarray, starts: np.ndarray, levels: np.ndarray, above: bool) -> np.ndarray:
+    """Với mỗi swing k: vị trí j > starts[k] đầu tiên có close phá levels[k] (-1 nếu chưa phá)."""
+    if len(starts) == 0:
+        return np.empty(0, dtype=np.int64)
+    if HAS_NUMBA:
+        return _first_break_nb(closes, starts.astype(np.int64), levels, bool(above))
+    pos = np.arange(len(closes))
+    hit = (closes[None, :] > levels[:, None]) if above else (closes[None, :] < levels[:, None])
+    hit &= pos[None, :] > starts[:, None]
+    first = hit.argmax(axis=1)
+    return np.where(hit.any(axis=1), first, -1)
+
+
 def detect_order_blocks(df: pd.DataFrame, lookback: int = 120, max_obs: int = 5) -> list:
     if df is None or df.empty or len(df) < 30:
         return []
-    # Avoid extra copies in scan path (caller can copy once)
-    df = ensure_smc_columns(df, copy=False)
+    # Avoid extra copies in scan path (frame đã có swing -> dùng luôn, không ghi vào frame của caller)
+    df = smc_frame(df)
     if lookback and len(df) > lookback:
         df = df.tail(lookback)
     
-    closes = df["Close"].values; highs = df["High"].values; lows = df["Low"].values
+    closes = df["Close"].to_numpy(dtype=float); highs = df["High"].to_numpy(dtype=float); lows = df["Low"].to_numpy(dtype=float)
     dates = df.index
     sw_highs = np.where(df["Swing_High"].values)[0]
     sw_lows = np.where(df["Swing_Low"].values)[0]
     obs = []
 
-    # Bull OB
-    for idx in sw_highs:
-        price_peak = highs[idx]
-        break_idx = np.where(closes[idx+1:] > price_peak)[0]
-        if len(break_idx) > 0:
-            actual = idx + 1 + break_idx[0]
-            valid_lows = sw_lows[sw_lows < actual]
-            if len(valid_lows) > 0:
-                origin = valid_lows[-1]
-                if closes[-1] > lows[origin]:
-                    obs.append({"type": "OB_BULL", "side": "bull", "y0": float(lows[origin]), "y1": float(highs[origin]), "bottom": float(lows[origin]), "top": float(highs[origin]), "start_idx": dates[origin]})
+    # Bull OB: close phá đỉnh swing -> OB = swing low gần nhất trước điểm phá
+    actual = _first_break(closes, sw_highs, highs[sw_highs], above=True)
+    pos = np.searchsorted(sw_lows, actual, side="left") - 1
+    for a, p in zip(actual, pos):
+        if a >= 0 and p >= 0:
+            origin = sw_lows[p]
+            if closes[-1] > lows[origin]:
+                obs.append({"type": "OB_BULL", "side": "bull", "y0": float(lows[origin]), "y1": float(highs[origin]), "bottom": float(lows[origin]), "top": float(highs[origin]), "start_idx": dates[origin]})
     
-    # Bear OB
-    for idx in sw_lows:
-        price_trough = lows[idx]
-        break_idx = np.where(closes[idx+1:] < price_trough)[0]
-        if len(break_idx) > 0:
-            actual = idx + 1 + break_idx[0]
-            valid_highs = sw_highs[sw_highs < actual]
-            if len(valid_highs) > 0:
-                origin = valid_highs[-1]
-                if closes[-1] < highs[origin]:
-                    obs.append({"type": "OB_BEAR", "side": "bear", "y0": float(lows[origin]), "y1": float(highs[origin]), "bottom": float(lows[origin]), "top": float(highs[origin]), "start_idx": dates[origin]})
+    # Bear OB: close phá đáy swing -> OB = swing high gần nhất trước điểm phá
+    actual = _first_break(closes, sw_lows, lows[sw_lows], above=False)
+    pos = np.searchsorted(sw_highs, actual, side="left") - 1
+    for a, p in zip(actual, pos):
+        if a >= 0 and p >= 0:
+            origin = sw_highs[p]
+            if closes[-1] < highs[origin]:
+                obs.append({"type": "OB_BEAR", "side": "bear", "y0": float(lows[origin]), "y1": float(highs[origin]), "bottom": float(lows[origin]), "top": float(highs[origin]), "start_idx": dates[origin]})
                     
     obs = sorted(obs, key=lambda x: x["start_idx"])
     return obs[-max_obs:]
@@ -198,7 +274,7 @@ def detect_last_order_block(df: pd.DataFrame):
 
 def detect_trendlines(df: pd.DataFrame) -> list:
     if df is None or df.empty: return []
-    df = ensure_smc_columns(df)
+    df = smc_frame(df)
     lines = []
     # Simplified Trendlines logic
     highs = df[df["Swing_High"]].tail(2)
@@ -319,7 +395,7 @@ def detect_confluence_zones(df: pd.DataFrame, fvg_zones: list, ob_zone):
 
 def detect_mss(df: pd.DataFrame):
     if df is None or df.empty or len(df) < 20: return None
-    df = ensure_smc_columns(df)
+    df = smc_frame(df)
     last = df.iloc[-1]
     swings_high = df[df["Swing_High"]]
     swings_low = df[df["Swing_Low"]]
@@ -333,15 +409,21 @@ def detect_liquidity_sweep(df: pd.DataFrame, lookback: int = 20):
     if df is None or df.empty or len(df) < lookback + 2:
         return None
 
-    recent = df.iloc[-lookback:-1]
-    last = df.iloc[-1]
+    lows = df["Low"].to_numpy(dtype=float)
+    highs = df["High"].to_numpy(dtype=float)
+    last_close = float(df["Close"].iat[-1])
+    recent_lows = lows[-lookback:-1]
+    recent_highs = highs[-lookback:-1]
+    # NaN-skip như pandas .min()/.max()
+    recent_low = float(np.nanmin(recent_lows)) if np.any(~np.isnan(recent_lows)) else np.nan
+    recent_high = float(np.nanmax(recent_highs)) if np.any(~np.isnan(recent_highs)) else np.nan
 
     # Quét đáy: Low thấp hơn đáy cũ và Close quay lại phía trên đáy cũ
-    if float(last["Low"]) < float(recent["Low"].min()) and float(last["Close"]) > float(recent["Low"].min()):
+    if float(lows[-1]) < recent_low and last_close > recent_low:
         return "SELL_SIDE"
 
     # Quét đỉnh: High cao hơn đỉnh cũ và Close quay lại phía dưới đỉnh cũ
-    if float(last["High"]) > float(recent["High"].max()) and float(last["Close"]) < float(recent["High"].max()):
+    if float(highs[-1]) > recent_high and last_close < recent_high:
         return "BUY_SIDE"
 
     return None
@@ -363,17 +445,110 @@ def detect_smt(df_main: pd.DataFrame, df_pair: pd.DataFrame):
     if float(df_main.iloc[-1]["Low"]) < float(df_main.iloc[-2]["Low"]) and float(df_pair.iloc[-1]["Low"]) >= float(df_pair.iloc[-2]["Low"]): return "BULL"
     return None
 
+# ==============================================================================
+# 4b) SMC CONTEXT: artifact tính 1 lần / frame (lazy + memo)
+# ==============================================================================
+class SMCContext:
+    """
+    Gom các artifact SMC của 1 frame (sweep, MSS, FVG, OB, breaker, OTE, BPR).
+    Mỗi artifact chỉ được tính khi cần lần đầu, sau đó dùng lại cho mọi entry model
+    và cho scanner (TP levels) -> mỗi symbol/timeframe tính đúng 1 lần.
+
+    Frame được coi là bất biến về OHLC sau khi tạo context.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self._memo = {}
+
+    def _get(self, key, fn):
+        if key not in self._memo:
+            with perf.stage("smc." + (key if isinstance(key, str) else key[0])):
+                self._memo[key] = fn()
+        else:
+            perf.count("smc.memo_hit")
+        return self._memo[key]
+
+    def prime(self, key, value):
+        """Nạp sẵn artifact đã tính ở nơi khác (vd: engine batch) để khỏi tính lại."""
+        self._memo[key] = value
+
+    def frame(self) -> pd.DataFrame:
+        return self._get("frame", lambda: smc_frame(self.df))
+
+    def sweep(self, lookback: int = 20):
+        return self._get(("sweep", lookback), lambda: detect_liquidity_sweep(self.df, lookback=lookback))
+
+    def mss(self):
+        return self._get("mss", lambda: detect_mss(self.frame()))
+
+    def fvgs(self, max_zones: int = 5, future_window: int = 60) -> list:
+        return self._get(("fvgs", max_zones, future_window),
+                         lambda: detect_fvg_zones(self.df, max_zones=max_zones, future_window=future_window))
+
+    def obs(self, lookback: int = 120, max_obs: int = 5) -> list:
+        return self._get(("obs", lookback, max_obs),
+                         lambda: detect_order_blocks(self.frame(), lookback=lookback, max_obs=max_obs))
+
+    def breakers(self) -> list:
+        return self._get("breakers", lambda: detect_breaker_blocks(self.df))
+
+    def levels(self) -> dict:
+        return self._get("levels", lambda: compute_smc_levels(self.frame()))
+
+    def bpr(self):
+        return self._get("bpr", lambda: detect_bpr(self.fvgs()))
+
+    def artifacts(self) -> dict:
+        """Bộ artifact scanner cần (giống _ctx cũ của detect_entry_models)."""
+        out = {}
+        for name, fn, fallback in (("fvgs", self.fvgs, []), ("obs", self.obs, []), ("sweep", self.sweep, None)):
+            try:
+                out[name] = fn()
+            except Exception:
+                out[name] = fallback
+        return out
+
+
+def _frame_signature(df: pd.DataFrame):
+    if df is None or df.empty:
+        return (0, None, None)
+    return (len(df), df.index[-1], float(df["Close"].iat[-1]) if "Close" in df.columns else None)
+
+
+def smc_context(df: pd.DataFrame) -> SMCContext:
+    """
+    Lấy SMCContext gắn với frame `df` (tạo mới nếu chưa có hoặc frame đã đổi số nến).
+    Context được gắn lên chính object frame nên các hàm nhận cùng frame sẽ dùng chung.
+    """
+    if isinstance(df, SMCContext):
+        return df
+    if df is None:
+        return SMCContext(df)
+    sig = _frame_signature(df)
+    cached = df.__dict__.get("_smc_ctx")
+    if cached is not None and cached[0] == sig:
+        return cached[1]
+    ctx = SMCContext(df)
+    object.__setattr__(df, "_smc_ctx", (sig, ctx))
+    return ctx
+
+
 # ==============================================================================
 # 5) ENTRY MODELS (UPDATED & EXPANDED)
 # ==============================================================================
 
 # --- Model 1: Unicorn ---
-def entry_ls_mss_bb_fvg(df: pd.DataFrame):
-    sweep = detect_liquidity_sweep(df)
-    mss = detect_mss(df)
-    obs = detect_order_blocks(df)
-    fvgs = detect_fvg_zones(df)
-    if not sweep or not mss or not obs or not fvgs: return None
+def entry_ls_mss_bb_fvg(df: pd.DataFrame, ctx: SMCContext = None):
+    ctx = ctx or smc_context(df)
+    # sweep/MSS rẻ -> check trước, chỉ tính OB/FVG khi cần
+    sweep = ctx.sweep()
+    mss = ctx.mss()
+    if not sweep or not mss: return None
+    obs = ctx.obs()
+    if not obs: return None
+    fvgs = ctx.fvgs()
+    if not fvgs: return None
 
     ob = obs[-1]
     for fvg in fvgs:
@@ -386,21 +561,22 @@ def entry_ls_mss_bb_fvg(df: pd.DataFrame):
     return None
 
 # --- Model 2: ICT 2022 ---
-def entry_ls_mss_fvg(df: pd.DataFrame):
-    sweep = detect_liquidity_sweep(df)
-    mss = detect_mss(df)
-    fvgs = detect_fvg_zones(df)
+def entry_ls_mss_fvg(df: pd.DataFrame, ctx: SMCContext = None):
+    ctx = ctx or smc_context(df)
+    sweep = ctx.sweep()
+    mss = ctx.mss()
     if sweep == "SELL_SIDE" and mss == "BULL":
-        fvg = next((z for z in fvgs if z["side"] == "bull"), None)
+        fvg = next((z for z in ctx.fvgs() if z["side"] == "bull"), None)
         if fvg: return {"entry": "BUY", "zone": fvg, "model": "ICT 2022 (LS+MSS+FVG)"}
     if sweep == "BUY_SIDE" and mss == "BEAR":
-        fvg = next((z for z in fvgs if z["side"] == "bear"), None)
+        fvg = next((z for z in ctx.fvgs() if z["side"] == "bear"), None)
         if fvg: return {"entry": "SELL", "zone": fvg, "model": "ICT 2022 (LS+MSS+FVG)"}
     return None
 
 # --- [NEW] Model 3: OTE Pullback ---
-def entry_ote_pullback(df: pd.DataFrame):
-    smc = compute_smc_levels(df)
+def entry_ote_pullback(df: pd.DataFrame, ctx: SMCContext = None):
+    ctx = ctx or smc_context(df)
+    smc = ctx.levels()
     if not smc:
         return None
 
@@ -437,48 +613,44 @@ def detect_breaker_blocks(df: pd.DataFrame):
     if df is None or len(df) < 3:
         return breakers
 
-    # duyệt từ cuối về đầu để breaker mới nhất được append trước (giống logic FVG của bạn)
-    for i in range(len(df) - 2, 1, -1):
-        prev = df.iloc[i - 1]
-        cur = df.iloc[i]
-
-        prev_open = float(prev["Open"])
-        prev_close = float(prev["Close"])
-        prev_high = float(prev["High"])
-        prev_low = float(prev["Low"])
-
-        cur_close = float(cur["Close"])
-
-        # Bull breaker: prev bearish + cur close > prev high
-        if prev_close < prev_open and cur_close > prev_high:
-            breakers.append(
-                {
-                    "side": "bull",
-                    "y0": prev_low,
-                    "y1": prev_high,
-                    "i": i,
-                }
-            )
-            continue
+    o = df["Open"].to_numpy(dtype=float)
+    h = df["High"].to_numpy(dtype=float)
+    l = df["Low"].to_numpy(dtype=float)
+    c = df["Close"].to_numpy(dtype=float)
 
-        # Bear breaker: prev bullish + cur close < prev low
-        if prev_close > prev_open and cur_close < prev_low:
-            breakers.append(
-                {
-                    "side": "bear",
-                    "y0": prev_low,
-                    "y1": prev_high,
-                    "i": i,
-                }
-            )
-            continue
+    # i = nến phá (cur), i-1 = nến gốc (prev); i chạy 2 .. n-2
+    i = np.arange(2, len(df) - 1)
+    p = i - 1
+    # Bull breaker: prev bearish + cur close > prev high
+    bull = (c[p] < o[p]) & (c[i] > h[p])
+    # Bear breaker: prev bullish + cur close < prev low
+    bear = ~bull & (c[p] > o[p]) & (c[i] < l[p])
+
+    # duyệt từ cuối về đầu để breaker mới nhất được append trước (giống logic FVG của bạn)
+    for k in np.nonzero(bull | bear)[0][::-1]:
+        j = int(i[k])
+        breakers.append(
+            {
+                "side": "bull" if bull[k] else "bear",
+                "y0": float(l[j - 1]),
+                "y1": float(h[j - 1]),
+                "i": j,
+            }
+        )
 
     return breakers
     
  
 # --- [NEW] Model 5: Silver Bullet ---
-def entry_silver_bullet(df: pd.DataFrame):
-    fvgs = detect_fvg_zones(df)
+def entry_silver_bullet(df: pd.DataFrame, ctx: SMCContext = None):
+    ctx = ctx or smc_context(df)
+    # check volume trước (rẻ), FVG tính sau
+    last_vol = float(df.iloc[-1]["Volume"])
+    avg_vol = float(df["Volume"].tail(20).mean())
+    if last_vol <= avg_vol * 1.5:
+        return None
+
+    fvgs = ctx.fvgs()
     if not fvgs: 
         return None
 
@@ -486,11 +658,6 @@ def entry_silver_bullet(df: pd.DataFrame):
     # => phần tử ĐẦU (index 0) mới là zone "mới nhất"
     latest_fvg = fvgs[0]
 
-    last_vol = float(df.iloc[-1]["Volume"])
-    avg_vol = float(df["Volume"].tail(20).mean())
-    if last_vol <= avg_vol * 1.5:
-        return None
-
     last = df.iloc[-1]
     if latest_fvg["side"] == "bull":
         # retrace về FVG bull => BUY
@@ -507,7 +674,7 @@ def entry_silver_bullet(df: pd.DataFrame):
 
 
 # --- [NEW] Model 6: AMD ---
-def entry_amd_setup(df: pd.DataFrame):
+def entry_amd_setup(df: pd.DataFrame, ctx: SMCContext = None):
     recent = df.iloc[-7:-2]
     if len(recent) < 5:
         return None
@@ -516,7 +683,7 @@ def entry_amd_setup(df: pd.DataFrame):
     if range_pct >= 0.03:
         return None
 
-    sweep = detect_liquidity_sweep(df, lookback=5)
+    sweep = (ctx or smc_context(df)).sweep(lookback=5)
 
     if sweep == "SELL_SIDE":
         # sweep low -> buy
@@ -532,17 +699,21 @@ def entry_amd_setup(df: pd.DataFrame):
 
 
 # --- Old Models (Kept for compatibility) ---
-def entry_ls_bpr(df: pd.DataFrame):
-    sweep = detect_liquidity_sweep(df)
-    fvgs = detect_fvg_zones(df)
-    bpr = detect_bpr(fvgs)
+def entry_ls_bpr(df: pd.DataFrame, ctx: SMCContext = None):
+    ctx = ctx or smc_context(df)
+    sweep = ctx.sweep()
+    if sweep not in ("SELL_SIDE", "BUY_SIDE"): return None
+    bpr = ctx.bpr()
     if sweep == "SELL_SIDE" and bpr: return {"entry": "BUY", "zone": bpr, "model": "LS+BPR"}
     if sweep == "BUY_SIDE" and bpr: return {"entry": "SELL", "zone": bpr, "model": "LS+BPR"}
     return None
 
-def entry_mss_fvg_simple(df: pd.DataFrame):
-    mss = detect_mss(df)
-    fvgs = detect_fvg_zones(df)
+def entry_mss_fvg_simple(df: pd.DataFrame, ctx: SMCContext = None):
+    ctx = ctx or smc_context(df)
+    mss = ctx.mss()
+    if mss not in ("BULL", "BEAR"):
+        return None
+    fvgs = ctx.fvgs()
     if not fvgs:
         return None
 
@@ -559,9 +730,12 @@ def entry_mss_fvg_simple(df: pd.DataFrame):
     return None
 
 
-def entry_mss_ob_simple(df: pd.DataFrame):
-    mss = detect_mss(df)
-    obs = detect_order_blocks(df)
+def entry_mss_ob_simple(df: pd.DataFrame, ctx: SMCContext = None):
+    ctx = ctx or smc_context(df)
+    mss = ctx.mss()
+    if mss not in ("BULL", "BEAR"):
+        return None
+    obs = ctx.obs()
     if not obs:
         return None
 
@@ -577,10 +751,13 @@ def entry_mss_ob_simple(df: pd.DataFrame):
 
     return None
 
-def entry_smt_mss_ifvg(df: pd.DataFrame, df_pair: pd.DataFrame):
+def entry_smt_mss_ifvg(df: pd.DataFrame, df_pair: pd.DataFrame, ctx: SMCContext = None):
+    ctx = ctx or smc_context(df)
     smt = detect_smt(df, df_pair)
-    mss = detect_mss(df)
-    fvgs = detect_fvg_zones(df)
+    mss = ctx.mss()
+    if smt != mss or mss not in ("BULL", "BEAR"):
+        return None
+    fvgs = ctx.fvgs()
     if not fvgs:
         return None
 
@@ -597,10 +774,13 @@ def entry_smt_mss_ifvg(df: pd.DataFrame, df_pair: pd.DataFrame):
     return None
 
 
-def entry_smt_mss_bb(df: pd.DataFrame, df_pair: pd.DataFrame):
+def entry_smt_mss_bb(df: pd.DataFrame, df_pair: pd.DataFrame, ctx: SMCContext = None):
+    ctx = ctx or smc_context(df)
     smt = detect_smt(df, df_pair)
-    mss = detect_mss(df)
-    obs = detect_order_blocks(df)
+    mss = ctx.mss()
+    if smt != mss or mss not in ("BULL", "BEAR"):
+        return None
+    obs = ctx.obs()
     if not obs:
         return None
 
@@ -616,10 +796,10 @@ def entry_smt_mss_bb(df: pd.DataFrame, df_pair: pd.DataFrame):
 
     return None
 
-def entry_bos_pullback(df_htf: pd.DataFrame, df_ltf: pd.DataFrame):
+def entry_bos_pullback(df_htf: pd.DataFrame, df_ltf: pd.DataFrame, ctx: SMCContext = None):
     if df_ltf is None or len(df_ltf) < 3: return None
-    htf_mss = detect_mss(df_htf)
-    ltf_mss = detect_mss(df_ltf)
+    htf_mss = (ctx or smc_context(df_htf)).mss()
+    ltf_mss = smc_context(df_ltf).mss()
     if htf_mss and ltf_mss == htf_mss:
         last = df_ltf.iloc[-1]; prev = df_ltf.iloc[-2]
         z_low = float(min(prev["Open"], prev["Close"], prev["Low"]))
@@ -635,7 +815,7 @@ def entry_bos_pullback(df_htf: pd.DataFrame, df_ltf: pd.DataFrame):
 # =========================
 # ENTRY MODEL: Breaker Block Retest
 # =========================
-def entry_breaker_retest(df: pd.DataFrame):
+def entry_breaker_retest(df: pd.DataFrame, ctx: SMCContext = None):
     """
     Breaker Block Retest:
     - Bull breaker: phá lên -> retest -> BUY
@@ -644,7 +824,7 @@ def entry_breaker_retest(df: pd.DataFrame):
     detect_breaker_blocks() PHẢI trả về list breaker:
     [{side, y0, y1, i}, ...]
     """
-    breakers = detect_breaker_blocks(df)
+    breakers = (ctx or smc_context(df)).breakers()
     if not breakers:
         return None
 
@@ -681,72 +861,58 @@ def entry_breaker_retest(df: pd.DataFrame):
 # 6) AGGREGATOR & SCORING (UPDATED)
 # ==============================================================================
 
+@perf.timed("smc.detect_entry_models")
 def detect_entry_models(
     df_htf: pd.DataFrame,
     df_ltf=None,
     df_pair=None,
-    return_artifacts: bool = False
+    return_artifacts: bool = False,
+    ctx: SMCContext = None,
 ):
     """
     Tổng hợp tất cả các models theo thứ tự ưu tiên.
+    Mọi model dùng chung 1 SMCContext của df_htf (truyền `ctx` để dùng lại context của caller).
     Nếu return_artifacts=True: attach _ctx={fvgs, obs, sweep} để scanner reuse (unlock tốc độ).
     """
+    ctx = ctx or smc_context(df_htf)
 
     def _finalize_entry(e):
         if not e or not return_artifacts:
             return e
-
-        # NOTE: dùng đúng signature hiện tại của core
-        try:
-            fvgs = detect_fvg_zones(df_htf, max_zones=5, future_window=60)
-        except Exception:
-            fvgs = []
-
-        try:
-            # detect_order_blocks hiện dùng (lookback, max_obs)
-            obs = detect_order_blocks(df_htf, lookback=120, max_obs=5)
-        except Exception:
-            obs = []
-
-        try:
-            sweep = detect_liquidity_sweep(df_htf)
-        except Exception:
-            sweep = None
-
         e = dict(e)
-        e["_ctx"] = {"fvgs": fvgs, "obs": obs, "sweep": sweep}
+        e["_ctx"] = ctx.artifacts()
         return e
 
     # =========================
     # 1) Super Strong
     # =========================
-    e = entry_ls_mss_bb_fvg(df_htf)
+    e = entry_ls_mss_bb_fvg(df_htf, ctx=ctx)
     if e:
         return _finalize_entry(e)
 
     # =========================
     # 2) Strong
     # =========================
-    e = entry_silver_bullet(df_htf)
+    e = entry_silver_bullet(df_htf, ctx=ctx)
     if e:
         return _finalize_entry(e)
 
-    e = entry_ls_mss_fvg(df_htf)
+    e = entry_ls_mss_fvg(df_htf, ctx=ctx)
     if e:
         return _finalize_entry(e)
 
-    e = entry_breaker_retest(df_htf)
+    e = entry_breaker_retest(df_htf, ctx=ctx)
     if e:
         return _finalize_entry(e)
 
-    e = entry_ls_bpr(df_htf)
+    e = entry_ls_bpr(df_htf, ctx=ctx)
     if e:
         return _finalize_entry(e)
 
     # =========================
     # 3) Medium
     # =========================
-    e = entry_ote_pullback(df_htf)
+    e = entry_ote_pullback(df_htf, ctx=ctx)
     if e:
         return _finalize_entry(e)
 
@@ -754,19 +920,19 @@ def detect_entry_models(
     # 4) SMT & Simple
     # =========================
     if df_pair is not None:
-        e = entry_smt_mss_ifvg(df_htf, df_pair)
+        e = entry_smt_mss_ifvg(df_htf, df_pair, ctx=ctx)
         if e:
             return _finalize_entry(e)
 
-        e = entry_smt_mss_bb(df_htf, df_pair)
+        e = entry_smt_mss_bb(df_htf, df_pair, ctx=ctx)
         if e:
             return _finalize_entry(e)
 
-    e = entry_mss_fvg_simple(df_htf)
+    e = entry_mss_fvg_simple(df_htf, ctx=ctx)
     if e:
         return _finalize_entry(e)
 
-    e = entry_mss_ob_simple(df_htf)
+    e = entry_mss_ob_simple(df_htf, ctx=ctx)
     if e:
         return _finalize_entry(e)
 
@@ -774,7 +940,7 @@ def detect_entry_models(
     # 5) Trend Follow (HTF_BOS_LTF_PULLBACK)
     # =========================
     if df_ltf is not None:
-        e = entry_bos_pullback(df_htf, df_ltf)
+        e = entry_bos_pullback(df_htf, df_ltf, ctx=ctx)
         if e:
             return _finalize_entry(e)
 
@@ -868,4 +1034,257 @@ def is_valid_discount_premium(df, side):
 
 def detect_high_prob_ob(df): return detect_order_blocks(df)
 def detect_high_prob_fvg(df): return detect_fvg_zones(df)
-def get_intraday_poe(df): return None
\ No newline at end of file
+def get_intraday_poe(df): return None
+
+# ==============================================================================
+# 7b) BATCH ENGINE (symbols × bars × OHLCV) - Phase 1 cross-sectional
+# ==============================================================================
+OHLCV_COLS = ["Open", "High", "Low", "Close", "Volume"]
+
+
+def stack_ohlcv(frames: dict, symbols: list, bars: int):
+    """
+    Xếp frame của nhiều mã thành tensor (S, bars, 5) căn phải: nến cuối của mọi mã nằm ở cột -1,
+    phần thiếu phía trái = NaN. Return (tensor, lengths).
+    """
+    out = np.full((len(symbols), bars, len(OHLCV_COLS)), np.nan, dtype=np.float64)
+    lengths = np.zeros(len(symbols), dtype=np.int64)
+    for k, sym in enumerate(symbols):
+        df = frames.get(sym)
+        if df is None or df.empty:
+            continue
+        src = df if list(df.columns) == OHLCV_COLS else df[OHLCV_COLS]
+        arr = src.to_numpy(dtype=np.float64)[-bars:]
+        out[k, bars - len(arr):] = arr
+        lengths[k] = len(arr)
+    return out, lengths
+
+
+def _nan_reduce(fn, arr, axis=1):
+    with np.errstate(all="ignore"):
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            return fn(arr, axis=axis)
+
+
+def _last_true(mask: np.ndarray) -> np.ndarray:
+    """Index True cuối cùng theo axis=1 (-1 nếu không có)."""
+    width = mask.shape[1]
+    idx = width - 1 - np.argmax(mask[:, ::-1], axis=1)
+    return np.where(mask.any(axis=1), idx, -1)
+
+
+def batch_swings(h: np.ndarray, l: np.ndarray):
+    """Fractal 5 nến (lookback=2) cho cả batch; NaN padding tự cho False như bản 1 mã."""
+    sh = np.zeros(h.shape, dtype=bool)
+    sl = np.zeros(l.shape, dtype=bool)
+    if h.shape[1] > 5:
+        c = slice(2, -2)
+        sh[:, c] = (h[:, c] > h[:, :-4]) & (h[:, c] > h[:, 1:-3]) & (h[:, c] > h[:, 3:-1]) & (h[:, c] > h[:, 4:])
+        sl[:, c] = (l[:, c] < l[:, :-4]) & (l[:, c] < l[:, 1:-3]) & (l[:, c] < l[:, 3:-1]) & (l[:, c] < l[:, 4:])
+    return sh, sl
+
+
+def batch_ema(close: np.ndarray, span: int) -> np.ndarray:
+    """EMA(adjust=False) theo đúng recurrence của pandas ewm (kể cả NaN), chạy cùng lúc cho mọi mã."""
+    alpha = 1.0 / (1.0 + (span - 1) / 2.0)  # đúng công thức com -> alpha của pandas
+    factor = 1.0 - alpha
+    out = np.empty_like(close)
+    weighted = close[:, 0].copy()
+    old_wt = np.ones(close.shape[0])
+    out[:, 0] = weighted
+    for i in range(1, close.shape[1]):
+        cur = close[:, i]
+        obs = ~np.isnan(cur)
+        live = ~np.isnan(weighted)
+        step = live & obs
+        ow = np.where(live, old_wt * factor, old_wt)
+        with np.errstate(invalid="ignore"):
+            upd = (ow * weighted + alpha * cur) / (ow + alpha)
+        weighted = np.where(step & (weighted != cur), upd, weighted)
+        old_wt = np.where(step, 1.0, ow)
+        weighted = np.where(~live & obs, cur, weighted)
+        out[:, i] = weighted
+    return out
+
+
+def batch_mss(c_last, h, l, sh, sl) -> np.ndarray:
+    """detect_mss cho cả batch: 1 = BULL, -1 = BEAR, 0 = None."""
+    def _second_last(mask, vals):
+        cnt = mask.sum(axis=1)
+        cs = np.cumsum(mask, axis=1)
+        idx = np.argmax(mask & (cs == (cnt - 1)[:, None]), axis=1)
+        return cnt >= 2, vals[np.arange(len(vals)), idx]
+
+    ok_h, prev_h = _second_last(sh, h)
+    ok_l, prev_l = _second_last(sl, l)
+    bull = ok_h & (c_last > prev_h)
+    bear = ~bull & ok_l & (c_last < prev_l)
+    return bull.astype(np.int8) - bear.astype(np.int8)
+
+
+def batch_liquidity_sweep(h, l, c, lookback: int = 20) -> np.ndarray:
+    """detect_liquidity_sweep cho cả batch: 1 = SELL_SIDE, -1 = BUY_SIDE, 0 = None."""
+    rec_low = _nan_reduce(np.nanmin, l[:, -lookback:-1])
+    rec_high = _nan_reduce(np.nanmax, h[:, -lookback:-1])
+    sell = (l[:, -1] < rec_low) & (c[:, -1] > rec_low)
+    buy = ~sell & (h[:, -1] > rec_high) & (c[:, -1] < rec_high)
+    return sell.astype(np.int8) - buy.astype(np.int8)
+
+
+def _py_min(a, b):
+    return np.where(b < a, b, a)
+
+
+def _py_max(a, b):
+    return np.where(b > a, b, a)
+
+
+@perf.timed("smc.entry_batch")
+def detect_entry_models_batch(ohlcv: np.ndarray, lengths: np.ndarray) -> dict:
+    """
+    detect_entry_models(df_htf) cho cả batch (không df_ltf/df_pair).
+
+    Các model chỉ cần swing/MSS/sweep/breaker/OTE được quyết ngay trên tensor. Mã nào cần tới
+    FVG/OB (resolved=False) thì caller chạy detect_entry_models với context đã prime sẵn.
+    Return dict: entries (list), resolved, swing_high, swing_low, mss, sweep.
+    """
+    o, h, l, c, v = (ohlcv[:, :, k] for k in range(5))
+    n_sym, width = c.shape
+    rows = np.arange(n_sym)
+    sh, sl = batch_swings(h, l)
+    c_last, h_last, l_last, v_last = c[:, -1], h[:, -1], l[:, -1], v[:, -1]
+
+    mss = batch_mss(c_last, h, l, sh, sl)
+    sweep = batch_liquidity_sweep(h, l, c, lookback=20)
+
+    # Silver Bullet: nến cuối không vượt 1.5x vol TB20 thì chắc chắn None
+    tail_v = np.ascontiguousarray(v[:, -20:])
+    cnt_v = (~np.isnan(tail_v)).sum(axis=1)
+    with np.errstate(all="ignore"):
+        avg_v = np.nansum(tail_v, axis=1) / cnt_v
+    vol_spike = ~(v_last <= avg_v * 1.5)
+
+    # Breaker Retest: breaker mới nhất (i = 2 .. n-2 trong frame của từng mã)
+    i = np.arange(2, width - 1)
+    p = i - 1
+    local_ok = (i[None, :] - (width - lengths)[:, None]) >= 2
+    bull = (c[:, p] < o[:, p]) & (c[:, i] > h[:, p]) & local_ok
+    bear = ~bull & (c[:, p] > o[:, p]) & (c[:, i] < l[:, p]) & local_ok
+    k_last = _last_true(bull | bear)
+    has_brk = k_last >= 0
+    kk = np.where(has_brk, k_last, 0)
+    brk_bull = bull[rows, kk]
+    bp = p[kk]
+    b_lo = _py_min(l[rows, bp], h[rows, bp])
+    b_hi = _py_max(l[rows, bp], h[rows, bp])
+    brk_buy = has_brk & brk_bull & (l_last <= b_hi) & (c_last >= b_lo)
+    brk_sell = has_brk & ~brk_bull & (h_last >= b_lo) & (c_last <= b_hi)
+
+    # OTE Pullback (compute_smc_levels)
+    last_sh = _last_true(sh)
+    last_sl = _last_true(sl)
+    trend_known = (last_sh >= 0) & (last_sl >= 0)
+    up = trend_known & (last_sh > last_sl)
+    down = trend_known & ~up
+    pos = np.arange(width)[None, :]
+    leg_low_up = l[rows, np.maximum(last_sl, 0)]
+    leg_high_up = _nan_reduce(np.nanmax, np.where(pos >= last_sl[:, None], h, np.nan))
+    leg_high_dn = h[rows, np.maximum(last_sh, 0)]
+    leg_low_dn = _nan_reduce(np.nanmin, np.where(pos >= last_sh[:, None], l, np.nan))
+    bos_up = up & (leg_high_up > leg_low_up)
+    bos_dn = down & (leg_high_dn > leg_low_dn)
+    diff_up = leg_high_up - leg_low_up
+    diff_dn = leg_high_dn - leg_low_dn
+    ote_low = np.where(bos_up, leg_low_up + diff_up * 0.62, np.where(bos_dn, leg_high_dn - diff_dn * 0.79, 0.0))
+    ote_high = np.where(bos_up, leg_low_up + diff_up * 0.79, np.where(bos_dn, leg_high_dn - diff_dn * 0.62, 0.0))
+    o_lo = _py_min(ote_low, ote_high)
+    o_hi = _py_max(ote_low, ote_high)
+    ote_hit = (bos_up | bos_dn) & (o_lo <= c_last) & (c_last <= o_hi)
+
+    # Không sweep + không vol spike => Unicorn / Silver Bullet / ICT 2022 / LS+BPR đều None
+    quiet = (sweep == 0) & ~vol_spike
+    entries = [None] * n_sym
+    resolved = np.zeros(n_sym, dtype=bool)
+    for k in np.nonzero(quiet)[0]:
+        if brk_buy[k] or brk_sell[k]:
+            entries[k] = {"entry": "BUY" if brk_buy[k] else "SELL",
+                          "zone": {"y0": float(b_lo[k]), "y1": float(b_hi[k])},
+                          "model": "Breaker Block Retest"}
+        elif ote_hit[k]:
+            entries[k] = {"entry": "BUY" if bos_up[k] else "SELL",
+                          "zone": {"y0": float(o_lo[k]), "y1": float(o_hi[k])},
+                          "model": "OTE Pullback (Fibo 0.7)"}
+        elif mss[k] != 0:
+            continue  # MSS+FVG / MSS+OB cần FVG/OB
+        resolved[k] = True
+
+    return {
+        "entries": entries,
+        "resolved": resolved,
+        "ohlcv": ohlcv,
+        "lengths": lengths,
+        "swing_high": sh,
+        "swing_low": sl,
+        "mss": np.array([None, "BULL", "BEAR"], dtype=object)[mss],
+        "sweep": np.array([None, "SELL_SIDE", "BUY_SIDE"], dtype=object)[sweep],
+        "breaker_bull": bull,
+        "breaker_bear": bear,
+        "last_sh": last_sh,
+        "last_sl": last_sl,
+        "leg": bos_up.astype(np.int8) - bos_dn.astype(np.int8),
+        "ote_low": ote_low,
+        "ote_high": ote_high,
+    }
+
+
+def batch_context(state: dict, k: int, df: pd.DataFrame) -> SMCContext:
+    """
+    SMCContext cho mã thứ k của batch: frame đã có cột swing, prime sẵn mss/sweep/levels/breakers
+    từ tensor nên entry model chỉ còn phải tính FVG/OB.
+    """
+    n = len(df)
+    width = state["swing_high"].shape[1]
+    off = width - n
+    data = {col: df[col].to_numpy() for col in df.columns}
+    data["Swing_High"] = state["swing_high"][k, off:]
+    data["Swing_Low"] = state["swing_low"][k, off:]
+    frame = pd.DataFrame(data, index=df.index)
+
+    ctx = smc_context(frame)
+    ctx.prime("frame", frame)
+    ctx.prime("mss", state["mss"][k])
+    ctx.prime(("sweep", 20), state["sweep"][k])
+
+    # compute_smc_levels
+    idx = frame.index
+    last_sh = idx[state["last_sh"][k] - off] if state["last_sh"][k] >= 0 else None
+    last_sl = idx[state["last_sl"][k] - off] if state["last_sl"][k] >= 0 else None
+    trend = "SIDEWAY"
+    if last_sh is not None and last_sl is not None:
+        trend = "UP" if last_sh > last_sl else "DOWN"
+    leg = int(state["leg"][k])
+    ctx.prime("levels", {
+        "trend": trend,
+        "last_sh": last_sh,
+        "last_sl": last_sl,
+        "ote_low": float(state["ote_low"][k]),
+        "ote_high": float(state["ote_high"][k]),
+        "leg_type": "BOS_UP" if leg > 0 else ("BOS_DOWN" if leg < 0 else "UNKNOWN"),
+        "bos_index": idx[-1],
+    })
+
+    # detect_breaker_blocks (mới nhất trước); cột m của mask <-> nến phá ở vị trí m + 2
+    ohlcv = state["ohlcv"]
+    bull = state["breaker_bull"][k]
+    breakers = []
+    for m in np.nonzero(bull | state["breaker_bear"][k])[0][::-1]:
+        j = int(m) + 2
+        breakers.append({
+            "side": "bull" if bull[m] else "bear",
+            "y0": float(ohlcv[k, j - 1, 2]),
+            "y1": float(ohlcv[k, j - 1, 1]),
+            "i": j - off,
+        })
+    ctx.prime("breakers", breakers)
+    return ctx
@@ -0,0 +1,285 @@
+# source_router.py - CHỌN NGUỒN DỮ LIỆU THEO SỨC KHOẺ (LATENCY/LỖI) + CIRCUIT BREAKER + HEDGING
+"""Latency-aware routing across the vnstock data sources (vnd / tcbs / vci).
+
+Per (source, endpoint) — endpoint being e.g. ``"history:1D"`` — the router keeps
+a rolling window of latencies and outcomes. ``rank()`` puts the healthiest
+source first (median latency weighted by recent error rate; sources without
+samples keep the caller's preference order). A circuit breaker skips a source
+after repeated failures, re-admitting it for a single trial call once its
+cooldown has passed.
+
+``call()`` / ``acall()`` run the primary source; if it has not answered within
+its own tail latency (HEDGE_QUANTILE of the window), one hedged request goes to
+the next source and whichever returns a usable result first wins. Losing calls
+still finish in the background and feed the stats.
+
+In ``acall()`` the hedge clock and the latency sample start only when the call
+reports that its request has actually started (``afn(source, on_start)``, e.g.
+after FetchEngine has a slot and a token), so time queued behind the rate
+limits neither triggers hedges nor skews ``rank()``. Losers still queued when
+a winner returns are cancelled::
+
+    src, df = ROUTER.call("history:1D", ["vnd", "tcbs", "vci"], lambda s: fetch(s, "FPT"))
+"""
+import time
+import asyncio
+import threading
+import concurrent.futures
+from collections import deque
+
+WINDOW = 50              # số mẫu gần nhất / (nguồn, endpoint)
+MIN_SAMPLES = 5          # ít hơn -> hedge sau HEDGE_DEFAULT_S
+HEDGE_QUANTILE = 0.9
+HEDGE_DEFAULT_S = 2.0
+HEDGE_MIN_S = 0.3
+HEDGE_MAX_S = 8.0
+ERROR_WEIGHT = 4.0       # score = median latency * (1 + ERROR_WEIGHT * error_rate)
+BREAKER_FAILS = 3        # lỗi liên tiếp -> mở breaker
+BREAKER_ERROR_RATE = 0.6 # hoặc tỉ lệ lỗi trong window (khi đủ BREAKER_MIN_CALLS)
+BREAKER_MIN_CALLS = 10
+BREAKER_COOLDOWN_S = 30.0
+BREAKER_COOLDOWN_MAX_S = 300.0
+
+
+def _has_rows(result) -> bool:
+    return result is not None and not getattr(result, "empty", False)
+
+
+class _Health:
+    """Thống kê 1 (nguồn, endpoint) + trạng thái breaker."""
+
+    def __init__(self):
+        self.latency = deque(maxlen=WINDOW)   # giây, chỉ lần gọi trả kết quả
+        self.outcome = deque(maxlen=WINDOW)   # 1 = có dữ liệu, 0 = lỗi/rỗng
+        self.fails = 0                        # exception liên tiếp
+        self.trips = 0
+        self.open_until = 0.0
+        self.trial = False                    # half-open: đang có 1 lần thử
+
+    def error_rate(self) -> float:
+        return 1.0 - sum(self.outcome) / len(self.outcome) if self.outcome else 0.0
+
+    def median(self):
+        if not self.latency:
+            return None
+        xs = sorted(self.latency)
+        return xs[len(xs) // 2]
+
+    def quantile(self, q: float):
+        if len(self.latency) < MIN_SAMPLES:
+            return None
+        xs = sorted(self.latency)
+        return xs[min(len(xs) - 1, int(q * len(xs)))]
+
+    def score(self):
+        med = self.median()
+        return None if med is None else med * (1.0 + ERROR_WEIGHT * self.error_rate())
+
+
+class SourceRouter:
+    def __init__(self, max_threads: int = 16):
+        self._health = {}
+        self._lock = threading.Lock()
+        self._pool = None
+        self.max_threads = int(max_threads)
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def _h(self, source: str, endpoint: str) -> _Health:
+        key = (source, endpoint)
+        h = self._health.get(key)
+        if h is None:
+            h = self._health[key] = _Health()
+        return h
+
+    def _executor(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_threads, thread_name_prefix="route")
+        return self._pool
+
+    # ---------------- ranking / breaker ----------------
+    def rank(self, sources, endpoint: str) -> list:
+        """Nguồn khoẻ trước; breaker đang mở bị bỏ (trừ khi tất cả đều mở)."""
+        now = time.monotonic()
+        usable, blocked = [], []
+        with self._lock:
+            for pos, src in enumerate(sources):
+                h = self._h(src, endpoint)
+                if h.open_until > now or h.trial:
+                    blocked.append((h.open_until, pos, src))
+                    continue
+                sc = h.score()
+                # chưa có mẫu: giữ thứ tự ưu tiên của caller, đứng trước nguồn đã đo
+                usable.append((sc is not None, sc or 0.0, pos, src))
+        if not usable:
+            return [src for _, _, src in sorted(blocked)]
+        return [src for *_, src in sorted(usable)]
+
+    def _begin(self, source: str, endpoint: str):
+        with self._lock:
+            h = self._h(source, endpoint)
+            if h.open_until and time.monotonic() >= h.open_until:
+                h.trial = True  # half-open: chỉ 1 request thử
+
+    def record(self, source: str, endpoint: str, seconds: float, ok: bool, error: bool = False):
+        """ok: có dữ liệu dùng được | error: exception (tính cho breaker; rỗng thì không)."""
+        with self._lock:
+            h = self._h(source, endpoint)
+            h.outcome.append(1 if ok else 0)
+            if not error:
+                h.latency.append(seconds)
+            if ok or not error:
+                h.fails = 0
+                if h.trial or h.open_until:
+                    h.trial, h.open_until, h.trips = False, 0.0, 0
+                return
+            h.fails += 1
+            tripped = h.trial or h.fails >= BREAKER_FAILS or (
+                len(h.outcome) >= BREAKER_MIN_CALLS and h.error_rate() >= BREAKER_ERROR_RATE
+            )
+            if tripped:
+                h.trips += 1
+                h.trial = False
+                h.fails = 0
+                h.open_until = time.monotonic() + min(BREAKER_COOLDOWN_MAX_S, BREAKER_COOLDOWN_S * 2 ** (h.trips - 1))
+
+    def hedge_after(self, source: str, endpoint: str) -> float:
+        with self._lock:
+            q = self._h(source, endpoint).quantile(HEDGE_QUANTILE)
+        return min(HEDGE_MAX_S, max(HEDGE_MIN_S, q if q is not None else HEDGE_DEFAULT_S))
+
+    # ---------------- calls ----------------
+    def call(self, endpoint: str, sources, fn, valid=_has_rows):
+        """
+        fn(source) -> result (blocking). Thử theo rank(); primary chậm hơn tail latency của nó
+        -> bắn thêm 1 request sang nguồn kế tiếp, lấy kết quả hợp lệ về trước.
+        Return (source, result) hoặc (None, None) nếu mọi nguồn đều lỗi/rỗng.
+        """
+        order = self.rank(sources, endpoint)
+        pool = self._executor()
+        pending = {}
+        nxt = 0
+
+        def launch():
+            nonlocal nxt
+            src = order[nxt]
+            nxt += 1
+            self._begin(src, endpoint)
+            t0 = time.perf_counter()
+            fut = pool.submit(fn, src)
+            fut.add_done_callback(lambda f, s=src, t=t0: self._record_future(s, endpoint, t, f, valid))
+            pending[fut] = src
+            return src
+
+        primary = launch()
+        while pending:
+            timeout = self.hedge_after(primary, endpoint) if len(pending) == 1 and nxt < len(order) else None
+            done, _ = concurrent.futures.wait(pending, timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED)
+            if not done:
+                self.hedges += 1
+                launch()
+                continue
+            for fut in done:
+                src = pending.pop(fut)
+                if fut.exception() is None and valid(fut.result()):
+                    if src != primary:
+                        self.hedge_wins += 1
+                    return src, fut.result()
+            if not pending and nxt < len(order):
+                primary = launch()
+        return None, None
+
+    async def acall(self, endpoint: str, sources, afn, valid=_has_rows):
+        """
+        Bản asyncio của call(): afn(source, on_start) là coroutine (vd: FetchEngine.call(..., on_start=on_start)).
+        Hedge timer + latency tính từ lần gọi on_start() cuối (request thật bắt đầu), không từ lúc xếp hàng.
+        """
+        order = self.rank(sources, endpoint)
+        pending = {}  # task -> (source, started) ; started = [t0 | None, Event]
+        nxt = 0
+
+        def launch():
+            nonlocal nxt
+            src = order[nxt]
+            nxt += 1
+            self._begin(src, endpoint)
+            started = [None, asyncio.Event()]
+
+            def on_start():
+                started[0] = time.perf_counter()  # retry sau throttle: đo lại từ lần thử cuối
+                started[1].set()
+
+            task = asyncio.ensure_future(afn(src, on_start))
+            task.add_done_callback(lambda f, s=src, st=started: self._record_future(s, endpoint, st[0], f, valid))
+            pending[task] = (src, started)
+            return src
+
+        def cancel_queued():
+            for task, (_, started) in pending.items():
+                if started[0] is None:
+                    task.cancel()  # chưa gửi request -> không tốn token/HTTP call
+
+        primary = launch()
+        try:
+            while pending:
+                timeout = None
+                if len(pending) == 1 and nxt < len(order):
+                    task, (src, started) = next(iter(pending.items()))
+                    if started[0] is None:
+                        # còn xếp hàng chờ slot/token: chưa tính giờ hedge, chờ request bắt đầu (hoặc xong)
+                        waiter = asyncio.ensure_future(started[1].wait())
+                        try:
+                            await asyncio.wait({task, waiter}, return_when=asyncio.FIRST_COMPLETED)
+                        finally:
+                            waiter.cancel()
+                        if not task.done():
+                            continue
+                    else:
+                        timeout = max(0.0, self.hedge_after(src, endpoint) - (time.perf_counter() - started[0]))
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    self.hedges += 1
+                    launch()
+                    continue
+                for task in done:
+                    src, _ = pending.pop(task)
+                    if not task.cancelled() and task.exception() is None and valid(task.result()):
+                        if src != primary:
+                            self.hedge_wins += 1
+                        return src, task.result()
+                if not pending and nxt < len(order):
+                    primary = launch()
+            return None, None
+        finally:
+            cancel_queued()
+
+    def _record_future(self, source, endpoint, t0, fut, valid):
+        if fut.cancelled() or t0 is None:  # huỷ / chưa từng gửi request: không có mẫu latency
+            return
+        exc = fut.exception()
+        ok = exc is None and valid(fut.result())
+        self.record(source, endpoint, time.perf_counter() - t0, ok=ok, error=exc is not None)
+
+    def snapshot(self) -> dict:
+        """{endpoint: {source: {n, p50_s, p90_s, err, open_s}}} + số lần hedge."""
+        now = time.monotonic()
+        out = {}
+        with self._lock:
+            for (src, ep), h in self._health.items():
+                if not h.outcome:
+                    continue
+                med, q = h.median(), h.quantile(HEDGE_QUANTILE)
+                out.setdefault(ep, {})[src] = {
+                    "n": len(h.outcome),
+                    "p50_s": round(med, 3) if med is not None else None,
+                    "p90_s": round(q, 3) if q is not None else None,
+                    "err": round(h.error_rate(), 2),
+                    "open_s": round(max(0.0, h.open_until - now), 1),
+                }
+        return {"sources": out, "hedges": self.hedges, "hedge_wins": self.hedge_wins}
+
+
+# Dùng chung trong process (data.fetch_stock_data, pipeline_manager)
+ROUTER = SourceRouter()
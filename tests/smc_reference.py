@@ -0,0 +1,104 @@
+"""Bản vòng lặp cũ của các detector SMC: chỉ dùng làm chuẩn đối chiếu cho test (không ship trong smc_core)."""
+import numpy as np
+import pandas as pd
+
+from smc_core import ensure_smc_columns
+
+
+def detect_swings(df: pd.DataFrame, lookback: int = 2) -> pd.DataFrame:
+    df = df.copy()
+    df["Swing_High"] = False
+    df["Swing_Low"] = False
+    h = df["High"].values; l = df["Low"].values; n = len(df)
+    if lookback == 2 and n > 5:
+        for i in range(2, n - 2):
+            df.iat[i, df.columns.get_loc("Swing_High")] = bool(h[i] > h[i-2] and h[i] > h[i-1] and h[i] > h[i+1] and h[i] > h[i+2])
+            df.iat[i, df.columns.get_loc("Swing_Low")] = bool(l[i] < l[i-2] and l[i] < l[i-1] and l[i] < l[i+1] and l[i] < l[i+2])
+        return df
+    for i in range(lookback, n - lookback):
+        if h[i] == np.max(h[i - lookback:i + lookback + 1]):
+            df.iat[i, df.columns.get_loc("Swing_High")] = True
+        if l[i] == np.min(l[i - lookback:i + lookback + 1]):
+            df.iat[i, df.columns.get_loc("Swing_Low")] = True
+    return df
+
+
+def detect_fvg_zones(df: pd.DataFrame, max_zones: int = 5, future_window: int = 60) -> list:
+    if df is None or df.empty or len(df) < 5:
+        return []
+    highs = df["High"].values; lows = df["Low"].values; dates = df.index
+    min_gap = (df["High"] - df["Low"]).mean() * 0.3
+    zones = []
+    for i in range(len(df) - 2, 2, -1):
+        if len(zones) >= max_zones: break
+        if highs[i - 2] < lows[i]:
+            if (lows[i] - highs[i - 2]) > min_gap:
+                future_lows = lows[i + 1:i + 1 + int(future_window)] if future_window else lows[i + 1:]
+                mid = (lows[i] + highs[i-2]) / 2
+                if not (len(future_lows) > 0 and np.min(future_lows) <= mid):
+                    zones.append({"type": "FVG_BULL", "side": "bull", "y0": float(highs[i-2]), "y1": float(lows[i]), "bottom": float(highs[i-2]), "top": float(lows[i]), "start_idx": dates[i-2]})
+        elif lows[i - 2] > highs[i]:
+            if (lows[i - 2] - highs[i]) > min_gap:
+                future_highs = highs[i + 1:i + 1 + int(future_window)] if future_window else highs[i + 1:]
+                mid = (lows[i-2] + highs[i]) / 2
+                if not (len(future_highs) > 0 and np.max(future_highs) >= mid):
+                    zones.append({"type": "FVG_BEAR", "side": "bear", "y0": float(highs[i]), "y1": float(lows[i-2]), "bottom": float(highs[i]), "top": float(lows[i-2]), "start_idx": dates[i-2]})
+    return zones
+
+
+def detect_order_blocks(df: pd.DataFrame, lookback: int = 120, max_obs: int = 5) -> list:
+    if df is None or df.empty or len(df) < 30:
+        return []
+    df = ensure_smc_columns(df, copy=True)
+    if lookback and len(df) > lookback:
+        df = df.tail(lookback)
+    closes = df["Close"].values; highs = df["High"].values; lows = df["Low"].values; dates = df.index
+    sw_highs = np.where(df["Swing_High"].values)[0]
+    sw_lows = np.where(df["Swing_Low"].values)[0]
+    obs = []
+    for idx in sw_highs:
+        break_idx = np.where(closes[idx+1:] > highs[idx])[0]
+        if len(break_idx) > 0:
+            valid_lows = sw_lows[sw_lows < idx + 1 + break_idx[0]]
+            if len(valid_lows) > 0:
+                origin = valid_lows[-1]
+                if closes[-1] > lows[origin]:
+                    obs.append({"type": "OB_BULL", "side": "bull", "y0": float(lows[origin]), "y1": float(highs[origin]), "bottom": float(lows[origin]), "top": float(highs[origin]), "start_idx": dates[origin]})
+    for idx in sw_lows:
+        break_idx = np.where(closes[idx+1:] < lows[idx])[0]
+        if len(break_idx) > 0:
+            valid_highs = sw_highs[sw_highs < idx + 1 + break_idx[0]]
+            if len(valid_highs) > 0:
+                origin = valid_highs[-1]
+                if closes[-1] < highs[origin]:
+                    obs.append({"type": "OB_BEAR", "side": "bear", "y0": float(lows[origin]), "y1": float(highs[origin]), "bottom": float(lows[origin]), "top": float(highs[origin]), "start_idx": dates[origin]})
+    obs = sorted(obs, key=lambda x: x["start_idx"])
+    return obs[-max_obs:]
+
+
+def detect_breaker_blocks(df: pd.DataFrame) -> list:
+    breakers = []
+    if df is None or len(df) < 3:
+        return breakers
+    for i in range(len(df) - 2, 1, -1):
+        prev = df.iloc[i - 1]; cur = df.iloc[i]
+        prev_open = float(prev["Open"]); prev_close = float(prev["Close"])
+        prev_high = float(prev["High"]); prev_low = float(prev["Low"])
+        cur_close = float(cur["Close"])
+        if prev_close < prev_open and cur_close > prev_high:
+            breakers.append({"side": "bull", "y0": prev_low, "y1": prev_high, "i": i})
+            continue
+        if prev_close > prev_open and cur_close < prev_low:
+            breakers.append({"side": "bear", "y0": prev_low, "y1": prev_high, "i": i})
+    return breakers
+
+
+def detect_liquidity_sweep(df: pd.DataFrame, lookback: int = 20):
+    if df is None or df.empty or len(df) < lookback + 2:
+        return None
+    recent = df.iloc[-lookback:-1]; last = df.iloc[-1]
+    if float(last["Low"]) < float(recent["Low"].min()) and float(last["Close"]) > float(recent["Low"].min()):
+        return "SELL_SIDE"
+    if float(last["High"]) > float(recent["High"].max()) and float(last["Close"]) < float(recent["High"].max()):
+        return "BUY_SIDE"
+    return None
@@ -0,0 +1,113 @@
+"""write_bars_bulk append/upsert + manifest accounting trên store tạm (tmp_path)."""
+import numpy as np
+import pandas as pd
+import pytest
+
+import ohlcv_store as store
+import perf
+
+DAYS = pd.bdate_range("2026-01-05", "2026-04-30")  # 4 tháng -> nhiều partition
+
+
+def bars(dates, base: float = 10.0) -> pd.DataFrame:
+    n = len(dates)
+    close = base + np.arange(n, dtype=float)
+    return pd.DataFrame(
+        {"Open": close - 0.5, "High": close + 1, "Low": close - 1, "Close": close, "Volume": np.full(n, 1000.0)},
+        index=pd.DatetimeIndex(dates, name="Date"),
+    )
+
+
+def assert_manifest_exact(root, symbols):
+    """rows/first/last cộng dồn khi ghi phải khớp bản đếm lại từ parquet."""
+    live = {s: dict(store.load_manifest("1D", root, fresh=True)[s]) for s in symbols}
+    rebuilt = store.rebuild_manifest("1D", root)
+    for s in symbols:
+        df = store.read_bars(s, "1D", root=root)
+        assert live[s]["rows"] == rebuilt[s]["rows"] == len(df)
+        assert pd.Timestamp(live[s]["first"]) == df.index[0]
+        assert pd.Timestamp(live[s]["last"]) == df.index[-1]
+        assert live[s]["last_close"] == float(df["Close"].iloc[-1])
+
+
+@pytest.fixture
+def root(tmp_path):
+    return str(tmp_path / "store")
+
+
+def test_append_new_tail_and_patch_last(root):
+    store.write_bars_bulk({"AAA": bars(DAYS[:40]), "BBB": bars(DAYS[:40])}, "1D", root=root)
+    assert_manifest_exact(root, ["AAA", "BBB"])
+
+    # Refresh kiểu bulk update: tải lại 10 nến cuối (giá khác) + 5 nến mới; nến cuối cũ là nến đang chạy
+    refetch = bars(DAYS[30:45], base=500.0)
+    with perf.collect() as rec:
+        n = store.write_bars_bulk({"AAA": refetch}, "1D", root=root)
+    counters = rec.as_dict()["counters"]
+    assert n == 6  # nến cuối cũ (vá) + 5 nến mới
+    assert counters["store.append_overlap_skipped"] == 9
+    assert "store.append_gap_filled" not in counters
+
+    df = store.read_bars("AAA", "1D", root=root)
+    assert len(df) == 45
+    assert df.loc[DAYS[39], "Close"] == refetch.loc[DAYS[39], "Close"]  # nến cuối được vá
+    assert df.loc[DAYS[35], "Close"] == bars(DAYS[:40]).loc[DAYS[35], "Close"]  # nến đã chốt giữ nguyên
+    assert_manifest_exact(root, ["AAA", "BBB"])
+
+
+def test_append_fills_gap_inside_history(root):
+    gap = DAYS[20:30]
+    store.write_bars_bulk({"AAA": bars(DAYS[:60].difference(gap))}, "1D", root=root)
+    assert store.load_manifest("1D", root, fresh=True)["AAA"]["rows"] == 50
+
+    full = bars(DAYS[:60], base=300.0)
+    with perf.collect() as rec:
+        store.write_bars_bulk({"AAA": full}, "1D", root=root)
+    counters = rec.as_dict()["counters"]
+    assert counters["store.append_gap_filled"] == len(gap)
+    assert counters["store.append_overlap_skipped"] == 49  # mọi nến đã có trừ nến cuối
+
+    df = store.read_bars("AAA", "1D", root=root)
+    assert df.index.equals(DAYS[:60])
+    assert (df.loc[gap, "Close"] == full.loc[gap, "Close"]).all()  # gap lấy từ bản mới
+    assert df.loc[DAYS[5], "Close"] == 15.0  # nến đã có không bị ghi đè
+    assert_manifest_exact(root, ["AAA"])
+
+
+def test_upsert_older_window(root):
+    store.write_bars_bulk({"AAA": bars(DAYS[20:80])}, "1D", root=root)
+
+    # Ghi đè khúc giữa (giá điều chỉnh): số nến không đổi
+    adjusted = bars(DAYS[30:50], base=900.0)
+    store.write_bars_bulk({"AAA": adjusted}, "1D", root=root, mode="upsert")
+    df = store.read_bars("AAA", "1D", root=root)
+    assert len(df) == 60
+    assert (df.loc[DAYS[30:50], "Close"] == adjusted["Close"]).all()
+    assert_manifest_exact(root, ["AAA"])
+
+    # Khúc cũ hơn first, chồng 5 nến với lịch sử: chỉ 20 nến mới được đếm
+    store.write_bars_bulk({"AAA": bars(DAYS[:25], base=1.0)}, "1D", root=root, mode="upsert")
+    entry = store.load_manifest("1D", root, fresh=True)["AAA"]
+    assert entry["rows"] == 80
+    assert pd.Timestamp(entry["first"]) == DAYS[0]
+    assert_manifest_exact(root, ["AAA"])
+
+
+def test_deltas_then_compact_store(root):
+    store.write_bars_bulk({"AAA": bars(DAYS[:10]), "BBB": bars(DAYS[:10])}, "1D", root=root)
+    for i in range(10, len(DAYS), 7):  # mỗi lần ghi = 1 delta / tháng chạm tới
+        chunk = DAYS[i - 1:i + 7]
+        store.write_bars_bulk({"AAA": bars(chunk, base=i), "BBB": bars(chunk, base=2 * i)}, "1D", root=root)
+    months = store._list_months("1D", root)
+    assert sum(len(store._delta_files("1D", m, root)) for m in months) > len(months)
+
+    before = {s: store.read_bars(s, "1D", root=root) for s in ("AAA", "BBB")}
+    manifest = store.load_manifest("1D", root, fresh=True)
+    assert store.compact_store("1D", root=root) > 0
+    assert all(not store._delta_files("1D", m, root) for m in months)
+
+    for s, df in before.items():
+        pd.testing.assert_frame_equal(store.read_bars(s, "1D", root=root), df)
+        assert len(df) == len(DAYS)
+    assert store.load_manifest("1D", root, fresh=True) == manifest  # compact không đổi manifest
+    assert_manifest_exact(root, ["AAA", "BBB"])
@@ -0,0 +1,22 @@
+"""Phase 1 batch (symbols x bars tensor) must give the same candidates / reject reasons as the per-symbol path."""
+import pytest
+
+from test_smc_vectorized import make_frame
+
+try:
+    import scanner
+except Exception as e:  # scanner kéo theo vnstock/pandas_ta; môi trường thiếu -> bỏ qua
+    pytest.skip(f"scanner not importable: {e}", allow_module_level=True)
+
+
+@pytest.mark.parametrize("seed", range(4))
+@pytest.mark.parametrize("kind", ["walk", "trend", "gappy"])
+def test_phase1_batch_matches_single(seed, kind):
+    base = make_frame(300, seed, kind)
+    frames = {f"T{k:02d}": base.iloc[k * 3:300 - k * 5] * (1 + k % 3) for k in range(24)}
+    frames["SHORT"] = base.iloc[:15]
+    cands, rej = scanner._phase1_batch(list(frames), frames)
+    got = {c["Symbol"]: (c, "OK") for c in cands}
+    got.update({sym: (None, reason) for sym, reason in rej})
+    for sym, fr in frames.items():
+        assert repr(got.get(sym)) == repr(scanner._phase1_d1_candidate(sym, df_d1=fr)), sym
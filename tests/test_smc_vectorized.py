@@ -0,0 +1,82 @@
+"""Vectorized SMC detectors must match their loop reference implementations (smc_reference) bar for bar."""
+import numpy as np
+import pandas as pd
+import pytest
+
+import smc_core
+import smc_reference as ref_impl
+
+SIZES = [0, 1, 2, 3, 4, 5, 6, 7, 11, 21, 22, 29, 30, 31, 61, 150, 400]
+KINDS = ["walk", "flat", "trend", "gappy", "ties"]
+SEEDS = range(6)
+
+
+def make_frame(n: int, seed: int, kind: str = "walk") -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    if kind == "flat":
+        close = np.full(n, 25.0)
+    elif kind == "trend":
+        close = 20 + np.arange(n) * 0.3 * (1 if seed % 2 else -1) + 50
+    elif kind == "gappy":
+        close = 50 + np.cumsum(rng.standard_normal(n) * 3 + rng.choice([-4, 0, 0, 4], n))
+    else:
+        close = 50 + np.cumsum(rng.standard_normal(n))
+    opens = close + rng.standard_normal(n) * 0.5 * (kind != "flat")
+    high = np.maximum(opens, close) + np.abs(rng.standard_normal(n)) * (kind != "flat")
+    low = np.minimum(opens, close) - np.abs(rng.standard_normal(n)) * (kind != "flat")
+    df = pd.DataFrame({
+        "Open": opens, "High": high, "Low": low, "Close": close,
+        "Volume": rng.integers(10_000, 1_000_000, n).astype(float),
+    }, index=pd.bdate_range("2020-01-01", periods=n))
+    if kind == "ties":
+        df[["Open", "High", "Low", "Close"]] = df[["Open", "High", "Low", "Close"]].round(0)  # đỉnh/đáy bằng nhau
+    return df
+
+
+CASES = [(n, seed, kind) for kind in KINDS for n in SIZES for seed in (SEEDS if n >= 30 else (0,))]
+
+
+def _same(a, b):
+    return repr(a) == repr(b)
+
+
+@pytest.mark.parametrize("n,seed,kind", CASES)
+@pytest.mark.parametrize("lookback", [1, 2, 3, 5])
+def test_detect_swings(n, seed, kind, lookback):
+    df = make_frame(n, seed, kind)
+    fast = smc_core.detect_swings(df, lookback=lookback, copy=True)
+    if n < lookback * 2 + 1:
+        assert fast is df or fast.equals(df)  # quá ngắn: trả nguyên frame
+        return
+    ref = ref_impl.detect_swings(df, lookback=lookback)
+    for col in ("Swing_High", "Swing_Low"):
+        np.testing.assert_array_equal(fast[col].to_numpy(dtype=bool), ref[col].to_numpy(dtype=bool))
+
+
+@pytest.mark.parametrize("n,seed,kind", CASES)
+@pytest.mark.parametrize("kw", [{}, {"max_zones": 10}, {"future_window": 0}, {"future_window": 5, "max_zones": 3}])
+def test_detect_fvg_zones(n, seed, kind, kw):
+    df = make_frame(n, seed, kind)
+    assert _same(smc_core.detect_fvg_zones(df, **kw), ref_impl.detect_fvg_zones(df, **kw))
+
+
+@pytest.mark.parametrize("n,seed,kind", CASES)
+@pytest.mark.parametrize("kw", [{}, {"lookback": 0}, {"lookback": 60, "max_obs": 3}])
+def test_detect_order_blocks(n, seed, kind, kw):
+    base = smc_core.ensure_smc_columns(make_frame(n, seed, kind), copy=True)
+    assert _same(smc_core.detect_order_blocks(base.copy(), **kw), ref_impl.detect_order_blocks(base.copy(), **kw))
+
+
+@pytest.mark.parametrize("n,seed,kind", CASES)
+def test_detect_breaker_blocks(n, seed, kind):
+    df = make_frame(n, seed, kind)
+    assert _same(smc_core.detect_breaker_blocks(df), ref_impl.detect_breaker_blocks(df))
+
+
+@pytest.mark.parametrize("n,seed,kind", [c for c in CASES if c[0] >= 30])
+@pytest.mark.parametrize("lookback", [5, 20])
+def test_detect_liquidity_sweep(n, seed, kind, lookback):
+    df = make_frame(n, seed, kind)
+    for cut in range(0, min(n, 30)):  # nến cuối khác nhau -> cả 3 nhánh SELL/BUY/None
+        sub = df.iloc[:n - cut]
+        assert smc_core.detect_liquidity_sweep(sub, lookback=lookback) == ref_impl.detect_liquidity_sweep(sub, lookback=lookback)
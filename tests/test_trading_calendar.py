@@ -0,0 +1,75 @@
+"""is_fresh / expected_last_bar quanh các mốc phiên HOSE (giờ VN, Timestamp không tz)."""
+import pandas as pd
+import pytest
+
+from trading_calendar import is_fresh, expected_last_bar
+
+MON = pd.Timestamp("2026-10-19")  # thứ Hai, ngày giao dịch
+FRI = pd.Timestamp("2026-10-16")  # phiên trước đó
+
+
+def at(day, hhmm: str) -> pd.Timestamp:
+    h, m = hhmm.split(":")
+    return day + pd.Timedelta(hours=int(h), minutes=int(m))
+
+
+def epoch(ts_vn: pd.Timestamp) -> float:
+    """Giờ VN -> epoch giây (dạng manifest mtime)."""
+    return ts_vn.tz_localize("Asia/Ho_Chi_Minh").timestamp()
+
+
+@pytest.mark.parametrize("now,last_bar,fresh", [
+    (at(MON, "08:59"), FRI, True),   # chưa mở phiên: nến kỳ vọng vẫn là phiên trước
+    (at(MON, "09:00"), FRI, False),  # mở phiên: nến hôm nay đang chạy
+    (at(MON, "09:00"), MON, True),
+    (at(MON, "20:00"), MON, True),
+    (at(MON + pd.Timedelta(days=5), "10:00"), MON + pd.Timedelta(days=4), True),  # thứ Bảy -> nến thứ Sáu
+    (at(pd.Timestamp("2026-05-01"), "10:00"), pd.Timestamp("2026-04-29"), True),  # nghỉ 30/4-1/5
+    (at(pd.Timestamp("2026-05-04"), "09:30"), pd.Timestamp("2026-04-29"), False),
+    (at(MON, "10:00"), None, False),
+])
+def test_is_fresh_1d(now, last_bar, fresh):
+    assert is_fresh(last_bar, "1D", now) is fresh
+
+
+def test_is_fresh_1d_complete_ignores_running_day():
+    assert expected_last_bar("1D", at(MON, "15:14"), complete=True) == FRI
+    assert expected_last_bar("1D", at(MON, "15:15"), complete=True) == MON
+    assert is_fresh(FRI, "1D", at(MON, "15:00"), complete=True)
+
+
+@pytest.mark.parametrize("now,expected", [
+    ("09:00", "09:00"),
+    ("10:07", "10:00"),
+    ("11:29", "11:15"),
+    ("12:00", "11:15"),  # nghỉ trưa: bucket cuối buổi sáng
+    ("13:00", "13:00"),
+    ("14:40", "14:30"),  # ATC gộp vào bucket cuối
+    ("15:30", "14:30"),
+])
+def test_expected_last_bar_15m(now, expected):
+    assert expected_last_bar("15m", at(MON, now)) == at(MON, expected)
+
+
+@pytest.mark.parametrize("now,last_bar,fresh", [
+    ("10:07", "09:45", False),
+    ("10:07", "10:00", True),
+    ("12:00", "11:15", True),
+    ("13:01", "11:15", False),
+])
+def test_is_fresh_15m(now, last_bar, fresh):
+    assert is_fresh(at(MON, last_bar), "15m", at(MON, now)) is fresh
+
+
+@pytest.mark.parametrize("tf,last_bar,written,now,fresh", [
+    # nến ngày ghi lúc còn chạy, giờ đã chốt (DAY_FINAL 15:15) -> phải tải lại bản chốt
+    ("1D", MON, "10:00", "16:00", False),
+    ("1D", MON, "15:20", "16:00", True),
+    ("1D", MON, "10:00", "15:14", True),   # chưa chốt: nến đang chạy vẫn là mới nhất
+    # bucket 15m cuối (14:30) chốt lúc đóng cửa 14:45
+    ("15m", at(MON, "14:30"), "14:35", "15:00", False),
+    ("15m", at(MON, "14:30"), "14:50", "15:00", True),
+    ("15m", at(MON, "14:30"), "14:35", "14:44", True),
+])
+def test_is_fresh_written_at(tf, last_bar, written, now, fresh):
+    assert is_fresh(last_bar, tf, at(MON, now), written_at=epoch(at(MON, written))) is fresh
@@ -0,0 +1,333 @@
+# tick_bars.py - DỰNG NẾN 1m/15m/1H/1D TỪ TICK WEBSOCKET VPS, GHI THẲNG VÀO OHLCV STORE
+"""Tick-to-bar aggregator for the VPS websocket stream.
+
+``TickBarProcessor`` is a vnstock_pipeline ``DataProcessor``: add it to a
+``WSSClient`` (see ``stream_bars``) and every ``stock`` event
+(``WSSDataParser``: last_price, last_volume, total_volume) updates in-memory
+bars for TICK_TIMEFRAMES:
+
+- buckets come from trading_calendar (per-session anchoring, ATC folded into
+  the last afternoon bucket); ticks outside the session / on holidays are
+  dropped,
+- volume is the delta of ``total_volume`` (accumulated day volume), so a
+  missed tick does not lose volume; a tick whose sequence (``sequence`` when
+  the event has one, else ``total_volume``) is not newer than the last one
+  seen is a duplicate / out-of-order replay and is dropped,
+- the 1D bar takes open/high/low and total volume from the event itself (day
+  values from the exchange), so it is exact even if the stream started late.
+
+A bar is closed when a tick of a later bucket arrives or when its bar_end()
+has passed (checked on every flush). Closed bars are written to the store
+every FLUSH_INTERVAL_S (one ``write_bars_bulk`` per timeframe, off the event
+loop), together with today's 1D bar; 30m/1H/2H are then re-derived from 15m.
+Because the rows are written after bar_end(), trading_calendar.is_fresh()
+treats them as final and data.load_data_with_cache() serves them without a
+REST call. The first bar of each symbol only saw part of its bucket: it is
+merged with the stored bar of the same bucket (REST history) if there is one.
+Prices are converted to the store unit (thousand VND).
+"""
+import time
+import asyncio
+import argparse
+import threading
+from datetime import datetime
+
+import pandas as pd
+
+from ohlcv_store import OHLCV_COLS, clean_symbol, load_manifest, read_bars_bulk, write_bars_bulk
+from resample import derive_timeframes
+from trading_calendar import _bar_start, bar_end, is_trading_day, MORNING_OPEN, CLOSE
+from live_bars import _price_scale
+
+try:
+    from vnstock_pipeline.stream.processors import DataProcessor
+except ImportError:  # chạy/replay không cần cài pipeline stream
+    DataProcessor = object
+
+TICK_TIMEFRAMES = ("1m", "15m", "1H", "1D")
+STORE_TIMEFRAMES = ("1m", "15m", "1D")        # 1H trong store dựng lại từ 15m (resample.py)
+REDERIVE_TIMEFRAMES = ("30m", "1H", "2H")
+FLUSH_INTERVAL_S = 5.0
+SESSION_SLACK = pd.Timedelta(minutes=15)      # nhận tick ATO trước 9:00 và bản in giá đóng cửa sau 14:45
+_VN_OFFSET_NS = 7 * 3600 * 1_000_000_000      # giờ VN không có DST
+_TS_FORMAT = "%Y-%m-%d %H:%M:%S"              # FinancialDataParser.format_timestamp (giờ máy)
+
+
+def _num(value):
+    try:
+        x = float(value)
+    except (TypeError, ValueError):
+        return None
+    return x if x == x else None
+
+
+class _Bar:
+    __slots__ = ("label", "open", "high", "low", "close", "volume", "partial")
+
+    def __init__(self, label, price, volume, partial):
+        self.label = label
+        self.open = self.high = self.low = self.close = price
+        self.volume = volume
+        self.partial = partial  # bucket đã chạy trước khi stream thấy tick đầu
+
+    def update(self, price, volume):
+        if price > self.high:
+            self.high = price
+        if price < self.low:
+            self.low = price
+        self.close = price
+        self.volume += volume
+
+    def row(self):
+        return [self.open, self.high, self.low, self.close, self.volume]
+
+
+class TickBarProcessor(DataProcessor):
+    """Tick `stock` -> nến 1m/15m/1H/1D trong RAM, nến đã đóng ghi vào store theo lô."""
+
+    def __init__(self, symbols=None, flush_interval: float = FLUSH_INTERVAL_S, root: str = None,
+                 volume_multiplier: float = 1.0, clock=None):
+        if DataProcessor is not object:
+            super().__init__()
+        self.symbols = {clean_symbol(s) for s in symbols} if symbols else None
+        self.flush_interval = float(flush_interval)
+        self.root = root
+        self.volume_multiplier = float(volume_multiplier)
+        self.clock = clock  # () -> epoch giây; None = time.time (replay/test truyền clock riêng)
+        self._open = {}          # (sym, tf) -> _Bar đang chạy
+        self._closed = []        # [(sym, tf, _Bar)] chờ ghi
+        self._seq = {}           # sym -> sequence / total_volume lớn nhất đã thấy
+        self._day = {}           # sym -> (ngày, open, high, low, close, total_volume)
+        self._day_dirty = set()  # mã có tick mới từ lần flush trước -> chỉ ghi lại nến 1D của các mã này
+        self._scale = {}         # sym -> 1 | 1000 (giá nguồn -> nghìn đồng)
+        self._ref_close = None
+        self._last_flush = 0.0
+        self._flush_task = None
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self.stats = {"ticks": 0, "duplicates": 0, "late": 0, "off_session": 0, "bars_closed": 0,
+                      "rows_written": 0, "flushes": 0, "flush_s": 0.0}
+
+    # ---------------- tick ----------------
+    def _now(self) -> float:
+        return self.clock() if self.clock else time.time()
+
+    def _tick_time(self, data) -> pd.Timestamp:
+        ts = data.get("timestamp")
+        if isinstance(ts, (int, float)):
+            epoch = float(ts)
+        elif isinstance(ts, str):
+            try:
+                epoch = datetime.strptime(ts, _TS_FORMAT).timestamp()
+            except ValueError:
+                epoch = self._now()
+        else:
+            epoch = self._now()
+        return pd.Timestamp(int(epoch * 1e9) + _VN_OFFSET_NS)
+
+    def _price_factor(self, sym: str, price: float) -> float:
+        k = self._scale.get(sym)
+        if k is None:
+            if self._ref_close is None:
+                self._ref_close = {s: e.get("last_close") for s, e in load_manifest("1D", self.root).items()}
+            ref = self._ref_close.get(sym)
+            k = self._scale[sym] = _price_scale(price, float(ref) if ref else None)
+        return k
+
+    def on_tick(self, data: dict) -> bool:
+        """Cập nhật nến từ 1 event đã parse. Return False nếu tick bị bỏ (trùng/lệch phiên/không phải stock)."""
+        if data.get("event_type") != "stock":
+            return False
+        sym = clean_symbol(data.get("symbol") or "")
+        price = _num(data.get("last_price"))
+        if not sym or price is None or price <= 0 or (self.symbols is not None and sym not in self.symbols):
+            return False
+
+        t = self._tick_time(data)
+        day = t.normalize()
+        tod = t - day
+        if not is_trading_day(day) or tod < MORNING_OPEN - SESSION_SLACK or tod > CLOSE + SESSION_SLACK:
+            self.stats["off_session"] += 1
+            return False
+
+        total = _num(data.get("total_volume"))
+        seq = _num(data.get("sequence"))
+        key = seq if seq is not None else total
+        if key is not None:
+            prev = self._seq.get(sym)
+            if prev is not None and prev[0] == day and key <= prev[1]:
+                self.stats["duplicates"] += 1
+                return False
+            self._seq[sym] = (day, key)
+
+        k = self._price_factor(sym, price)
+        price /= k
+        day_state = self._day.get(sym)
+        if day_state is not None and day_state[0] != day:
+            day_state = None
+        if total is not None:
+            prev_total = day_state[5] if day_state is not None else None
+            vol = (total - prev_total) if prev_total is not None else 0.0
+            vol = max(0.0, vol) * self.volume_multiplier
+        else:
+            vol = (_num(data.get("last_volume")) or 0.0) * self.volume_multiplier
+        self.stats["ticks"] += 1
+
+        with self._lock:
+            for tf in TICK_TIMEFRAMES[:-1]:
+                label = _bar_start(t, tf)
+                bar = self._open.get((sym, tf))
+                if bar is None:
+                    # tick đầu của mã: bucket đã chạy 1 phần trước khi stream bắt đầu
+                    self._open[(sym, tf)] = _Bar(label, price, vol, partial=True)
+                elif label > bar.label:
+                    self._closed.append((sym, tf, bar))
+                    self.stats["bars_closed"] += 1
+                    self._open[(sym, tf)] = _Bar(label, price, vol, partial=False)
+                elif label < bar.label:
+                    self.stats["late"] += 1  # tick của bucket đã đóng: không mở lại nến
+                else:
+                    bar.update(price, vol)
+
+            o = _num(data.get("open_price"))
+            hi = _num(data.get("high_price"))
+            lo = _num(data.get("low_price"))
+            o = o / k if o else (day_state[1] if day_state is not None else price)
+            hi = max(hi / k if hi else price, price, day_state[2] if day_state is not None else price)
+            lo = min(lo / k if lo else price, price, day_state[3] if day_state is not None else price)
+            cum = total if total is not None else (day_state[5] if day_state is not None else 0.0) + vol
+            self._day[sym] = (day, o, hi, lo, price, cum)
+            self._day_dirty.add(sym)
+        return True
+
+    # ---------------- DataProcessor ----------------
+    async def process(self, data) -> None:
+        self.on_tick(data)
+        now = self._now()
+        if now - self._last_flush >= self.flush_interval and (self._flush_task is None or self._flush_task.done()):
+            self._last_flush = now
+            batch = self._take(now)
+            if batch:
+                loop = asyncio.get_running_loop()
+                self._flush_task = loop.run_in_executor(None, self._write, batch)
+
+    def _take(self, now: float, include_open: bool = False) -> dict:
+        """
+        Lấy nến chờ ghi (nến hết giờ theo lịch cũng tính là đóng) -> {tf: [(sym, _Bar)]}.
+        Nến 1D chỉ lấy của mã có tick mới từ lần trước (include_open=True: mọi mã).
+        """
+        t = pd.Timestamp(int(now * 1e9) + _VN_OFFSET_NS)
+        with self._lock:
+            for (sym, tf), bar in list(self._open.items()):
+                if bar_end(bar.label, tf) <= t:
+                    del self._open[(sym, tf)]
+                    self._closed.append((sym, tf, bar))
+                    self.stats["bars_closed"] += 1
+            closed, self._closed = self._closed, []
+            if include_open:
+                closed += [(sym, tf, bar) for (sym, tf), bar in self._open.items()]
+            batch = {}
+            for sym, tf, bar in closed:
+                batch.setdefault(tf, []).append((sym, bar))
+            day_syms = list(self._day) if include_open else self._day_dirty
+            self._day_dirty = set()
+            for sym in day_syms:
+                day, o, hi, lo, c, cum = self._day[sym]
+                bar = _Bar(day, o, cum * self.volume_multiplier, partial=True)  # gộp với nến ngày REST nếu có
+                bar.high, bar.low, bar.close = hi, lo, c
+                batch.setdefault("1D", []).append((sym, bar))
+        return batch
+
+    def _frames(self, bars: list, tf: str) -> dict:
+        partial = [sym for sym, bar in bars if bar.partial]
+        stored = read_bars_bulk(partial, tf, tail_n=2, root=self.root) if partial else {}
+        rows = {}
+        for sym, bar in bars:
+            row = bar.row()
+            old = stored.get(sym)
+            if bar.partial and old is not None and len(old) and bar.label in old.index:
+                o = old.loc[bar.label]
+                # bucket dở: giữ open của nến REST, nối high/low, KL lấy phần lớn hơn (không cộng trùng)
+                row = [float(o["Open"]), max(float(o["High"]), bar.high), min(float(o["Low"]), bar.low),
+                       bar.close, max(float(o["Volume"]), bar.volume)]
+            rows.setdefault(sym, {})[bar.label] = row  # trùng bucket: nến sau thắng
+        return {
+            sym: pd.DataFrame(list(r.values()), columns=OHLCV_COLS, index=pd.DatetimeIndex(list(r.keys()), name="Date"))
+            for sym, r in rows.items()
+        }
+
+    def _write(self, batch: dict) -> int:
+        with self._write_lock:  # 1 lần ghi tại 1 thời điểm (flush nền + flush() đồng bộ)
+            t0 = time.perf_counter()
+            n = 0
+            try:
+                for tf in STORE_TIMEFRAMES:
+                    if batch.get(tf):
+                        n += write_bars_bulk(self._frames(batch[tf], tf), tf, root=self.root, mode="upsert")
+                if batch.get("15m"):
+                    derive_timeframes({sym for sym, _ in batch["15m"]}, REDERIVE_TIMEFRAMES, root=self.root)
+            except Exception as e:
+                print(f"⚠️ Tick bars: ghi store lỗi: {e}")
+            self.stats["rows_written"] += n
+            self.stats["flushes"] += 1
+            self.stats["flush_s"] += time.perf_counter() - t0
+            return n
+
+    def flush(self, now: float = None, include_open: bool = False) -> int:
+        """Ghi ngay (đồng bộ). include_open=True: ghi cả nến đang chạy (vd: trước khi scan, khi đóng stream)."""
+        batch = self._take(self._now() if now is None else now, include_open=include_open)
+        return self._write(batch) if batch else 0
+
+    def bars(self, symbol: str, timeframe: str) -> dict:
+        """Nến đang chạy của 1 mã (đọc nhanh, không qua store)."""
+        sym, tf = clean_symbol(symbol), timeframe
+        if tf == "1D":
+            d = self._day.get(sym)
+            return dict(zip(["Date"] + OHLCV_COLS, [d[0], d[1], d[2], d[3], d[4], d[5] * self.volume_multiplier])) if d else {}
+        bar = self._open.get((sym, tf))
+        return dict(zip(["Date"] + OHLCV_COLS, [bar.label] + bar.row())) if bar else {}
+
+    def close(self):
+        self.flush(include_open=True)
+
+
+async def stream_bars(symbols, duration_s: float = None, flush_interval: float = FLUSH_INTERVAL_S) -> TickBarProcessor:
+    """Nghe websocket VPS cho `symbols`, dựng nến vào store tới khi hết phiên (hoặc hết duration_s)."""
+    from vnstock_pipeline.stream.sources.vps import WSSClient
+
+    syms = sorted({clean_symbol(s) for s in symbols if clean_symbol(s)})
+    proc = TickBarProcessor(syms, flush_interval=flush_interval)
+    client = WSSClient(enable_session_manager=False)
+    client.subscribe_symbols(syms)
+    client.add_processor(proc)
+    await client.connect()
+    try:
+        if duration_s:
+            await asyncio.sleep(duration_s)
+        else:
+            await client.wait_until_disconnected()
+    finally:
+        await client.disconnect()  # xả hàng đợi rồi gọi proc.close() (ghi cả nến đang chạy)
+        print(f"📡 Tick bars: {proc.stats}")
+    return proc
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Dựng nến 1m/15m/1H/1D từ tick VPS vào OHLCV store")
+    ap.add_argument("--symbols", nargs="*", help="mặc định: POSITIONS + WATCHLIST + ứng viên Phase 1 gần nhất")
+    ap.add_argument("--duration", type=float, default=None, help="giây; mặc định tới khi mất kết nối")
+    ap.add_argument("--flush-interval", type=float, default=FLUSH_INTERVAL_S)
+    args = ap.parse_args(argv)
+
+    symbols = args.symbols
+    if not symbols:
+        from config import WATCHLIST, POSITIONS
+        from update_queue import load_phase1_scores
+        symbols = list(POSITIONS) + list(WATCHLIST) + list(load_phase1_scores())
+    if not symbols:
+        ap.error("không có mã nào: truyền --symbols hoặc đặt WATCHLIST/POSITIONS")
+    asyncio.run(stream_bars(symbols, duration_s=args.duration, flush_interval=args.flush_interval))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+# trading_calendar.py - LỊCH GIAO DỊCH HOSE (NGÀY GD, PHIÊN, NẾN CUỐI KỲ VỌNG)
+"""HOSE trading calendar shared by every freshness decision.
+
+Trading days (weekdays minus FIXED_HOLIDAYS_MMDD and HOLIDAY_RANGES) are
+precomputed once for CALENDAR_YEARS into a date -> last-trading-day map, so
+"previous trading day" and "expected last bar of timeframe X at time T" are
+dict lookups plus a little arithmetic.
+
+Session (VN time): morning 09:00-11:30, afternoon 13:00-14:45 with ATC from
+14:30; the daily bar is final after DAY_FINAL (15:15). Intraday bars are
+labelled by bucket start, anchored per session, and ATC folds into the last
+afternoon bucket (see resample.py, which uses bar_starts()).
+
+    is_fresh(last_bar, "15m")           # cache already has the newest bar?
+    expected_last_bar("1D", complete=True)  # last finished trading day
+"""
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+# -----------------------------------------------------------
+# CẤU HÌNH LỊCH NGHỈ LỄ (CẬP NHẬT TẠI ĐÂY)
+# -----------------------------------------------------------
+# 1. Ngày lễ cố định (Dương lịch) - Chỉ cần MM-DD
+FIXED_HOLIDAYS_MMDD = ["01-01", "04-30", "05-01", "09-02"]
+
+# 2. Khoảng thời gian nghỉ dài (Tết, Giỗ tổ...) - Format: ("YYYY-MM-DD", "YYYY-MM-DD")
+HOLIDAY_RANGES = [
+    ("2025-01-25", "2025-02-02"), # Tết Ất Tỵ
+    ("2026-01-01", "2026-01-04"), # Tết Dương
+    ("2026-02-14", "2026-02-22"), # Tết Âm
+    ("2026-04-25", "2026-04-27"), # Giỗ tổ
+    ("2026-04-30", "2026-05-03"), # 30/4
+    ("2026-08-29", "2026-09-02"), # 2/9
+]
+# -----------------------------------------------------------
+
+CALENDAR_YEARS = (2015, datetime.now().year + 2)
+
+# Phiên HOSE (giờ VN, tính từ 00:00)
+MORNING_OPEN = pd.Timedelta(hours=9)
+LUNCH_START = pd.Timedelta(hours=11, minutes=30)
+AFTERNOON_OPEN = pd.Timedelta(hours=13)
+ATC_START = pd.Timedelta(hours=14, minutes=30)
+CLOSE = pd.Timedelta(hours=14, minutes=45)
+DAY_FINAL = pd.Timedelta(hours=15, minutes=15)  # nến ngày coi như chốt sau giờ này
+
+INTRADAY_FREQ = {
+    "1m": pd.Timedelta(minutes=1),
+    "15m": pd.Timedelta(minutes=15),
+    "30m": pd.Timedelta(minutes=30),
+    "1H": pd.Timedelta(hours=1),
+    "2H": pd.Timedelta(hours=2),
+}
+_TF_ALIASES = {"D": "1D", "1D": "1D", "H": "1H", "60": "1H", "15": "15m", "15M": "15m", "W": "1W", "M": "1M"}
+
+
+def _tf(timeframe: str) -> str:
+    tf = (timeframe or "1D").strip()
+    return tf if tf in INTRADAY_FREQ or tf in ("1D", "1W", "1M") else _TF_ALIASES.get(tf.upper(), tf)
+
+
+def _build():
+    holidays = set()
+    for start, end in HOLIDAY_RANGES:
+        holidays.update(pd.date_range(start, end, freq="D").date)
+    days = pd.date_range(f"{CALENDAR_YEARS[0]}-01-01", f"{CALENDAR_YEARS[1]}-12-31", freq="D")
+    trading = [d.date() for d in days
+               if d.weekday() < 5 and d.strftime("%m-%d") not in FIXED_HOLIDAYS_MMDD and d.date() not in holidays]
+    tset = set(trading)
+    last_on_or_before = {}
+    prev = None
+    for d in days.date:
+        if d in tset:
+            prev = d
+        last_on_or_before[d] = prev
+    return trading, tset, last_on_or_before
+
+
+_TRADING_LIST, _TRADING_SET, _LAST_ON_OR_BEFORE = _build()
+_POS = {d: i for i, d in enumerate(_TRADING_LIST)}
+TRADING_DAYS = np.array(_TRADING_LIST, dtype="datetime64[D]")
+
+
+def _to_vn_naive(t=None) -> pd.Timestamp:
+    """datetime/date/None (=bây giờ) -> Timestamp giờ VN không tz (cùng kiểu với nến trong store)."""
+    if t is None:
+        from config import now_vn
+        t = now_vn()
+    elif isinstance(t, date) and not isinstance(t, datetime):
+        return pd.Timestamp(t) + pd.Timedelta(hours=23, minutes=59)  # cả ngày đó
+    ts = pd.Timestamp(t)
+    if ts.tzinfo is not None:
+        ts = ts.tz_convert("Asia/Ho_Chi_Minh").tz_localize(None)
+    return ts
+
+
+def is_trading_day(d) -> bool:
+    return pd.Timestamp(d).date() in _TRADING_SET
+
+
+def last_trading_day_on_or_before(d) -> date:
+    d = pd.Timestamp(d).date()
+    hit = _LAST_ON_OR_BEFORE.get(d, False)
+    if hit is not False:
+        return hit
+    # Ngoài khoảng tính sẵn: lùi tới ngày thường gần nhất
+    while d.weekday() >= 5 or d.strftime("%m-%d") in FIXED_HOLIDAYS_MMDD:
+        d -= timedelta(days=1)
+    return d
+
+
+def prev_trading_day(d) -> date:
+    return last_trading_day_on_or_before(pd.Timestamp(d).date() - timedelta(days=1))
+
+
+def shift_trading_days(d, n: int) -> date:
+    """Ngày giao dịch cách d (hoặc ngày GD gần nhất trước d) n phiên; n < 0 = lùi."""
+    base = last_trading_day_on_or_before(d)
+    i = _POS.get(base)
+    if i is None:
+        return (pd.Timestamp(base) + pd.offsets.BDay(n)).date()
+    return _TRADING_LIST[max(0, min(len(_TRADING_LIST) - 1, i + int(n)))]
+
+
+def last_trading_day(t=None, complete: bool = True) -> date:
+    """
+    Ngày giao dịch gần nhất tại thời điểm t.
+    complete=True: chỉ tính ngày đã chốt nến (sau DAY_FINAL); False: hôm nay đã mở phiên là tính.
+    """
+    ts = _to_vn_naive(t)
+    today = ts.normalize()
+    cutoff = DAY_FINAL if complete else MORNING_OPEN
+    if is_trading_day(today) and ts - today >= cutoff:
+        return today.date()
+    return prev_trading_day(today)
+
+
+def bar_starts(idx, timeframe: str) -> np.ndarray:
+    """Nhãn nến (đầu bucket) chứa từng thời điểm trong idx, datetime64[ns]. Hỗ trợ intraday + 1D/1W/1M."""
+    tf = _tf(timeframe)
+    idx = pd.DatetimeIndex(idx).as_unit("ns")  # pandas 3 có thể để đơn vị us
+    day = idx.normalize()
+    if tf == "1D":
+        return day.values
+    if tf == "1W":
+        return (day - pd.to_timedelta(idx.dayofweek, unit="D")).values
+    if tf == "1M":
+        return (day - pd.to_timedelta(idx.day - 1, unit="D")).values
+
+    freq = INTRADAY_FREQ[tf].value
+    tod = (idx - day).values.astype("int64")
+    morning = tod < AFTERNOON_OPEN.value
+    # Sáng: [09:00, 11:30) | Chiều: [13:00, 14:30], ATC/đóng cửa gộp vào bucket cuối
+    tod = np.where(
+        morning,
+        np.clip(tod, MORNING_OPEN.value, LUNCH_START.value - 1),
+        np.clip(tod, AFTERNOON_OPEN.value, ATC_START.value),
+    )
+    anchor = np.where(morning, MORNING_OPEN.value, AFTERNOON_OPEN.value)
+    start = anchor + (tod - anchor) // freq * freq
+    return (day.values.astype("int64") + start).astype("datetime64[ns]")
+
+
+def _bar_start(ts: pd.Timestamp, tf: str) -> pd.Timestamp:
+    """bar_starts() cho 1 thời điểm (không tạo index -> vài µs)."""
+    day = ts.normalize()
+    if tf == "1D":
+        return day
+    if tf == "1W":
+        return day - pd.Timedelta(days=day.weekday())
+    if tf == "1M":
+        return day.replace(day=1)
+    tod = ts - day
+    if tod < AFTERNOON_OPEN:
+        anchor, tod = MORNING_OPEN, min(max(tod, MORNING_OPEN), LUNCH_START - pd.Timedelta(1))
+    else:
+        anchor, tod = AFTERNOON_OPEN, min(max(tod, AFTERNOON_OPEN), ATC_START)
+    freq = INTRADAY_FREQ[tf]
+    return day + anchor + (tod - anchor) // freq * freq
+
+
+def expected_last_bar(timeframe: str, t=None, complete: bool = False) -> pd.Timestamp:
+    """
+    Nhãn nến mới nhất mà nguồn có thể trả về tại thời điểm t.
+    complete=True: nến cuối của ngày giao dịch đã chốt gần nhất (job cuối ngày, không lấy nến đang chạy).
+    """
+    tf = _tf(timeframe)
+    ts = _to_vn_naive(t)
+    day = last_trading_day(ts, complete=complete)
+    if tf in INTRADAY_FREQ:
+        # Trong phiên hôm nay: bucket đang chạy; ngày cũ / đã đóng cửa: bucket cuối phiên chiều
+        moment = ts if (not complete and day == ts.date()) else pd.Timestamp(day) + CLOSE
+        return _bar_start(moment, tf)
+    return _bar_start(pd.Timestamp(day), tf)
+
+
+def bar_end(label, timeframe: str) -> pd.Timestamp:
+    """Thời điểm nến `label` chốt: hết bucket (không vượt quá nghỉ trưa/đóng cửa); nến ngày = DAY_FINAL."""
+    tf = _tf(timeframe)
+    label = pd.Timestamp(label)
+    day = label.normalize()
+    if tf not in INTRADAY_FREQ:
+        return day + DAY_FINAL
+    session_end = LUNCH_START if label - day < AFTERNOON_OPEN else CLOSE
+    return min(label + INTRADAY_FREQ[tf], day + session_end)
+
+
+def is_fresh(last_bar, timeframe: str, t=None, complete: bool = False, written_at=None) -> bool:
+    """
+    Cache có nến cuối >= nến kỳ vọng -> gọi API chỉ trả về rỗng/trùng, bỏ qua.
+    written_at (epoch giây, vd manifest mtime): nến cuối được ghi lúc còn đang chạy mà giờ đã chốt -> chưa fresh.
+    """
+    if last_bar is None:
+        return False
+    ts = _to_vn_naive(t)
+    last_bar = _to_vn_naive(last_bar) if getattr(last_bar, "tzinfo", None) is not None else pd.Timestamp(last_bar)
+    expected = expected_last_bar(timeframe, ts, complete=complete)
+    if last_bar < expected:
+        return False
+    if written_at and last_bar == expected:
+        written = _to_vn_naive(pd.Timestamp(float(written_at), unit="s", tz="UTC"))
+        if written < bar_end(expected, timeframe) <= ts:
+            return False
+    return True
@@ -2,6 +2,7 @@
 import pandas as pd
 import concurrent.futures
 from data import load_data_with_cache
+from ohlcv_store import manifest_entry
 from pipeline_manager import run_universe_pipeline
 
 # Import thư viện
@@ -24,18 +25,24 @@ C32, C47, CAV, CCI, CCL, CDC, CEG, CEO, CHP, CIA, CII, CKG, CLC, CLL, CMG, CMV,
 FALLBACK_LIST = [x.strip() for x in RAW_TICKERS_STR.replace("\n", "").split(",") if x.strip()]
 
 def check_liquidity_worker(symbol, min_price, min_vol_avg_5, min_turnover):
-    """Worker kiểm tra thanh khoản"""
+    """Worker kiểm tra thanh khoản (ưu tiên manifest, chỉ load cache khi mã chưa có)"""
     try:
-        # Load Cache 20 ngày
-        df = load_data_with_cache(symbol, days_to_load=20, timeframe="1D")
-        if df is None or len(df) < 5: return None
-        
-        if "Close" not in df: df["Close"] = df.get("close")
-        if "Volume" not in df: df["Volume"] = df.get("volume")
+        entry = manifest_entry(symbol, "1D")
+        if entry.get("vol_avg_5") is not None and entry.get("last_close") is not None:
+            if int(entry.get("rows", 0)) < 5: return None
+            close = float(entry["last_close"])
+            vol_avg_5 = float(entry["vol_avg_5"])
+        else:
+            # Load Cache 20 ngày
+            df = load_data_with_cache(symbol, days_to_load=20, timeframe="1D", compute_indicators=False)
+            if df is None or len(df) < 5: return None
+
+            if "Close" not in df: df["Close"] = df.get("close")
+            if "Volume" not in df: df["Volume"] = df.get("volume")
 
-        last_row = df.iloc[-1]
-        close = float(last_row["Close"])
-        vol_avg_5 = df["Volume"].tail(5).mean()
+            last_row = df.iloc[-1]
+            close = float(last_row["Close"])
+            vol_avg_5 = df["Volume"].tail(5).mean()
         
         # Turnover
         turnover = close * vol_avg_5
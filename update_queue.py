@@ -0,0 +1,221 @@
+# update_queue.py - HÀNG ĐỢI CẬP NHẬT CACHE THEO ĐỘ ƯU TIÊN (VỊ THẾ/WATCHLIST -> ỨNG VIÊN -> PHẦN CÒN LẠI)
+"""Priority-ordered cache refresh for run_bulk_update.
+
+Symbols are split into tiers and refreshed tier by tier:
+
+- TIER_HELD   : open positions + watchlist (caller order),
+- TIER_LIKELY : symbols that made Phase 1 in the last scans (PHASE1_SCORES_FILE,
+                written by scanner), highest ScoreProxy first,
+- TIER_REST   : everything else, most liquid first (manifest close x vol_avg_5).
+
+Work items (interval, chunk of symbols) sit in one asyncio.PriorityQueue keyed
+by (tier, seq): a symbol's 15m chunk is queued as soon as its D1 is in and it
+passes the liquidity filter, ahead of every lower tier. A chunk never mixes
+tiers, so the watchlist does not wait for a 50-symbol batch of the tail.
+
+Every finished symbol emits an event (``on_event``), and a ``tier_done`` event
+marks each tier, so a consumer (app, scanner) can start on TIER_HELD while the
+rest of the universe is still downloading::
+
+    for ev in stream_bulk_update(universe, watchlist=["FPT"]):   # pipeline_manager
+        if ev["event"] == "tier_done" and ev["tier"] == TIER_HELD: ...
+"""
+import os
+import json
+import time
+import asyncio
+
+from ohlcv_store import CACHE_DIR, clean_symbol, load_manifest
+
+TIER_HELD, TIER_LIKELY, TIER_REST = 0, 1, 2
+TIER_NAMES = {TIER_HELD: "vị thế/watchlist", TIER_LIKELY: "ứng viên Phase 1", TIER_REST: "còn lại"}
+PHASE1_SCORES_FILE = os.path.join(CACHE_DIR, "phase1_scores.json")
+PHASE1_SCORES_MAX_AGE_S = 5 * 86400  # điểm Phase 1 cũ hơn -> bỏ, không đoán theo scan đã lâu
+QUEUE_WORKERS = 8  # chunk chạy song song; rate limit thật do FetchEngine giữ
+
+
+# =========================
+# PHASE 1 SCORES (scanner ghi, updater đọc)
+# =========================
+def save_phase1_scores(candidates, path: str = None):
+    """Lưu {symbol: ScoreProxy} của candidate Phase 1 lần scan này."""
+    scores = {clean_symbol(c["Symbol"]): float(c.get("ScoreProxy") or 0.0) for c in candidates or [] if c.get("Symbol")}
+    path = path or PHASE1_SCORES_FILE
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"ts": time.time(), "scores": scores}, f)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"⚠️ Không lưu được điểm Phase 1: {e}")
+
+
+def load_phase1_scores(path: str = None, max_age_s: float = PHASE1_SCORES_MAX_AGE_S) -> dict:
+    try:
+        with open(path or PHASE1_SCORES_FILE, "r", encoding="utf-8") as f:
+            rec = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if time.time() - float(rec.get("ts") or 0) > max_age_s:
+        return {}
+    return rec.get("scores") or {}
+
+
+# =========================
+# TIERS
+# =========================
+def _turnover(entry) -> float:
+    try:
+        return float(entry["last_close"]) * float(entry["vol_avg_5"])
+    except (TypeError, KeyError, ValueError):
+        return -1.0
+
+
+def prioritize(tickers, watchlist=(), positions=(), scores: dict = None, manifest: dict = None) -> list:
+    """tickers -> [(symbol, tier)] theo thứ tự cập nhật (giữ nguyên tên mã như caller truyền vào)."""
+    scores = load_phase1_scores() if scores is None else scores
+    manifest = load_manifest("1D") if manifest is None else manifest
+    held = {}
+    for i, sym in enumerate(list(positions or []) + list(watchlist or [])):
+        held.setdefault(clean_symbol(sym), i)
+
+    ordered, seen = [], set()
+    for sym in tickers:
+        key = clean_symbol(sym)
+        if not key or key in seen:
+            continue
+        seen.add(key)
+        if key in held:
+            ordered.append(((TIER_HELD, held[key]), sym, TIER_HELD))
+        elif key in scores:
+            ordered.append(((TIER_LIKELY, -float(scores[key])), sym, TIER_LIKELY))
+        else:
+            ordered.append(((TIER_REST, -_turnover(manifest.get(key))), sym, TIER_REST))
+    ordered.sort(key=lambda x: x[0])
+    return [(sym, tier) for _, sym, tier in ordered]
+
+
+# =========================
+# QUEUE
+# =========================
+class UpdateQueue:
+    """
+    D1 rồi 15m cho từng tier trên 1 PriorityQueue (AsyncScheduler lo fetch/export + rate limit).
+    d1_kwargs / intra_kwargs: fetcher_kwargs của 2 khung; needs_intraday(symbols) -> list mã cần tải 15m
+    (lọc thanh khoản + đã đủ nến), gọi sau khi D1 của các mã đó đã vào store.
+    """
+
+    def __init__(self, scheduler, d1_kwargs: dict, intra_kwargs: dict, exporter_kwargs: dict,
+                 needs_intraday, on_event=None, chunk_size: int = 50, workers: int = QUEUE_WORKERS):
+        self.scheduler = scheduler
+        self.kwargs = {"1D": d1_kwargs, "15m": intra_kwargs}
+        self.exporter_kwargs = exporter_kwargs
+        self.needs_intraday = needs_intraday
+        self.on_event = on_event
+        self.chunk_size = max(1, int(chunk_size))
+        self.workers = max(1, int(workers))
+        self.stats = {"1D": 0, "15m": 0, "failed": 0}
+        self.tier_done_s = {}
+
+    def _emit(self, event: dict):
+        if self.on_event is None:
+            return
+        try:
+            self.on_event(event)
+        except Exception as e:
+            print(f"   ⚠️ on_event lỗi: {e}")
+
+    def _put(self, tier: int, interval: str, symbols: list):
+        for i in range(0, len(symbols), self.chunk_size):
+            self._seq += 1
+            self._pending[tier] += 1
+            self._queue.put_nowait(((tier, self._seq), interval, symbols[i:i + self.chunk_size]))
+
+    def _finish(self, tier: int, symbols, intraday, ok: bool = True):
+        for sym in symbols:
+            self._emit({"event": "symbol", "symbol": sym, "tier": tier, "intraday": intraday, "ok": ok,
+                        "elapsed_s": round(time.perf_counter() - self._t0, 3)})
+
+    def _close_item(self, tier: int):
+        self._pending[tier] -= 1
+        # tier xong khi không còn item của nó và mọi tier cao hơn cũng đã xong
+        for t in sorted(self._pending):
+            if t in self.tier_done_s:
+                continue
+            if self._pending[t]:
+                break
+            self.tier_done_s[t] = round(time.perf_counter() - self._t0, 3)
+            print(f"   ⚡ Tier {t} ({TIER_NAMES.get(t, t)}): {self._sizes[t]} mã xong sau {self.tier_done_s[t]}s")
+            self._emit({"event": "tier_done", "tier": t, "symbols": self._sizes[t], "elapsed_s": self.tier_done_s[t]})
+
+    def _after_d1(self, tier: int, symbols: list, intra: list):
+        wanted = set(intra)
+        self._finish(tier, [s for s in symbols if s not in wanted], intraday=None)
+        if intra:
+            self._put(tier, "15m", intra)
+
+    async def _fetch(self, interval: str, symbols: list) -> set:
+        sch = self.scheduler
+        f_kwargs, e_kwargs = self.kwargs[interval], {**self.exporter_kwargs, "interval": interval}
+        done = await sch._fetch_chunk(symbols, f_kwargs, e_kwargs, self.chunk_size)
+        missing = [s for s in symbols if s not in done]
+        if missing:
+            oks = await asyncio.gather(*(sch._fetch_one(s, f_kwargs, e_kwargs) for s in missing))
+            done |= {s for s, ok in zip(missing, oks) if ok}
+        return done
+
+    async def _worker(self):
+        while True:
+            (tier, _), interval, symbols = await self._queue.get()
+            try:
+                done = await self._fetch(interval, symbols)
+                self.stats[interval] += len(done)
+                self.stats["failed"] += len(symbols) - len(done)
+                if interval == "1D":
+                    # D1 lỗi vẫn xét 15m theo cache cũ (giống luồng tuần tự trước đây)
+                    intra = await self.scheduler.engine.offload(self.needs_intraday, symbols)
+                    self._after_d1(tier, symbols, intra)
+                else:
+                    self._finish(tier, [s for s in symbols if s in done], intraday=True)
+                    self._finish(tier, [s for s in symbols if s not in done], intraday=True, ok=False)
+            except Exception as e:
+                print(f"   ⚠️ [{interval}] {symbols[0]}..{symbols[-1]} lỗi: {e}")
+                self.stats["failed"] += len(symbols)
+                self._finish(tier, symbols, intraday=interval == "15m", ok=False)
+            finally:
+                self._close_item(tier)
+                self._queue.task_done()
+
+    async def _run(self, ranked: list, d1_needed: set):
+        self._t0 = time.perf_counter()
+        self._queue = asyncio.PriorityQueue()
+        self._seq = 0
+        self._sizes = {}
+        self._pending = {}
+        groups = {}
+        for sym, tier in ranked:
+            groups.setdefault(tier, []).append(sym)
+        for tier in sorted(groups):
+            self._sizes[tier] = len(groups[tier])
+            self._pending[tier] = 1  # giữ tier mở tới khi xếp xong item đầu
+        for tier in sorted(groups):
+            syms = groups[tier]
+            need = [s for s in syms if s in d1_needed]
+            self._put(tier, "1D", need)
+            fresh = [s for s in syms if s not in d1_needed]
+            if fresh:
+                self._after_d1(tier, fresh, self.needs_intraday(fresh))
+        workers = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+        for tier in sorted(groups):
+            self._close_item(tier)
+        await self._queue.join()
+        for w in workers:
+            w.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    def run(self, ranked: list, d1_needed) -> dict:
+        """ranked = prioritize(...); d1_needed: mã cần tải D1. Return stats + thời điểm xong từng tier."""
+        from fetch_engine import run_sync
+
+        run_sync(self._run(ranked, set(d1_needed)))
+        return {**self.stats, "tier_done_s": dict(self.tier_done_s)}
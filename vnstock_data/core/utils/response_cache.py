@@ -0,0 +1,143 @@
+"""Response cache for send_request: per-endpoint TTL, LRU memory tier, on-disk tier, single-flight.
+
+Key = sha1(method, URL with merged+sorted query params, normalised JSON payload).
+Concurrent identical requests share one in-flight call even when the endpoint is
+not cached (TTL 0). Only successful responses are stored; hits return a copy.
+Opt-in: VNSTOCK_HTTP_CACHE=1 enables it, VNSTOCK_HTTP_CACHE_DIR moves the disk tier.
+Disk files carry their expiry as mtime; expired ones are swept on write (throttled),
+and the tier is capped at DISK_MAX_BYTES.
+"""
+import os,re,json,copy,time,hashlib,threading
+from collections import OrderedDict
+from urllib.parse import urlsplit,urlunsplit,parse_qsl,urlencode
+_A=None
+# (regex trên URL, TTL giây) - khớp luật đầu tiên; 0 = không lưu (vẫn gộp request trùng đang bay)
+TTL_RULES=[
+	(r'price/symbols/getList',0),  # bảng giá realtime
+	(r'LEData|AccumulatedPriceStepVol|intraday|matched',0),  # khớp lệnh trong phiên
+	(r'gap-chart|OHLCChart|dchart|/chart|histor',0),  # OHLCV: không lưu (refresh trong phiên phải thấy nến mới), chỉ gộp request trùng
+	(r'graphql',3600),  # VCI listing/company qua GraphQL
+	(r'symbols/getAll|getByGroup|listing|industr|/stocks\?',6*3600),
+	(r'/company/|financ|ratio|statistic',6*3600),
+]
+DEFAULT_TTL=0
+MEMORY_ENTRIES=512
+DISK_MIN_TTL=600  # chỉ ghi đĩa payload sống lâu (listing/company/BCTC)
+DISK_MAX_BYTES=256*1024*1024  # vượt -> xoá file sắp hết hạn trước
+DISK_SWEEP_INTERVAL_S=600  # dọn file hết hạn tối đa 1 lần / 10 phút / process
+def _norm_payload(payload):
+	if payload is _A:return _A
+	if isinstance(payload,(bytes,bytearray)):payload=payload.decode('utf-8','replace')
+	if isinstance(payload,str):
+		try:payload=json.loads(payload)
+		except ValueError:return payload
+	return json.dumps(payload,sort_keys=True,separators=(',',':'),default=str)
+def cache_key(url:str,method:str='GET',params=_A,payload=_A)->str:
+	p=urlsplit(url);q=parse_qsl(p.query,keep_blank_values=True)
+	if params:q+=[(str(k),str(v))for(k,v)in params.items()]
+	norm=urlunsplit((p.scheme.lower(),p.netloc.lower(),p.path,urlencode(sorted(q)),''))
+	raw=json.dumps([method.upper(),norm,_norm_payload(payload)],separators=(',',':'))
+	return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+class _Flight:
+	__slots__=('event','value','error')
+	def __init__(A):A.event=threading.Event();A.value=_A;A.error=_A
+class ResponseCache:
+	def __init__(A,max_entries:int=MEMORY_ENTRIES,disk_dir:str=_A,rules=_A,default_ttl:float=DEFAULT_TTL):
+		A.max_entries=int(max_entries);A.disk_dir=disk_dir;A.default_ttl=float(default_ttl)
+		A.rules=[(re.compile(pat,re.IGNORECASE),float(ttl))for(pat,ttl)in(rules if rules is not _A else TTL_RULES)]
+		A._mem=OrderedDict();A._flights={};A._lock=threading.Lock();A._next_sweep=.0
+		A.stats={'hits':0,'disk_hits':0,'misses':0,'coalesced':0,'stored':0,'swept':0}
+	def ttl_for(A,url:str)->float:
+		for(rx,ttl)in A.rules:
+			if rx.search(url):return ttl
+		return A.default_ttl
+	def _disk_path(A,key):return os.path.join(A.disk_dir,key[:2],key+'.json')
+	def _get(A,key):
+		now=time.time()
+		with A._lock:
+			hit=A._mem.get(key)
+			if hit is not _A:
+				if hit[0]>now:A._mem.move_to_end(key);A.stats['hits']+=1;return True,hit[1]
+				del A._mem[key]
+		if A.disk_dir:
+			try:
+				with open(A._disk_path(key),'r',encoding='utf-8')as f:rec=json.load(f)
+				if rec.get('expires',0)>now:
+					A._put_mem(key,rec['expires'],rec['value'])
+					with A._lock:A.stats['disk_hits']+=1
+					return True,rec['value']
+			except(OSError,ValueError):pass
+		return False,_A
+	def _put_mem(A,key,expires,value):
+		with A._lock:
+			A._mem[key]=(expires,value);A._mem.move_to_end(key)
+			while len(A._mem)>A.max_entries:A._mem.popitem(last=False)
+	def _put(A,key,ttl,value):
+		expires=time.time()+ttl;A._put_mem(key,expires,value)
+		with A._lock:A.stats['stored']+=1
+		if A.disk_dir and ttl>=DISK_MIN_TTL:
+			path=A._disk_path(key);tmp=f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+			try:
+				os.makedirs(os.path.dirname(path),exist_ok=True)
+				with open(tmp,'w',encoding='utf-8')as f:json.dump({'expires':expires,'value':value},f)
+				os.utime(tmp,(expires,expires));os.replace(tmp,path)  # mtime = hạn dùng -> sweep chỉ cần stat
+			except(OSError,TypeError,ValueError):
+				try:os.remove(tmp)
+				except OSError:pass
+			if time.time()>=A._next_sweep:A.sweep()
+	def sweep(A,max_bytes:int=DISK_MAX_BYTES)->int:
+		"""Xoá file đĩa hết hạn (+ .tmp mồ côi); tổng dung lượng còn > max_bytes thì xoá file sắp hết hạn trước. Return số file xoá."""
+		A._next_sweep=time.time()+DISK_SWEEP_INTERVAL_S
+		if not A.disk_dir or not os.path.isdir(A.disk_dir):return 0
+		now=time.time();live=[];removed=0
+		for root,_,files in os.walk(A.disk_dir):
+			for name in files:
+				path=os.path.join(root,name)
+				try:st=os.stat(path)
+				except OSError:continue
+				if name.endswith('.json')and st.st_mtime>now:live.append((st.st_mtime,st.st_size,path));continue
+				if name.endswith('.tmp')and now-st.st_mtime<DISK_SWEEP_INTERVAL_S:continue  # đang ghi dở
+				try:os.remove(path);removed+=1
+				except OSError:pass
+		total=sum(size for _,size,_ in live)
+		for _,size,path in sorted(live):
+			if total<=max_bytes:break
+			try:os.remove(path);removed+=1;total-=size
+			except OSError:pass
+		with A._lock:A.stats['swept']+=removed
+		return removed
+	def fetch(A,key:str,ttl:float,fn):
+		"""Cache hit -> bản sao; không thì 1 caller gọi fn(), các caller trùng key chờ chung kết quả."""
+		if ttl>0:
+			ok,value=A._get(key)
+			if ok:return copy.deepcopy(value)
+		with A._lock:
+			flight=A._flights.get(key);owner=flight is _A
+			if owner:flight=A._flights[key]=_Flight();A.stats['misses']+=1
+			else:A.stats['coalesced']+=1
+		if not owner:
+			flight.event.wait()
+			if flight.error is not _A:raise flight.error
+			return copy.deepcopy(flight.value)
+		try:
+			flight.value=fn()
+			if ttl>0 and flight.value:A._put(key,ttl,flight.value)
+			return copy.deepcopy(flight.value)if ttl>0 else flight.value
+		except BaseException as e:flight.error=e;raise
+		finally:
+			with A._lock:A._flights.pop(key,_A)
+			flight.event.set()
+	def clear(A,disk:bool=False):
+		with A._lock:A._mem.clear()
+		if disk and A.disk_dir and os.path.isdir(A.disk_dir):
+			import shutil;shutil.rmtree(A.disk_dir,ignore_errors=True)
+_cache=_A
+_cache_lock=threading.Lock()
+def get_cache():
+	"""Cache dùng chung của process; opt-in: None trừ khi VNSTOCK_HTTP_CACHE=1."""
+	global _cache
+	if str(os.environ.get('VNSTOCK_HTTP_CACHE','0')).strip().lower()not in('1','true','yes','on'):return _A
+	if _cache is _A:
+		with _cache_lock:
+			if _cache is _A:_cache=ResponseCache(disk_dir=os.environ.get('VNSTOCK_HTTP_CACHE_DIR')or os.path.join(os.path.expanduser('~'),'.vnstock','http_cache'))
+	return _cache
@@ -7,7 +7,7 @@ _D='VCI'
 _C='volume'
 _B='match_type'
 _A='time'
-import pytz,pandas as pd
+import pytz,numpy as np,pandas as pd
 from bs4 import BeautifulSoup
 from typing import Dict,Any,List,Optional,Union
 from datetime import datetime,timedelta,time
@@ -43,7 +43,39 @@ def process_match_types(df,asset_type,source):
 			return B
 		A=A.groupby(E,group_keys=_H).apply(H);A.drop(columns=[E],inplace=_F)
 	return A
+FAST_DECODE=_F  # False -> luôn đi đường DataFrame cũ (đối chiếu/benchmark)
+_OHLC_COLS=[_A,'open','high','low','close',_C]
+def _ohlc_fast(data,column_map,dtype_map,asset_type,source,interval,floating):
+	"""VCI gap-chart (mảng song song t/o/h/l/c/v) -> DataFrame giống hệt ohlc_to_df, dựng thẳng từ cột NumPy. None = không hỗ trợ, đi đường cũ."""
+	if source!=_D or not isinstance(data,dict)or not data or dtype_map.get(_A)!='datetime64[ns]':return _G
+	src={column_map[k]:k for k in column_map if k in data}
+	if any(c not in src for c in _OHLC_COLS):return _G
+	cols={}
+	for c in _OHLC_COLS:
+		v=data[src[c]]
+		if not isinstance(v,(list,tuple)):return _G
+		arr=np.asarray(v)
+		if arr.dtype.kind not in'iufU'or arr.ndim!=1:return _G  # None/lẫn kiểu -> để pandas xử lý như cũ
+		cols[c]=arr
+	if len({len(a)for a in cols.values()})!=1 or not len(cols[_A]):return _G
+	t=cols[_A].astype(np.int64)
+	idx=pd.DatetimeIndex(t*1_000_000_000,tz='UTC').tz_convert('Asia/Ho_Chi_Minh').tz_localize(_G)
+	if interval=='1D':idx=idx.normalize()
+	out={_A:idx.values.astype('datetime64[ns]')}
+	for c in('open','high','low','close'):
+		a=cols[c]
+		if a.dtype.kind=='U':return _G
+		if asset_type not in['index','derivative']:a=a/1000
+		out[c]=np.round(a,floating)
+	if cols[_C].dtype.kind=='U':return _G
+	out[_C]=cols[_C]
+	for c,N in dtype_map.items():
+		if c in out and c!=_A:out[c]=out[c].astype(N)
+	return pd.DataFrame(out,columns=_OHLC_COLS)
 def ohlc_to_df(data:Dict[str,Any],column_map:Dict[str,str],dtype_map:Dict[str,str],asset_type:str,symbol:str,source:str,interval:str='1D',floating:int=2,resample_map:Optional[Dict[str,str]]=_G)->pd.DataFrame:
+	if FAST_DECODE and not(resample_map and interval not in['1m','1H','1D']):
+		A=_ohlc_fast(data,column_map,dtype_map,asset_type,source,interval,floating)
+		if A is not _G:A.name=symbol;A.category=asset_type;A.source=source;return A
 	P='Asia/Ho_Chi_Minh';O='UTC';L=resample_map;K=asset_type;J=interval;I=source;H=column_map;G=data;F='low';E='high';D='close';C='open'
 	if not G:raise ValueError('Input data is empty or not provided.')
 	if I=='TCBS':A=pd.DataFrame(G);A.rename(columns=H,inplace=_F)
@@ -73,7 +105,8 @@ def intraday_to_df(data:List[Dict[str,Any]],column_map:Dict[str,str],dtype_map:D
 	A=A[H].rename(columns={A:D[A]for A in H})
 	for B in(F,_C):
 		if B in A.columns:
-			A[B]=A[B].map(clean_numeric_string);A[B]=pd.to_numeric(A[B],errors=_I);J=A[B].isna().sum()
+			if not(FAST_DECODE and A[B].dtype.kind in'if'):A[B]=A[B].map(clean_numeric_string);A[B]=pd.to_numeric(A[B],errors=_I)
+			J=A[B].isna().sum()
 			if J:print(f"[Warning] {J} giá trị ở '{B}' không parse được, chuyển thành NaN")
 	P={_D:1000,_E:1000};Q=P.get(C,1)
 	if F in A.columns:A[F]=A[F]/Q
@@ -73,4 +73,47 @@ class Quote:
 		if A.symbol is _A:raise ValueError(_K)
 		D=f"{A.base_url}{_INTRADAY_URL}/AccumulatedPriceStepVol/getSymbolData";E={_L:A.symbol};F=send_request(url=D,headers=A.headers,method=_D,payload=E,show_log=show_log,proxy_list=A.proxy_config.proxy_list,proxy_mode=A.proxy_config.proxy_mode,request_mode=A.proxy_config.request_mode,hf_proxy_url=A.proxy_config.hf_proxy_url);B=pd.DataFrame(F);B=B[_PRICE_DEPTH_MAP.keys()];B.rename(columns=_PRICE_DEPTH_MAP,inplace=_C);B.source=A.data_source
 		if to_df:return B
-		else:return B.to_json(orient=_F)
\ No newline at end of file
+		else:return B.to_json(orient=_F)
+_BATCH_SIZE=50
+@agg_execution(_G)
+def history_batch(symbols,start:str,end:Optional[str]=_A,interval:Optional[str]='1D',count_back:Optional[int]=_A,chunk_size:int=_BATCH_SIZE,floating:Optional[int]=2,random_agent=_B,proxy_config:Optional[ProxyConfig]=_A,show_log:bool=_B)->Dict[str,pd.DataFrame]:
+	"""Lịch sử giá nhiều mã cùng lúc: gap-chart nhận list `symbols`, nên mỗi `chunk_size` mã chỉ tốn 1 POST.
+	Return {symbol: DataFrame giống Quote.history}. Mã không có dữ liệu không có trong kết quả."""
+	requested={}
+	for sym in symbols or []:
+		sym=str(sym).strip().upper()
+		if not sym:continue
+		try:q=Quote(sym,random_agent=random_agent,proxy_config=proxy_config,show_log=show_log)
+		except ValueError:continue
+		requested.setdefault(q.symbol,(sym,q))
+	if not requested:return {}
+	first=next(iter(requested.values()))[1];cfg=first._input_validation(start,end,interval);start_dt=datetime.strptime(cfg.start,'%Y-%m-%d')
+	if end is not _A:
+		end_dt=datetime.strptime(cfg.end,'%Y-%m-%d')+pd.Timedelta(days=1)
+		if start_dt>end_dt:raise ValueError('Thời gian bắt đầu không thể lớn hơn thời gian kết thúc.')
+	else:end_dt=datetime.now()+pd.Timedelta(days=1)
+	time_frame=first.interval_map[cfg.interval];days=pd.bdate_range(start=start_dt,end=end_dt)
+	if count_back is _A and end is not _A:
+		bars=1000
+		if time_frame=='ONE_DAY':bars=len(days)+1
+		elif time_frame=='ONE_HOUR':bars=len(days)*6.5+1
+		elif time_frame=='ONE_MINUTE':bars=len(days)*6.5*60+1
+	else:bars=count_back if count_back is not _A else 1000
+	url=f"{first.base_url}chart/OHLCChart/gap-chart";api_symbols=list(requested);out={}
+	for i in range(0,len(api_symbols),max(1,int(chunk_size))):
+		chunk=api_symbols[i:i+max(1,int(chunk_size))]
+		payload={'timeFrame':time_frame,'symbols':chunk,'to':int(end_dt.timestamp()),'countBack':bars}
+		resp=send_request(url=url,headers=first.headers,method=_D,payload=payload,show_log=show_log,proxy_list=first.proxy_config.proxy_list,proxy_mode=first.proxy_config.proxy_mode,request_mode=first.proxy_config.request_mode,hf_proxy_url=first.proxy_config.hf_proxy_url)
+		for k,item in enumerate(resp or []):
+			if not item:continue
+			# Mỗi phần tử ứng với 1 mã (có key symbol; không có thì theo thứ tự payload)
+			api_sym=item.get(_L)if isinstance(item,dict)else _A
+			if api_sym not in requested:api_sym=chunk[k]if k<len(chunk)else _A
+			if api_sym is _A:continue
+			sym,q=requested[api_sym]
+			try:df=ohlc_to_df(data=item,column_map=_OHLC_MAP,dtype_map=_OHLC_DTYPE,asset_type=q.asset_type,symbol=q.symbol,source=q.data_source,interval=cfg.interval,floating=floating,resample_map=_RESAMPLE_MAP)
+			except ValueError:continue
+			df=df[df[_E]>=start_dt].reset_index(drop=_C)
+			if count_back is not _A:df=df.tail(count_back)
+			if not df.empty:out[sym]=df
+	return out
@@ -1,7 +1,7 @@
-from vnstock_pipeline.stream.client import BaseWebSocketClient
+from vnstock_pipeline.stream.client import BaseWebSocketClient,ProcessorQueue,OVERFLOW_BLOCK,OVERFLOW_DROP_OLDEST,OVERFLOW_COALESCE
 from vnstock_pipeline.stream.processors import DataProcessor,ConsoleProcessor,CSVProcessor,DuckDBProcessor,FirebaseProcessor,ForwardingProcessor,FilteredProcessor
 from vnstock_pipeline.stream.parsers import BaseDataParser
 from vnstock_pipeline.stream.sources.vps import WSSClient
 from vnstock_pipeline.utils.env import idv
-__all__=['BaseWebSocketClient','DataProcessor','ConsoleProcessor','CSVProcessor','DuckDBProcessor','FirebaseProcessor','ForwardingProcessor','FilteredProcessor','BaseDataParser','WSSClient']
+__all__=['BaseWebSocketClient','ProcessorQueue','OVERFLOW_BLOCK','OVERFLOW_DROP_OLDEST','OVERFLOW_COALESCE','DataProcessor','ConsoleProcessor','CSVProcessor','DuckDBProcessor','FirebaseProcessor','ForwardingProcessor','FilteredProcessor','BaseDataParser','WSSClient']
 idv()
\ No newline at end of file
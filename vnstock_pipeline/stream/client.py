@@ -2,11 +2,83 @@ _B=False
 _A=None
 import asyncio,logging,time,traceback
 from abc import ABC,abstractmethod
+from collections import OrderedDict
 from typing import List,Dict,Any,Optional
 import websockets
+# Chính sách khi hàng đợi của 1 processor đầy
+OVERFLOW_BLOCK='block'  # vòng recv() chờ tới khi có chỗ (không mất tin)
+OVERFLOW_DROP_OLDEST='drop_oldest'  # bỏ tin cũ nhất trong hàng đợi
+OVERFLOW_COALESCE='coalesce'  # giữ tin mới nhất cho mỗi (event_type, symbol), thay tại chỗ
+OVERFLOW_POLICIES=(OVERFLOW_BLOCK,OVERFLOW_DROP_OLDEST,OVERFLOW_COALESCE)
+DEFAULT_QUEUE_SIZE=10000
+DRAIN_TIMEOUT_S=5.
+class ProcessorQueue:
+	"""Hàng đợi giới hạn + task tiêu thụ riêng cho 1 processor: sink chậm không chặn vòng đọc socket."""
+	def __init__(A,processor,maxsize:int=DEFAULT_QUEUE_SIZE,overflow:str=OVERFLOW_BLOCK,logger=_A):
+		if overflow not in OVERFLOW_POLICIES:raise ValueError(f"overflow must be one of {OVERFLOW_POLICIES}, got {overflow!r}")
+		A.processor=processor;A.name=processor.__class__.__name__;A.logger=logger or logging.getLogger(A.__class__.__name__);A.maxsize=max(1,int(maxsize));A.overflow=overflow
+		A._items=OrderedDict();A._seq=0;A._busy=_B;A._ready=asyncio.Event();A._space=asyncio.Event();A._idle=asyncio.Event();A._idle.set();A.task=_A
+		A.stats={'enqueued':0,'processed':0,'errors':0,'dropped':0,'coalesced':0,'blocked_s':.0,'max_depth':0,'lag_sum_s':.0,'lag_max_s':.0,'lag_last_s':.0}
+	def _key(A,data):
+		if A.overflow==OVERFLOW_COALESCE and data.get('symbol')is not _A:return data.get('event_type'),data.get('symbol')
+		A._seq+=1;return A._seq
+	async def put(A,data:Dict[str,Any])->_A:
+		items=A._items;st=A.stats;key=A._key(data)
+		if key in items:items[key]=items[key][0],data;st['coalesced']+=1;return  # giữ vị trí + thời điểm vào hàng của tin cũ
+		if len(items)>=A.maxsize:
+			if A.overflow==OVERFLOW_BLOCK:
+				t0=time.monotonic()
+				while len(items)>=A.maxsize:A._space.clear();await A._space.wait()
+				st['blocked_s']+=time.monotonic()-t0
+			else:items.popitem(last=_B);st['dropped']+=1
+		items[key]=time.monotonic(),data;st['enqueued']+=1;st['max_depth']=max(st['max_depth'],len(items));A._idle.clear();A._ready.set()
+	async def _consume(A):
+		items=A._items;st=A.stats
+		while True:
+			if not items:
+				A._ready.clear()
+				if not A._busy:A._idle.set()
+				await A._ready.wait();continue
+			_,(t_in,data)=items.popitem(last=_B);A._space.set();A._busy=True
+			lag=time.monotonic()-t_in;st['lag_sum_s']+=lag;st['lag_last_s']=lag;st['lag_max_s']=max(st['lag_max_s'],lag)
+			try:await A.processor.process(data)
+			except Exception as B:st['errors']+=1;A.logger.error(f"Error in processor {A.name}: {B}");A.logger.error(traceback.format_exc())
+			finally:A._busy=_B;st['processed']+=1
+	def start(A):
+		if A.task is _A or A.task.done():A.task=asyncio.create_task(A._consume())
+	async def stop(A,drain_timeout:float=DRAIN_TIMEOUT_S):
+		"""Xử lý nốt tin còn trong hàng (tối đa drain_timeout giây) rồi dừng task."""
+		if A.task is _A:return
+		if drain_timeout:  # _idle bị clear cả khi hàng rỗng nhưng processor còn đang xử lý tin cuối
+			try:await asyncio.wait_for(A._idle.wait(),drain_timeout)
+			except asyncio.TimeoutError:pass
+		A.task.cancel()
+		try:await A.task
+		except asyncio.CancelledError:pass
+		A.task=_A;A._space.set()
+	def metrics(A)->Dict[str,Any]:
+		st=A.stats;n=st['processed'];lag=time.monotonic()-next(iter(A._items.values()))[0]if A._items else .0
+		return{'processor':A.name,'overflow':A.overflow,'maxsize':A.maxsize,'depth':len(A._items),'oldest_lag_s':round(lag,4),'lag_avg_s':round(st['lag_sum_s']/n,4)if n else .0,**{k:round(v,4)if isinstance(v,float)else v for(k,v)in st.items()if k!='lag_sum_s'}}
 class BaseWebSocketClient(ABC):
-	def __init__(A,uri:str,ping_interval:int=25):A.uri=uri;A.ping_interval=ping_interval;A.websocket=_A;A.running=_B;A.processors=[];A.logger=logging.getLogger(A.__class__.__name__);A.ping_task=_A;A.message_handler_task=_A
-	def add_processor(A,processor):A.processors.append(processor)
+	def __init__(A,uri:str,ping_interval:int=25,queue_size:int=DEFAULT_QUEUE_SIZE,overflow:str=OVERFLOW_BLOCK):A.uri=uri;A.ping_interval=ping_interval;A.websocket=_A;A.running=_B;A.processors=[];A.logger=logging.getLogger(A.__class__.__name__);A.ping_task=_A;A.message_handler_task=_A;A.queue_size=queue_size;A.overflow=overflow;A.queues=[]
+	def add_processor(A,processor,queue_size:int=_A,overflow:str=_A):
+		"""Mỗi processor có hàng đợi + task riêng; queue_size/overflow mặc định theo client."""
+		B=ProcessorQueue(processor,A.queue_size if queue_size is _A else queue_size,overflow or A.overflow,A.logger);A.processors.append(processor);A.queues.append(B)
+		if A.running:B.start()
+	def queue_metrics(A)->List[Dict[str,Any]]:
+		"""Độ sâu hàng đợi, số tin bỏ/gộp, độ trễ (enqueue -> process) của từng processor."""
+		return[B.metrics()for B in A.queues]
+	async def _stop_queues(A,drain_timeout:float=DRAIN_TIMEOUT_S):
+		await asyncio.gather(*(B.stop(drain_timeout)for B in A.queues))
+	async def _close_processors(A):
+		"""Sau khi hàng đợi đã xả: gọi aclose()/close() của processor (flush buffer, đóng kết nối/file)."""
+		for B in A.processors:
+			C=getattr(B,'aclose',_A)or getattr(B,'close',_A)
+			if C is _A:continue
+			try:
+				D=C()
+				if asyncio.iscoroutine(D):await D
+			except Exception as E:A.logger.error(f"Error closing processor {B.__class__.__name__}: {E}");A.logger.error(traceback.format_exc())
 	async def _send_ping(A):
 		while A.running:
 			if A.websocket:
@@ -22,9 +94,7 @@ class BaseWebSocketClient(ABC):
 			try:
 				E=await A.websocket.recv();C=A._parse_message(E)
 				if C:
-					for D in A.processors:
-						try:await D.process(C)
-						except Exception as B:A.logger.error(f"Error in processor {D.__class__.__name__}: {B}");A.logger.error(traceback.format_exc())
+					for D in A.queues:await D.put(C)
 			except websockets.exceptions.ConnectionClosed as B:A.logger.warning(f"WebSocket connection closed: {B}");A._on_connection_closed();break
 			except Exception as B:A.logger.error(f"Error handling message: {B}");A.logger.error(traceback.format_exc())
 	def _on_connection_closed(A):0
@@ -36,12 +106,16 @@ class BaseWebSocketClient(ABC):
 	async def connect(A)->_A:
 		if A.running:A.logger.warning('Already connected or connection in progress');return
 		A.running=True
-		try:A.logger.info(f"Connecting to {A.uri}...");A.websocket=await websockets.connect(A.uri);A.logger.info(f"Connected to {A.uri}");await A._send_initial_messages();A.ping_task=asyncio.create_task(A._send_ping());A.message_handler_task=asyncio.create_task(A._handle_messages());A.message_handler_task.add_done_callback(A._on_message_handler_done);A.logger.info('Connection established and background tasks started')
+		try:
+			A.logger.info(f"Connecting to {A.uri}...");A.websocket=await websockets.connect(A.uri);A.logger.info(f"Connected to {A.uri}");await A._send_initial_messages()
+			for B in A.queues:B.start()
+			A.ping_task=asyncio.create_task(A._send_ping());A.message_handler_task=asyncio.create_task(A._handle_messages());A.message_handler_task.add_done_callback(A._on_message_handler_done);A.logger.info('Connection established and background tasks started')
 		except Exception as B:
 			A.logger.error(f"Connection error: {B}");A.logger.error(traceback.format_exc());A.running=_B
 			if A.websocket:await A.websocket.close()
 			A.websocket=_A;raise
-	async def disconnect(A)->_A:
+	async def disconnect(A,close_processors:bool=True)->_A:
+		"""Dừng task, xả hàng đợi, đóng processor (close_processors=False: reconnect, giữ processor dùng tiếp) rồi đóng socket."""
 		A.logger.info('Initiating disconnect...');A.running=_B
 		if A.ping_task and not A.ping_task.done():
 			A.ping_task.cancel()
@@ -53,6 +127,8 @@ class BaseWebSocketClient(ABC):
 			try:await A.message_handler_task
 			except asyncio.CancelledError:pass
 			A.message_handler_task=_A
+		await A._stop_queues()
+		if close_processors:await A._close_processors()
 		if A.websocket:
 			try:await A.websocket.close();A.logger.info('Connection closed')
 			except Exception as B:A.logger.error(f"Error closing connection: {B}");A.logger.error(traceback.format_exc())
@@ -9,7 +9,8 @@ _D='data_type'
 _C='unknown'
 _B=True
 _A=None
-import csv,json,logging,os,time,traceback,datetime
+import asyncio,csv,json,logging,os,threading,time,traceback,datetime
+from collections import deque
 from abc import ABC,abstractmethod
 from typing import Dict,Any,List,Tuple,Set,Optional
 from vnstock_pipeline.stream.utils.column_mappings import get_column_order
@@ -24,40 +25,117 @@ class ConsoleProcessor(DataProcessor):
 			if A.pretty_print:print(f"Received: {json.dumps(data,indent=2)}")
 			else:print(f"Received: {data}")
 		except Exception as B:A.logger.error(f"Error in ConsoleProcessor: {B}");A.logger.error(traceback.format_exc())
+CSV_ROTATE_DAY='day'
+CSV_ROTATE_SESSION='session'  # tách file sáng/chiều (mốc 12:00 giờ máy)
+_CSV_SESSION_SPLIT_HOUR=12
 class CSVProcessor(DataProcessor):
-	def __init__(A,filename_template:str='market_data_{event_type}_%Y-%m-%d.csv'):super().__init__();A.filename_template=filename_template;A.files={};A.fields={}
-	def _get_filename(B,data:Dict[str,Any])->str:C=data.get(_H,_C);A=B.filename_template.replace('{event_type}',C);A=datetime.datetime.now().strftime(A);return A
+	"""
+	Ghi message ra CSV theo lô: mỗi file 1 buffer trong RAM, xả khi đủ batch_size dòng hoặc dòng cũ nhất đã chờ
+	flush_interval giây (1 writerows + 1 flush/lô). Tên file chỉ tính lại khi qua mốc xoay (ngày, hoặc phiên nếu
+	rotate='session' - thêm '{session}' vào template hoặc tự gắn _am/_pm). Xuất hiện cột mới -> mở part mới
+	(name.p2.csv, ...) với header đầy đủ, không ghi lại file cũ. compress='gzip' -> .csv.gz (append nhiều member).
+	"""
+	def __init__(A,filename_template:str='market_data_{event_type}_%Y-%m-%d.csv',batch_size:int=1000,flush_interval:float=1.,rotate:str=CSV_ROTATE_DAY,compress:str=_A):
+		super().__init__()
+		if rotate not in(CSV_ROTATE_DAY,CSV_ROTATE_SESSION):raise ValueError(f"rotate must be 'day' or 'session', got {rotate!r}")
+		if compress not in(_A,'gzip'):raise ValueError(f"compress must be None or 'gzip', got {compress!r}")
+		B=filename_template
+		if rotate==CSV_ROTATE_SESSION and'{session}'not in B:C,D=os.path.splitext(B);B=f"{C}_{{session}}{D}"
+		A.filename_template=B;A.batch_size=max(1,int(batch_size));A.flush_interval=float(flush_interval);A.rotate=rotate;A.compress=compress
+		A.files={};A.fields={};A.parts={};A.buffers={};A.buffer_since={};A._names={};A._rotate_at=.0;A._timer=_A
+		A.stats={'rows':0,'flushes':0,'parts':0,'rotations':0}
+	def _next_boundary(A,now:datetime.datetime)->datetime.datetime:
+		B=now.replace(hour=0,minute=0,second=0,microsecond=0)+datetime.timedelta(days=1)
+		if A.rotate==CSV_ROTATE_SESSION and now.hour<_CSV_SESSION_SPLIT_HOUR:B=now.replace(hour=_CSV_SESSION_SPLIT_HOUR,minute=0,second=0,microsecond=0)
+		return B
+	def _get_filename(B,data:Dict[str,Any])->str:
+		C=data.get(_H,_C);A=B._names.get(C)
+		if A is _A:
+			D=datetime.datetime.now();A=B.filename_template.replace('{event_type}',C).replace('{session}','am'if D.hour<_CSV_SESSION_SPLIT_HOUR else'pm');A=D.strftime(A)
+			if B.compress and not A.endswith('.gz'):A+='.gz'
+			B._names[C]=A
+		return A
+	def _part_path(B,filename:str,part:int)->str:
+		if part<=1:return filename
+		A,C=(filename[:-3],'.gz')if filename.endswith('.gz')else(filename,'');D,E=os.path.splitext(A);return f"{D}.p{part}{E}{C}"
+	def _open(A,path:str,mode:str):
+		if path.endswith('.gz'):import gzip;return gzip.open(path,mode+'t',newline='',encoding='utf-8')
+		return open(path,mode,newline='',encoding='utf-8')
+	def _read_header(A,path:str)->List[str]:
+		try:
+			with A._open(path,'r')as B:return next(csv.reader(B),[])
+		except(OSError,EOFError,UnicodeDecodeError):return[]
+	def _ordered_fields(B,fields,event_type:str=_A)->List[str]:
+		C=set(fields);A=[A for A in(get_column_order(event_type)if event_type else[])if A in C];return A+sorted(C-set(A))
 	def _create_new_file(B,filename:str,fields:List[str],event_type:str=_A):
-		H=fields;D=event_type;A=filename
+		"""Mở part để ghi: part mới nhất nếu header đã chứa đủ cột, không thì part kế tiếp với header = cột cũ + cột mới."""
+		A=filename;E=set(fields)
 		try:
-			if D:E=get_column_order(D)
-			else:E=[]
-			C=[]
-			if E:
-				for I in E:
-					if I in H:C.append(I)
-			K=sorted(set(H)-set(C));C.extend(K);os.makedirs(os.path.dirname(A)or'.',exist_ok=_B);J=os.path.exists(A);L='a'if J else'w';F=open(A,L,newline='');G=csv.DictWriter(F,fieldnames=C)
-			if not J:G.writeheader();B.logger.info(f"Created new CSV {A}: {len(C)} fields (event_type={D})")
-			else:B.logger.info(f"Appending to existing CSV {A}")
-			B.files[A]=F,G;B.fields[A]=set(C);return F,G
-		except Exception as M:B.logger.error(f"Error creating CSV {A}: {M}");B.logger.error(traceback.format_exc());raise
+			os.makedirs(os.path.dirname(A)or'.',exist_ok=_B);C=B.parts.get(A)
+			if C is _A:
+				C=1
+				while os.path.exists(B._part_path(A,C+1)):C+=1
+			D=B._part_path(A,C);F=B._read_header(D)if os.path.exists(D)else[]
+			if F and E<=set(F):H=F;I=_E
+			else:
+				if F:C+=1;D=B._part_path(A,C);B.stats['parts']+=1
+				H=F+B._ordered_fields(E-set(F),event_type);I=_B
+			G=B._open(D,'a');J=csv.DictWriter(G,fieldnames=H,extrasaction='ignore')
+			if I:J.writeheader();B.logger.info(f"Created new CSV {D}: {len(H)} fields (event_type={event_type})")
+			else:B.logger.info(f"Appending to existing CSV {D}")
+			B.files[A]=G,J;B.fields[A]=H;B.parts[A]=C;return G,J
+		except Exception as K:B.logger.error(f"Error creating CSV {A}: {K}");B.logger.error(traceback.format_exc());raise
+	def _rotate(A):
+		A.flush();A._close_files();A._names.clear();A.parts.clear();A.stats['rotations']+=1
 	async def process(A,data:Dict[str,Any])->_A:
-		D=data
 		try:
-			B=A._get_filename(D);G=D.get(_H,_C);J={B:A for(B,A)in D.items()if A is not _A and A!=''};F=set(J.keys())
-			if B in A.files:
-				C,E=A.files[B];H=A.fields[B];I=F-H
-				if I:K=list(H.union(F));A.logger.info(f"Adding {len(I)} new fields to {B}");C.close();C,E=A._create_new_file(B,K,G);A.files[B]=C,E
-			else:C,E=A._create_new_file(B,list(F),G)
-			L={A:D.get(A,_A)for A in A.fields[B]};E.writerow(L);C.flush()
-		except Exception as M:A.logger.error(f"Error writing to CSV: {M}");A.logger.error(traceback.format_exc())
-	def close(A):
+			if time.time()>=A._rotate_at:
+				if A._rotate_at:A._rotate()
+				A._rotate_at=A._next_boundary(datetime.datetime.now()).timestamp()
+			B=A._get_filename(data);C=A.buffers.get(B)
+			if C is _A:C=A.buffers[B]=[];A.buffer_since[B]=time.monotonic()
+			C.append(data)
+			if len(C)>=A.batch_size:A.flush(B)
+			elif A._timer is _A or A._timer.done():A._timer=asyncio.create_task(A._flush_loop())
+		except Exception as D:A.logger.error(f"Error writing to CSV: {D}");A.logger.error(traceback.format_exc())
+	async def _flush_loop(A):
+		while A.buffers:
+			await asyncio.sleep(A.flush_interval/2);B=time.monotonic()
+			for C in[C for(C,D)in A.buffer_since.items()if B-D>=A.flush_interval]:A.flush(C)
+	def flush(A,filename:str=_A)->int:
+		"""Ghi buffer (1 file hoặc tất cả): 1 writerows + 1 flush mỗi file."""
+		F=0
+		for B in[filename]if filename else list(A.buffers):
+			C=A.buffers.pop(B,_A);A.buffer_since.pop(B,_A)
+			if not C:continue
+			try:
+				D=C[0].get(_H,_C);E={B for G in C for(B,H)in G.items()if H is not _A and H!=''}
+				if B not in A.files or not E<=set(A.fields[B]):
+					if B in A.files:A.logger.info(f"Adding {len(E-set(A.fields[B]))} new fields to {B}: starting new part");A.files.pop(B)[0].close()
+					A._create_new_file(B,list(E),D)
+				G,H=A.files[B];H.writerows(C);G.flush();F+=len(C);A.stats['rows']+=len(C);A.stats['flushes']+=1
+			except Exception as I:A.logger.error(f"Error writing {len(C)} rows to {B}: {I}");A.logger.error(traceback.format_exc())
+		return F
+	def _close_files(A):
 		for(B,(C,E))in A.files.items():
 			try:C.close();A.logger.debug(f"Closed file: {B}")
 			except Exception as D:A.logger.error(f"Error closing {B}: {D}")
+		A.files.clear()
+	def close(A):
+		if A._timer is not _A and not A._timer.done():A._timer.cancel()
+		A.flush();A._close_files()
+# Kiểu DuckDB -> kiểu Arrow khi ghi theo lô (cột JSON/kiểu lạ gửi dạng chuỗi, DuckDB tự cast)
+_DUCKDB_ARROW_TYPES={'BOOLEAN':'bool_','BIGINT':'int64','INTEGER':'int32','DOUBLE':'float64','VARCHAR':'string','TIMESTAMP':'timestamp_us','DATE':'date32'}
 class DuckDBProcessor(DataProcessor):
-	def __init__(A,db_path:str,table_prefix:str=_I):
-		B=db_path;super().__init__()
+	"""
+	Ghi message vào DuckDB, mỗi data_type 1 bảng (tự tạo/thêm cột).
+	batch_size=None: INSERT từng dòng như trước. batch_size=N: gom dòng theo bảng, xả khi đủ N dòng hoặc
+	dòng cũ nhất đã chờ flush_interval giây - schema cập nhật 1 lần/lô, append cả lô qua Arrow (không có
+	pyarrow thì executemany). Gọi close() (hoặc await aclose()) để xả phần còn lại.
+	"""
+	def __init__(A,db_path:str,table_prefix:str=_I,batch_size:int=_A,flush_interval:float=1.):
+		B=db_path;super().__init__();A.batch_size=int(batch_size)if batch_size else _A;A.flush_interval=float(flush_interval);A.buffers={};A.buffer_since={};A.column_types={};A._flush_lock=_A;A._timer=_A;A._write_lock=threading.Lock()
+		A.stats={'rows':0,'batches':0,'arrow_batches':0,'fallback_batches':0,'row_fallback_batches':0,'bad_rows':0,'flush_s':.0}
 		try:import duckdb as C;os.makedirs(os.path.dirname(B)or'.',exist_ok=_B);A.con=C.connect(B);A.table_prefix=table_prefix;A.tables={};A.logger.info(f"DuckDB initialized: {B}")
 		except ImportError:A.logger.error("DuckDB module not installed. Install with 'pip install duckdb'");raise
 		except Exception as D:A.logger.error(f"DuckDB initialization error: {D}");A.logger.error(traceback.format_exc());raise
@@ -101,6 +179,7 @@ class DuckDBProcessor(DataProcessor):
 		if isinstance(A,int)and(A>2147483647 or A<-2147483648):return str(A)
 		return A
 	async def process(A,data:Dict[str,Any])->_A:
+		if A.batch_size:return await A._buffer(data)
 		C=data
 		try:
 			B=A._get_table_name(C);A._ensure_table_exists(B,C)
@@ -109,9 +188,93 @@ class DuckDBProcessor(DataProcessor):
 			if not D:A.logger.warning(f"No valid columns to insert into {B}");return
 			E={B:A._sanitize_value(C)for(B,C)in D.items()};F=_F.join([f'"{A}"'for A in E.keys()]);G=_F.join(['?'for A in E.keys()]);H=list(E.values());I=f'INSERT INTO "{B}" ({F}) VALUES ({G})';A.con.execute(I,H);A.logger.debug(f"Inserted data into {B}")
 		except Exception as J:A.logger.error(f"Error inserting data into DuckDB: {J}");A.logger.error(traceback.format_exc())
+	async def _buffer(A,data:Dict[str,Any])->_A:
+		B=A._get_table_name(data);C=A.buffers.get(B)
+		if C is _A:C=A.buffers[B]=[];A.buffer_since[B]=time.monotonic()
+		C.append(data)
+		if A._timer is _A or A._timer.done():A._timer=asyncio.create_task(A._flush_loop())
+		if len(C)>=A.batch_size:await A.flush(B)
+	async def _flush_loop(A):
+		while A.buffers:
+			await asyncio.sleep(A.flush_interval/2);now=time.monotonic()
+			for B in[B for(B,C)in A.buffer_since.items()if now-C>=A.flush_interval]:await A.flush(B)
+	async def flush(A,table_name:str=_A)->int:
+		"""Xả buffer (1 bảng hoặc tất cả) trong executor - vòng sự kiện không chờ I/O DuckDB."""
+		if A._flush_lock is _A:A._flush_lock=asyncio.Lock()
+		D=0
+		async with A._flush_lock:
+			for B in[table_name]if table_name else list(A.buffers):
+				C=A.buffers.pop(B,_A);A.buffer_since.pop(B,_A)
+				if C:D+=await asyncio.get_running_loop().run_in_executor(_A,A._write_batch,B,C)
+		return D
+	def _ensure_columns(A,table_name:str,rows:List[Dict[str,Any]])->List[str]:
+		"""Cột của lô (thứ tự xuất hiện) + tạo bảng/ADD COLUMN 1 lần cho cả lô; kiểu suy từ giá trị khác None đầu tiên."""
+		B=table_name;C={}
+		for D in rows:
+			for(E,F)in D.items():
+				if C.get(E)is _A:C[E]=F
+		if B not in A.column_types:
+			try:A.column_types[B]={C[1]:str(C[2]).upper()for C in A.con.execute(f'PRAGMA table_info("{B}")').fetchall()}
+			except Exception:A.column_types[B]={}
+			if not A.column_types[B]:
+				G=[(E,A._infer_type(F))for(E,F)in C.items()];K=_F.join('"%s" %s'%C for C in G);A.con.execute(f'CREATE TABLE IF NOT EXISTS "{B}" ({K})');A.column_types[B]=dict(G);A.logger.info(f"Created table {B}")
+		H=A.column_types[B]
+		for(E,F)in C.items():
+			if E not in H:
+				I=A._infer_type(F)
+				try:A.con.execute(f'ALTER TABLE "{B}" ADD COLUMN "{E}" {I}');H[E]=I;A.logger.info(f"Added column {E} to {B}")
+				except Exception as J:A.logger.error(f"Failed to add column {E}: {J}")
+		A.tables[B]=set(H);return[E for E in C if E in H]
+	def _arrow_table(A,table_name:str,columns:List[str],rows:List[Dict[str,Any]]):
+		import pyarrow as pa
+		B=A.column_types[table_name];D=[]
+		for C in columns:
+			E=[F.get(C)for F in rows];G=B.get(C,'VARCHAR');H=_DUCKDB_ARROW_TYPES.get(G,'string')
+			if H=='string':E=[F if F is _A or isinstance(F,str)else json.dumps(F,default=str,separators=(',',':'))if isinstance(F,(list,dict))else str(F)for F in E]
+			elif H.startswith('int')and any(isinstance(F,float)for F in E):raise ValueError(f"float in integer column {C}")  # Arrow cắt cụt, DuckDB làm tròn -> để DuckDB cast
+			D.append(pa.array(E,type=pa.timestamp('us')if H=='timestamp_us'else getattr(pa,H)()))
+		return pa.Table.from_arrays(D,names=columns)
+	def _insert_rows(A,table_name:str,columns:List[str],rows:List[Dict[str,Any]])->int:
+		"""Lô lỗi -> INSERT từng dòng: giữ mọi dòng hợp lệ, chỉ log dòng không cast được."""
+		G=_F.join(f'"{C}"'for C in columns);H=_F.join('?'for C in columns);B=f'INSERT INTO "{table_name}" ({G}) VALUES ({H})';D=0
+		for C in rows:
+			try:A.con.execute(B,[A._sanitize_value(C.get(E))for E in columns]);D+=1
+			except Exception as F:A.stats['bad_rows']+=1;A.logger.error(f"Dropped row for {table_name}: {F} | {C}")
+		return D
+	def _write_batch(A,table_name:str,rows:List[Dict[str,Any]])->int:
+		with A._write_lock:  # 1 lần ghi / connection: flush trong executor và close() không chạy chồng
+			B=table_name;t0=time.perf_counter()
+			try:C=A._ensure_columns(B,rows)
+			except Exception as D:A.logger.error(f"Error ensuring table {B}: {D}");A.logger.error(traceback.format_exc());return 0
+			E=_F.join(f'"{F}"'for F in C)
+			try:G=A._arrow_table(B,C,rows)
+			except Exception as D:G=_A;A.logger.debug(f"Arrow batch for {B} failed ({D}), using executemany")
+			try:
+				A.con.begin()  # lô lỗi giữa chừng -> rollback, không ghi trùng khi thử lại từng dòng
+				if G is not _A:
+					A.con.register('__vnstock_batch',G)
+					try:A.con.execute(f'INSERT INTO "{B}" ({E}) SELECT {E} FROM __vnstock_batch')
+					finally:A.con.unregister('__vnstock_batch')
+					A.stats['arrow_batches']+=1
+				else:A.con.executemany(f'INSERT INTO "{B}" ({E}) VALUES ({_F.join("?"for F in C)})',[[A._sanitize_value(F.get(H))for H in C]for F in rows]);A.stats['fallback_batches']+=1
+				A.con.commit();H=len(rows)
+			except Exception as D:
+				try:A.con.rollback()
+				except Exception:pass
+				A.logger.warning(f"Batch insert into {B} failed ({len(rows)} rows): {D} - retrying row by row");A.stats['row_fallback_batches']+=1;H=A._insert_rows(B,C,rows)
+			A.stats['rows']+=H;A.stats['batches']+=1;A.stats['flush_s']+=time.perf_counter()-t0;A.logger.debug(f"Inserted {H} rows into {B}");return H
+	async def aclose(A):
+		if A._timer is not _A and not A._timer.done():A._timer.cancel()
+		await A.flush();A.close()
 	def close(A):
-		try:A.con.close();A.logger.info('DuckDB connection closed')
-		except Exception as B:A.logger.error(f"Error closing DuckDB connection: {B}")
+		"""Ghi nốt buffer rồi đóng; chờ lần flush đang chạy trong executor (nếu có) xong trước."""
+		if A._timer is not _A and not A._timer.done():A._timer.cancel()
+		for B in list(A.buffers):
+			C=A.buffers.pop(B,_A);A.buffer_since.pop(B,_A)
+			if C:A._write_batch(B,C)
+		with A._write_lock:
+			try:A.con.close();A.logger.info('DuckDB connection closed')
+			except Exception as B:A.logger.error(f"Error closing DuckDB connection: {B}")
 class FilteredProcessor(DataProcessor):
 	def __init__(A,wrapped_processor:DataProcessor,allowed_data_types:List[str]):B=allowed_data_types;super().__init__();A.wrapped_processor=wrapped_processor;A.allowed_data_types=set(B);A.logger.info(f"Created filtered processor for data types: {_F.join(B)}")
 	async def process(A,data:Dict[str,Any])->_A:
@@ -142,9 +305,20 @@ class FirebaseProcessor(DataProcessor):
 		B=data
 		try:C=A._get_collection_name(B);D=A._get_document_id(B);A.db.collection(C).document(D).set(B);A.logger.debug(f"Data saved to Firestore: {C}/{D}")
 		except Exception as E:A.logger.error(f"Error saving to Firestore: {E}");A.logger.error(traceback.format_exc())
+FORWARD_MAX_BUFFER=10000  # tin chờ gửi tối đa (vượt -> bỏ tin cũ nhất)
+FORWARD_MAX_BACKOFF_S=30.
 class ForwardingProcessor(DataProcessor):
-	def __init__(A,forward_url:str,forward_type:str=_G,timeout:int=5):
+	"""
+	Chuyển tiếp message qua webhook (POST JSON), socket TCP (JSON lines) hoặc callback.
+	Giữ 1 ClientSession / 1 kết nối TCP suốt vòng đời, tự nối lại khi lỗi. batch_size>1: gom tin, xả khi đủ
+	batch_size hoặc sau flush_interval giây - webhook POST 1 mảng JSON, socket ghi N dòng 1 lần.
+	Tin gửi lỗi nằm lại buffer (tối đa max_buffer, bỏ tin cũ nhất) và gửi lại với backoff tăng dần.
+	"""
+	def __init__(A,forward_url:str,forward_type:str=_G,timeout:int=5,batch_size:int=1,flush_interval:float=.2,max_buffer:int=FORWARD_MAX_BUFFER):
 		C=forward_url;B=forward_type;super().__init__();A.forward_url=C;A.forward_type=B.lower();A.timeout=timeout;A.callback=_A;A.session=_A
+		A.batch_size=max(1,int(batch_size));A.flush_interval=float(flush_interval);A.max_buffer=max(A.batch_size,int(max_buffer))
+		A.pending=deque();A._reader=A._writer=_A;A._timer=_A;A._lock=_A;A._failures=0;A._retry_at=.0
+		A.stats={'sent':0,'requests':0,'failed_requests':0,'dropped':0,'connects':0}
 		if A.forward_type==_G:
 			try:import aiohttp as D
 			except ImportError:A.logger.warning("aiohttp not installed. Install with 'pip install aiohttp' for webhook support")
@@ -155,27 +329,69 @@ class ForwardingProcessor(DataProcessor):
 		try:import socket as B;A.socket_module=B;A.socket=_A
 		except Exception as C:A.logger.error(f"Socket initialization error: {C}")
 	def set_callback(A,callback):A.callback=callback;A.logger.info('Custom callback set for data forwarding')
-	async def _forward_webhook(A,data:Dict[str,Any])->bool:
+	async def _get_session(A):
+		import aiohttp as B
+		if A.session is _A or A.session.closed:A.session=B.ClientSession(timeout=B.ClientTimeout(total=A.timeout),connector=B.TCPConnector(limit=4,keepalive_timeout=60));A.stats['connects']+=1
+		return A.session
+	async def _forward_webhook(A,data)->bool:
+		"""data: 1 message (dict) hoặc 1 lô (list -> POST mảng JSON)."""
 		try:
-			import aiohttp as C
-			async with C.ClientSession()as D:
-				async with D.post(A.forward_url,json=data,timeout=C.ClientTimeout(total=A.timeout))as B:
-					if B.status==200:A.logger.debug(f"Webhook forward successful: {B.status}");return _B
-					else:A.logger.warning(f"Webhook returned {B.status}: {await B.text()}");return _E
+			C=await A._get_session()
+			async with C.post(A.forward_url,json=data)as B:
+				if 200<=B.status<300:A.logger.debug(f"Webhook forward successful: {B.status}");return _B
+				else:A.logger.warning(f"Webhook returned {B.status}: {await B.text()}");return _E
 		except Exception as E:A.logger.error(f"Webhook forward error: {E}");return _E
-	async def _forward_socket(A,data:Dict[str,Any])->bool:
-		try:import json,asyncio as D;E,B=A.forward_url.split(':');B=int(B);H,C=await D.wait_for(D.open_connection(E,B),timeout=A.timeout);F=(json.dumps(data)+'\n').encode();C.write(F);await C.drain();C.close();A.logger.debug(f"Socket forward successful: {E}:{B}");return _B
-		except Exception as G:A.logger.error(f"Socket forward error: {G}");return _E
+	async def _connect_socket(A):
+		if A._writer is not _A and not A._writer.is_closing():return A._writer
+		B,C=A.forward_url.rsplit(':',1);A._reader,A._writer=await asyncio.wait_for(asyncio.open_connection(B,int(C)),timeout=A.timeout);A.stats['connects']+=1;A.logger.debug(f"Socket connected: {A.forward_url}");return A._writer
+	async def _close_socket(A):
+		B=A._writer;A._reader=A._writer=_A
+		if B is not _A:
+			B.close()
+			try:await B.wait_closed()
+			except Exception:pass
+	async def _forward_socket(A,data)->bool:
+		"""data: 1 message hoặc 1 lô - mỗi message 1 dòng JSON, cả lô 1 lần write."""
+		try:B=await A._connect_socket();C=data if isinstance(data,list)else[data];B.write(''.join(json.dumps(D,default=str)+'\n'for D in C).encode());await asyncio.wait_for(B.drain(),timeout=A.timeout);A.logger.debug(f"Socket forward successful: {A.forward_url} ({len(C)} msg)");return _B
+		except Exception as G:A.logger.error(f"Socket forward error: {G}");await A._close_socket();return _E
 	async def _forward_callback(A,data:Dict[str,Any])->bool:
 		try:
 			if A.callback is _A:A.logger.warning('No callback set');return _E
 			B=await A.callback(data);A.logger.debug(f"Callback forward result: {B}");return bool(B)
 		except Exception as C:A.logger.error(f"Callback forward error: {C}");return _E
+	async def _send(A,batch:List[Dict[str,Any]])->bool:
+		if A.forward_type==_G:return await A._forward_webhook(batch if A.batch_size>1 else batch[0])
+		if A.forward_type==_J:return await A._forward_socket(batch)
+		for B in batch:  # callback: giữ API 1 message / lần gọi
+			if not await A._forward_callback(B):return _E
+		return _B
+	async def flush(A,force:bool=_E)->int:
+		"""Gửi tin đang chờ theo lô; lỗi -> trả lô về đầu buffer, chờ backoff rồi thử lại (force=True: bỏ qua backoff)."""
+		if A._lock is _A:A._lock=asyncio.Lock()
+		D=0
+		async with A._lock:
+			while A.pending and(force or time.monotonic()>=A._retry_at):
+				B=[A.pending.popleft()for C in range(min(A.batch_size,len(A.pending)))];A.stats['requests']+=1
+				if await A._send(B):A.stats['sent']+=len(B);D+=len(B);A._failures=0;continue
+				A.stats['failed_requests']+=1;A.pending.extendleft(reversed(B));A._failures+=1;A._retry_at=time.monotonic()+min(FORWARD_MAX_BACKOFF_S,.5*2**(A._failures-1))
+				if force:break
+		return D
+	async def _flush_loop(A):
+		while A.pending:
+			await asyncio.sleep(max(A.flush_interval,A._retry_at-time.monotonic(),.01));await A.flush()
 	async def process(A,data:Dict[str,Any])->_A:
 		B=data
 		try:
-			if A.forward_type==_G:await A._forward_webhook(B)
-			elif A.forward_type==_J:await A._forward_socket(B)
-			elif A.forward_type==_K:await A._forward_callback(B)
-			else:A.logger.warning(f"Unknown forward type: {A.forward_type}")
-		except Exception as C:A.logger.error(f"Error in ForwardingProcessor: {C}");A.logger.error(traceback.format_exc())
\ No newline at end of file
+			if A.forward_type not in(_G,_J,_K):A.logger.warning(f"Unknown forward type: {A.forward_type}");return
+			A.pending.append(B)
+			if len(A.pending)>A.max_buffer:A.pending.popleft();A.stats['dropped']+=1
+			if len(A.pending)>=A.batch_size and time.monotonic()>=A._retry_at:await A.flush()
+			if A.pending and(A._timer is _A or A._timer.done()):A._timer=asyncio.create_task(A._flush_loop())
+		except Exception as C:A.logger.error(f"Error in ForwardingProcessor: {C}");A.logger.error(traceback.format_exc())
+	async def aclose(A):
+		"""Gửi nốt buffer (1 lượt) rồi đóng session/socket."""
+		if A._timer is not _A and not A._timer.done():A._timer.cancel()
+		await A.flush(force=_B)
+		if A.pending:A.logger.warning(f"ForwardingProcessor closed with {len(A.pending)} undelivered messages")
+		if A.session is not _A and not A.session.closed:await A.session.close()
+		await A._close_socket()
\ No newline at end of file
@@ -64,7 +64,7 @@ _B='data'
 _A=None
 import json,time,logging,traceback,asyncio
 from typing import Dict,Any,List,Optional,Set
-from vnstock_pipeline.stream.client import BaseWebSocketClient
+from vnstock_pipeline.stream.client import BaseWebSocketClient,DEFAULT_QUEUE_SIZE,OVERFLOW_BLOCK
 from vnstock_pipeline.stream.parsers import FinancialDataParser
 from vnstock_pipeline.stream.utils.session_manager import SessionManager
 class WSSDataParser(FinancialDataParser):
@@ -163,7 +163,7 @@ class WSSDataParser(FinancialDataParser):
 		try:return convert_func(A)
 		except(ValueError,TypeError):return A
 class WSSClient(BaseWebSocketClient):
-	def __init__(A,uri:str='wss://bgdatafeed.vps.com.vn/socket.io/?EIO=3&transport=websocket',ping_interval:int=25,market:str='HOSE',enable_session_manager:bool=True,session_check_interval:int=60):super().__init__(uri,ping_interval);A.raw_messages=[];A.data_parser=WSSDataParser();A.last_data_timestamp=_A;A.message_count=0;(A.received_symbols):Set[str]=set();A.market=market;A.enable_session_manager=enable_session_manager;A.session_manager=_A;A.session_check_interval=session_check_interval;A.data_freeze_check_task=_A;A.data_freeze_threshold=120
+	def __init__(A,uri:str='wss://bgdatafeed.vps.com.vn/socket.io/?EIO=3&transport=websocket',ping_interval:int=25,market:str='HOSE',enable_session_manager:bool=True,session_check_interval:int=60,queue_size:int=DEFAULT_QUEUE_SIZE,overflow:str=OVERFLOW_BLOCK):super().__init__(uri,ping_interval,queue_size,overflow);A.raw_messages=[];A.data_parser=WSSDataParser();A.last_data_timestamp=_A;A.message_count=0;(A.received_symbols):Set[str]=set();A.market=market;A.enable_session_manager=enable_session_manager;A.session_manager=_A;A.session_check_interval=session_check_interval;A.data_freeze_check_task=_A;A.data_freeze_threshold=120
 	def add_raw_message(A,raw_message:str)->_A:A.raw_messages.append(raw_message)
 	def clear_raw_messages(A)->_A:A.raw_messages=[]
 	def subscribe_symbols(A,symbols:List[str])->_A:B=','.join(symbols);C=rf'42["regs","{{\"action\":\"join\",\"list\":\"{B}\"}}"]';A.add_raw_message(C);A.logger.info(f"Added subscription for symbols: {B}")
@@ -194,7 +194,7 @@ class WSSClient(BaseWebSocketClient):
 			try:await A.data_freeze_check_task
 			except asyncio.CancelledError:pass
 			A.data_freeze_check_task=_A
-		await super().disconnect()
+		await super().disconnect(close_processors=False)  # reconnect theo phiên: processor còn dùng tiếp
 	async def _send_initial_messages(A)->_A:
 		if not A.raw_messages:A.logger.warning('No raw messages configured. You may not receive any data.');return
 		for B in A.raw_messages: